@@ -1,9 +1,97 @@
 # /config/apps/heatpump_bridge.py
 import appdaemon.plugins.hass.hassapi as hass
 import paho.mqtt.client as mqtt
-import socket, struct, time, json, threading, re
-import requests
-from datetime import datetime
+import time, json, os
+from functools import partial
+
+import hp_registers as regs
+from hp_publish import ChangeFilter, AvailabilityWatchdog, StatePublisher
+from hp_commands import CloudCommands
+from hp_capture import CaptureWriter
+from hp_core import IOCore
+from hp_discovery import DiscoverySync
+from hp_write import LocalWriter, ACK_CMD, PARAMS
+from hp_confirm import WriteTracker
+from hp_metrics import PumpMetrics, Exposition, MetricsServer, frame_metrics
+from hp_profile import ProfileSession, PROFILE_TOPIC
+from hp_derived import DerivedPower
+from hp_rollup import Rollup, rolled_sids, doc_topic
+from hp_history import SeriesRing, ring_bytes
+from hp_sqlite import SQLiteSink
+
+BRIDGE_AVAIL_TOPIC = "heatpump/bridge/availability"   # LWT when several pumps share the connection
+
+
+class PumpDevice:
+    """Per-pump session: adapter address, topic namespace, change filter and availability.
+
+    With a single legacy device the historical topics are kept
+    (heatpump/set/parN, heatpump/state/parN); pumps listed under `devices`
+    are namespaced as heatpump/<device_id>/set|state/parN.
+    """
+
+    def __init__(self, cfg, defaults, publish, deadbands, heartbeat, state_mode,
+                 availability_timeout, namespaced, discovery_prefix="homeassistant",
+                 confirm_timeout=120.0, log=None):
+        get = lambda key, default=None: cfg.get(key, defaults.get(key, default))
+        log = log or (lambda msg, level="INFO": None)
+        self.device_id    = get("device_id", "heatpump_001")
+        self.device_name  = get("device_name", "Heat Pump")
+        self.manufacturer = get("manufacturer", "Unknown")
+        self.model        = get("model", "Unknown")
+        self.ip           = get("heatpump_ip")
+        self.port         = int(get("heatpump_port", 8899))
+        self.mn           = get("mn")
+        self.devid        = get("devid")
+        self.target       = (self.mn, self.devid)
+
+        # ---- Topics ----
+        self.topic_prefix = f"heatpump/{self.device_id}" if namespaced else "heatpump"
+        self.node = f"{self.device_id}/" if namespaced else ""      # discovery node_id for controls
+        self.base_sensor_prefix = f"{discovery_prefix}/sensor/{self.device_id}"
+        self.avail_topic = f"{self.base_sensor_prefix}/availability"
+        # Entities need the pump online and, when the LWT is shared, the bridge too
+        self.availability = [BRIDGE_AVAIL_TOPIC, self.avail_topic] if namespaced else self.avail_topic
+
+        self.changes = ChangeFilter(deadbands, heartbeat=heartbeat)
+        self.publisher = StatePublisher(publish, self.base_sensor_prefix, self.changes, mode=state_mode)
+        # Electrical/thermal power and COP; thermal needs the water flow of this pump
+        self.derived = DerivedPower(self.publisher.value, flow_lpm=get("flow_lpm"),
+                                    power_factor=float(get("power_factor", 1.0)),
+                                    window=int(get("derived_window", 10)),
+                                    interval=float(get("derived_interval", 30)),
+                                    min_power_w=float(get("cop_min_power_w", 50)))
+        # Optional rollups: configured sensors publish window min/max/mean instead of every frame
+        self.rollup = None
+        sids = rolled_sids(get("rollup"))
+        if sids and state_mode != "fields":
+            log(f"{self.device_id}: rollup needs state_mode: fields, publishing raw values", "WARNING")
+        elif sids:
+            self.rollup = Rollup(sids, get("rollup_windows", [60]),
+                                 lambda window, doc: publish(doc_topic(self.base_sensor_prefix, window), doc),
+                                 self.publisher.value)
+            self.publisher.skip = frozenset(sids)
+        self.watchdog = AvailabilityWatchdog(
+            lambda state: publish(self.avail_topic, state, retain=True), timeout=availability_timeout)
+        # Commands are confirmed (or their echo rolled back) from the next 01B3 frames
+        self.writes = WriteTracker(
+            lambda par, payload: publish(f"{self.topic_prefix}/state/{par}", payload, retain=True),
+            timeout=confirm_timeout, log=log)
+        self._write_stats = None
+        self.metrics = PumpMetrics(self.device_id)
+        self.history = None   # hp_history.SeriesRing when history_hours is set
+        self.capture = None
+        self.conn = None      # hp_core.Connection, set once the I/O core is configured
+
+    def device_info(self):
+        return {
+            "identifiers": [self.device_id],
+            "name": self.device_name,
+            "manufacturer": self.manufacturer,
+            "model": self.model,
+            "sw_version": "1.0",
+        }
+
 
 class HeatpumpBridge(hass.Hass):
     #
@@ -16,16 +104,7 @@ class HeatpumpBridge(hass.Hass):
         self.mqtt_user   = self.args.get("mqtt_user", "")
         self.mqtt_pass   = self.args.get("mqtt_pass", "")
 
-        self.device_id   = self.args.get("device_id", "heatpump_001")
-        self.device_name = self.args.get("device_name", "Heat Pump")
-        self.manufacturer= self.args.get("manufacturer", "Unknown")
-        self.model       = self.args.get("model", "Unknown")
-
-        self.hp_ip       = self.args.get("heatpump_ip")
-        self.hp_port     = int(self.args.get("heatpump_port"))
         self.cookie_raw  = self.args.get("cookie_raw", "")
-        self.mn          = self.args.get("mn")
-        self.devid       = self.args.get("devid")
         self.cloud_url   = self.args.get("cloud_url", "https://www.myheatpump.com/a/amt/setdata/update")
 
         # Logging level
@@ -35,24 +114,67 @@ class HeatpumpBridge(hass.Hass):
         self.info_enabled  = self.log_level in ("INFO", "DEBUG", "TRACE")
 
         self.log("HeatpumpBridge starting...", level="INFO")
-        # ---- Topics ----
         self.discovery_prefix = "homeassistant"
-        self.base_sensor_prefix = f"{self.discovery_prefix}/sensor/{self.device_id}"
-        self.avail_topic = f"{self.base_sensor_prefix}/availability"
+        self.published = 0
+        self.publish_errors = 0
+
+        # ---- Pumps: `devices` list, or the top-level keys for a single pump ----
+        # Change detection: unchanged values are only re-sent every `heartbeat` seconds
+        deadbands = regs.deadbands()
+        deadbands.update(self.args.get("deadbands") or {})
+        device_cfgs = self.args.get("devices")
+        self.namespaced = bool(device_cfgs)
+        self.pumps = [
+            PumpDevice(cfg, self.args, self._pub, deadbands,
+                       heartbeat=float(self.args.get("heartbeat", 300)),
+                       state_mode=str(self.args.get("state_mode", "fields")).lower(),
+                       availability_timeout=float(self.args.get("availability_timeout", 120)),
+                       namespaced=self.namespaced, discovery_prefix=self.discovery_prefix,
+                       confirm_timeout=float(self.args.get("write_confirm_timeout", 120)),
+                       log=lambda msg, level: self.log(msg, level=level))
+            for cfg in (device_cfgs or [{}])
+        ]
+        self.pumps_by_id = {dev.device_id: dev for dev in self.pumps}
+        self.pumps_by_target = {dev.target: dev for dev in self.pumps}
+        if len(self.pumps_by_id) != len(self.pumps):
+            self.log("Duplicate device_id in devices", level="ERROR")
+        if len(self.pumps_by_target) != len(self.pumps):
+            self.log("Several devices share the same mn/devid; cloud echoes go to the last one", level="WARNING")
 
         # ---- Cookies ----
         self.cookies = self._parse_cookie(self.cookie_raw)
 
-        # ---- MQTT ----
-        self.mqttc = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=f"{self.device_id}_bridge")
+        # ---- Cloud commands (one worker pool and HTTP session for every pump) ----
+        first = self.pumps[0]
+        self.commands = CloudCommands(self.cloud_url, first.mn, first.devid, self.cookies,
+                                      on_result=self._on_command_result,
+                                      log=lambda msg, level: self.log(msg, level=level),
+                                      workers=int(self.args.get("command_workers", 2)),
+                                      maxsize=int(self.args.get("command_queue_size", 32)),
+                                      debounce=float(self.args.get("command_debounce", 0.5)),
+                                      max_delay=self.args.get("command_max_delay"),
+                                      batch=bool(self.args.get("cloud_batch", False)))
+
+        # ---- MQTT (one connection for every pump) ----
+        self.mqttc = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2,
+                                 client_id=f"{self.args.get('client_id', first.device_id)}_bridge")
         if self.mqtt_user:
             self.mqttc.username_pw_set(self.mqtt_user, self.mqtt_pass)
 
-        self.mqttc.will_set(self.avail_topic, "offline", retain=True)
+        self.mqttc.will_set(BRIDGE_AVAIL_TOPIC if self.namespaced else first.avail_topic, "offline", retain=True)
         self.mqttc.on_connect = self._on_mqtt_connect
         self.mqttc.on_message = self._on_mqtt_message
         self.mqttc.enable_logger(logger=None)  # prevent paho from spamming HA logs
 
+        # ---- Discovery: built once, synced against the broker's retained copies on connect ----
+        configs = []
+        for dev in self.pumps:
+            configs += self._discovery_controls(dev)
+            configs += self._discovery_sensors(dev)
+        self.discovery = DiscoverySync(self.mqttc, configs,
+                                       wait=float(self.args.get("discovery_wait", 1.0)),
+                                       log=lambda msg, level: self.log(msg, level=level))
+
         # Connect & loop in background
         try:
             self.mqttc.connect(self.mqtt_broker, self.mqtt_port, keepalive=60)
@@ -61,57 +183,96 @@ class HeatpumpBridge(hass.Hass):
         except Exception as e:
             self.log(f"MQTT connect error: {e}", level="ERROR")
 
-        # Publish discovery now (retain)
-        self._publish_discovery_controls()
-        self._publish_discovery_sensors()
-        self._pub(self.avail_topic, "online", retain=True)
-        if self.info_enabled:
-            self.log("Published MQTT discovery (controls)")
-            self.log("Published MQTT discovery (sensors)")
-
-        # ---- Packet decode offsets (same as your working script) ----
-        self.OFF = {
-            # Temperatures
-            'outdoor_temp': 10, 'dhw_temp': 14, 'cooling_water_temp': 18,
-            'outlet_temp': 22,  'inlet_temp': 26, 'room_temp': 54,
-            'outdoor_ambient_2': 254, 'outdoor_coil_temp': 258,
-            'gas_discharge_temp': 262, 'gas_suction_temp': 266,
-            # Electrical
-            'voltage': 214, 'current': 218, 'compressor_freq_limit': 222, 'compressor_freq': 226,
-            # Pressure
-            'low_pressure': 278, 'high_pressure': 282,
-            # Status (0143)
-            'outdoor_unit_mode': 186, 'dhw_state': 174, 'heating_state': 178,
-            'cooling_state': 182, 'defrost_state': 286,
-            # Set temps (01B3)
-            'dhw_set_temp': 166, 'heating_set_temp': 246, 'cooling_set_temp': 378,
-            # 01B3
-            'unit_on_off': 2, 'working_mode': 6, 'delta_t_compressor_speed': 18,
-            'low_noise_mode': 66, 'heating_delta_t': 250, 'heating_curve_enabled': 330,
-            'heating_curve_ambient_temp_1': 338, 'heating_curve_water_temp_1': 342,
-            'heating_curve_ambient_temp_2': 346, 'heating_curve_water_temp_2': 350,
-            'heating_curve_ambient_temp_3': 354, 'heating_curve_water_temp_3': 358,
-            'heating_curve_ambient_temp_4': 362, 'heating_curve_water_temp_4': 366,
-            'dhw_delta_t': 170, 'cooling_delta_t': 382,
-            'dhw_priority_min_time': 190, 'priority_ambient_start_temp': 306,
-            'priority_heating_delta_t': 314, 'priority_heating_working_time': 318,
-        }
-
-        # ---- Start TCP reader thread ----
-        self._stop_event = threading.Event()
-        self.sock_thread = threading.Thread(target=self._socket_loop, name="hp_socket", daemon=True)
-        self.sock_thread.start()
+        for dev in self.pumps:
+            dev.watchdog.force("offline")   # until the first frame arrives
+
+        # ---- Optional raw frame recorder (one sub-directory per pump when namespaced) ----
+        if self.args.get("capture_dir"):
+            for dev in self.pumps:
+                directory = self.args["capture_dir"]
+                if self.namespaced:
+                    directory = os.path.join(directory, dev.device_id)
+                dev.capture = CaptureWriter(directory,
+                                            segment_bytes=int(self.args.get("capture_segment_mb", 64)) * 1024 * 1024,
+                                            keep_segments=self.args.get("capture_keep_segments"))
+            self.log(f"Recording raw frames to {self.args['capture_dir']}", level="INFO")
+
+        # ---- Optional in-memory history of the 0143 sensors (fixed size, see hp_history.py) ----
+        hours = float(self.args.get("history_hours", 0))
+        if hours > 0:
+            rows = max(1, int(hours * 3600 / float(self.args.get("history_frame_s", 1))))
+            for dev in self.pumps:
+                dev.history = SeriesRing(rows)
+            self.log(f"History: {rows} rows per pump, {ring_bytes(rows) / 1e6:.1f} MB each", level="INFO")
+
+        # ---- Optional SQLite history (writer thread, the socket loop only queues) ----
+        self.sqlite = None
+        if self.args.get("sqlite_path"):
+            try:
+                self.sqlite = SQLiteSink(self.args["sqlite_path"],
+                                         commit_interval=float(self.args.get("sqlite_commit_interval", 5)),
+                                         maxsize=int(self.args.get("sqlite_queue_size", 20000)),
+                                         keep_days=self.args.get("sqlite_keep_days"),
+                                         log=lambda msg, level: self.log(msg, level=level))
+                self.log(f"Recording decoded frames to {self.args['sqlite_path']}", level="INFO")
+            except Exception as e:
+                self.log(f"SQLite sink error: {e}", level="ERROR")
+
+        # ---- I/O core: every adapter socket and timer on one asyncio loop (own thread) ----
+        self.core = IOCore(log=lambda msg, level: self.log(msg, level=level))
+        for dev in self.pumps:
+            dev.conn = self.core.connect(dev.ip, dev.port, partial(self._on_frame, dev),
+                                         on_state=partial(self._on_socket_state, dev))
+        self.core.every(10, self._watchdog_tick)
+
+        # ---- Optional local writes on the adapter socket (assumed protocol, see hp_write.py) ----
+        self.local = None
+        if self.args.get("local_writes", False):
+            self.local = LocalWriter(self.core, self._on_local_result,
+                                     ack_timeout=float(self.args.get("local_write_ack_timeout", 2.0)),
+                                     log=lambda msg, level: self.log(msg, level=level))
+            self.log("Local writes enabled (cloud fallback)", level="INFO")
+        self.core.start()
+
+        # ---- Profiling windows on request (heatpump/debug/profile, see hp_profile.py) ----
+        self.profiler = ProfileSession(self.core, self._profile_targets, self._pub,
+                                       out_dir=self.args.get("profile_dir"),
+                                       log=lambda msg, level: self.log(msg, level=level))
+
+        # ---- Optional local HTTP endpoint: GET /metrics (Prometheus), /history (JSON) ----
+        self.metrics_server = None
+        if self.args.get("metrics_port"):
+            try:
+                self.metrics_server = MetricsServer(self._render_metrics,
+                                                    host=self.args.get("metrics_host", "0.0.0.0"),
+                                                    port=int(self.args["metrics_port"]),
+                                                    log=lambda msg, level: self.log(msg, level=level))
+                if hours > 0:
+                    self.metrics_server.route("/history", self._http_history)
+                self.metrics_server.start()
+                self.log(f"Metrics on http://{self.metrics_server.host}:{self.metrics_server.port}/metrics",
+                         level="INFO")
+            except Exception as e:
+                self.log(f"Metrics endpoint error: {e}", level="ERROR")
 
         self.log("HeatpumpBridge launched", level="INFO")
 
     def terminate(self):
         # Graceful shutdown
         try:
-            self._stop_event.set()
+            self.core.stop()
+        except Exception:
+            pass
+        try:
+            if self.metrics_server:
+                self.metrics_server.stop()
         except Exception:
             pass
         try:
-            self._pub(self.avail_topic, "offline", retain=True)
+            for dev in self.pumps:
+                dev.watchdog.force("offline")
+            if self.namespaced:
+                self._pub(BRIDGE_AVAIL_TOPIC, "offline", retain=True)
         except Exception:
             pass
         try:
@@ -119,6 +280,21 @@ class HeatpumpBridge(hass.Hass):
             self.mqttc.disconnect()
         except Exception:
             pass
+        try:
+            self.commands.stop()
+        except Exception:
+            pass
+        try:
+            for dev in self.pumps:
+                if dev.capture:
+                    dev.capture.close()
+        except Exception:
+            pass
+        try:
+            if self.sqlite:
+                self.sqlite.close()
+        except Exception:
+            pass
         self.log("HeatpumpBridge terminated", level="INFO")
 
     #
@@ -127,95 +303,220 @@ class HeatpumpBridge(hass.Hass):
     def _on_mqtt_connect(self, client, userdata, flags, reason_code, properties):
         if self.info_enabled:
             self.log(f"MQTT on_connect rc={reason_code}")
-        client.subscribe("heatpump/set/#")
+        client.subscribe("heatpump/+/set/#" if self.namespaced else "heatpump/set/#")
+        client.subscribe(PROFILE_TOPIC)
+        if self.namespaced:
+            client.publish(BRIDGE_AVAIL_TOPIC, "online", retain=True)
+        # Broker may have restarted (or fired our LWT): send everything again
+        for dev in self.pumps:
+            dev.changes.reset()
+            dev.watchdog.republish()
+        # Retained discovery is only re-sent where the broker's copy is missing or stale
+        self.discovery.start()
+
+    def _watchdog_tick(self):
+        for dev in self.pumps:
+            dev.watchdog.tick()
+            dev.writes.tick()
+            self._publish_write_stats(dev)
+            if dev.rollup:
+                dev.rollup.roll()
+
+    def _publish_write_stats(self, dev):
+        # Command-to-apply latency histogram, re-published when something was confirmed/rolled back
+        key = (dev.writes.confirmed, dev.writes.rolled_back)
+        if key != dev._write_stats:
+            dev._write_stats = key
+            self._pub(f"{dev.topic_prefix}/stats/write_latency", json.dumps(dev.writes.stats()), retain=True)
 
     def _on_mqtt_message(self, client, userdata, msg):
         try:
             topic = msg.topic
             payload = msg.payload.decode().strip()
-            if not topic.startswith("heatpump/set/"):
+            if topic == PROFILE_TOPIC:
+                self.profiler.request(payload)
                 return
-            par = topic.split("/")[-1]
+            parts = topic.split("/")
+            if self.namespaced:
+                if len(parts) != 4 or parts[0] != "heatpump" or parts[2] != "set":
+                    return
+                dev = self.pumps_by_id.get(parts[1])
+                if dev is None:
+                    return
+            else:
+                if not topic.startswith("heatpump/set/"):
+                    return
+                dev = self.pumps[0]
+            par = parts[-1]
             # Normalize expected values for select "mode"
             if par == "par2" and payload in ("Heating", "DHW", "Cooling"):
                 payload = {"Cooling": "0", "DHW": "1", "Heating": "2"}[payload]
 
-            self.log(f"CMD {par}={payload}", level="INFO")
-
-            data = {"id": "", "mn": self.mn, "devid": self.devid,
-                    par: payload, "fieldName": par, "fieldValue": payload}
-
-            r = requests.post(self.cloud_url, data=data, cookies=self.cookies, timeout=10)
-            res = r.json() if r.headers.get("content-type","").startswith("application/json") else {}
-            if str(res.get("result")).lower() == "true":
-                self.log(f"Cloud OK: {par}={payload}", level="INFO")
-                # publish state echo (so HA UI reflects immediately)
-                self._pub(f"heatpump/state/{par}", payload, retain=True)
-            else:
-                self.log(f"Cloud ERROR for {par}: HTTP {r.status_code} {res}", level="ERROR")
+            dev.writes.expect(par, payload)
+            if self.local and self.local.submit(dev.conn, par, payload, dev):
+                self.log(f"CMD {dev.device_id} {par}={payload} (local)", level="INFO")
+                return
+            self.log(f"CMD {dev.device_id} {par}={payload}", level="INFO")
+            self.commands.submit(par, payload, dev.target)
 
         except Exception as e:
             self.log(f"on_message error: {e}", level="ERROR")
 
+    def _on_command_result(self, par, payload, ok, latency, detail, queued, target):
+        # Runs on a command worker thread
+        dev = self.pumps_by_target.get(target, self.pumps[0])
+        if ok:
+            self.log(f"Cloud OK: {dev.device_id} {par}={payload} ({latency*1000:.0f} ms, "
+                     f"queued {queued*1000:.0f} ms, depth {self.commands.depth})", level="INFO")
+            # publish state echo (so HA UI reflects immediately)
+            self._pub(f"{dev.topic_prefix}/state/{par}", payload, retain=True)
+        else:
+            self.log(f"Cloud ERROR for {dev.device_id} {par}: {detail} ({latency*1000:.0f} ms)", level="ERROR")
+            dev.writes.failed(par, payload)
+            self._publish_write_stats(dev)
+
+    def _on_local_result(self, par, payload, ok, latency, detail, dev):
+        # Runs on the I/O core loop
+        if ok:
+            self.log(f"Local OK: {dev.device_id} {par}={payload} ({latency*1000:.0f} ms, {detail})", level="INFO")
+            self._pub(f"{dev.topic_prefix}/state/{par}", payload, retain=True)
+        else:
+            self.log(f"Local write {dev.device_id} {par} failed ({detail}), using cloud", level="WARNING")
+            self.commands.submit(par, payload, dev.target)
+
     def _pub(self, topic, payload, retain=False):
         try:
-            self.mqttc.publish(topic, payload, retain=retain)
+            if self.mqttc.publish(topic, payload, retain=retain).rc == mqtt.MQTT_ERR_SUCCESS:
+                self.published += 1
+            else:
+                self.publish_errors += 1      # not connected: paho drops QoS 0 messages
         except Exception as e:
+            self.publish_errors += 1
             self.log(f"MQTT publish error to {topic}: {e}", level="ERROR")
 
+    def _profile_targets(self):
+        # Stages timed in a profile window; they nest: frame > handle_* > state > publish
+        targets = [(self.mqttc, "on_message", "mqtt_message"),
+                   (self, "_handle_0143", "handle_0143"),
+                   (self, "_handle_01B3", "handle_01B3"),
+                   (self, "_pub", "publish")]
+        for dev in self.pumps:
+            targets += [(dev.conn, "on_frame", "frame"),
+                        (dev.publisher, "packet", "state"),
+                        (dev.publisher, "_publish", "publish")]
+        return targets
+
     #
-    # ---------------------- Discovery ----------------------
+    # ---------------------- History ----------------------
     #
-    def _device_info(self):
-        return {
-            "identifiers": [self.device_id],
-            "name": self.device_name,
-            "manufacturer": self.manufacturer,
-            "model": self.model,
-            "sw_version": "1.0",
-        }
-
-    def _pub_disc(self, comp, uid, payload):
-        payload["device"] = self._device_info()
-        self._pub(f"{self.discovery_prefix}/{comp}/{uid}/config",
-                  json.dumps(payload), retain=True)
+    def history(self, sensor=None, since=None, until=None, step=None, aggregate=False, device_id=None):
+        """Recent 0143 values at frame resolution, for other apps (get_app("heatpump_bridge").history(...)).
+
+        since/until are epoch seconds, or seconds before now when negative.
+        No sensor: ring size, span and memory. aggregate: min/max/mean/last
+        instead of points; step: average into buckets of that many seconds.
+        """
+        dev = self.pumps_by_id.get(device_id) if device_id else self.pumps[0]
+        if dev is None or dev.history is None:
+            raise ValueError(f"no history for {device_id or 'this bridge'}")
+        if sensor is None:
+            return dev.history.info()
+        if sensor not in dev.history.column:
+            raise ValueError(f"unknown sensor {sensor!r}")
+        now = time.time()
+        start = None if since is None else (now + since if since < 0 else since)
+        end = None if until is None else (now + until if until < 0 else until)
+        if aggregate:
+            return dict(sensor=sensor, **dev.history.aggregate(sensor, start, end))
+        return {"sensor": sensor, "points": dev.history.query(sensor, start, end, step=step)}
+
+    def _http_history(self, query):
+        # GET /history[?device=&sensor=&since=-3600&until=&step=60&agg=1]
+        num = lambda key: float(query[key]) if query.get(key) else None
+        if not query.get("sensor") and not query.get("device"):
+            body = {dev.device_id: dev.history.info() for dev in self.pumps}
+        else:
+            body = self.history(query.get("sensor"), since=num("since"), until=num("until"), step=num("step"),
+                                aggregate=query.get("agg") in ("1", "true"), device_id=query.get("device"))
+        return 200, "application/json", json.dumps(body)
 
-    def _publish_discovery_controls(self):
-        # LWT
-        self._pub(self.avail_topic, "online", retain=True)
+    #
+    # ---------------------- Metrics ----------------------
+    #
+    def _render_metrics(self):
+        # Runs on the metrics HTTP thread; only reads counters
+        out = Exposition()
+        now = time.monotonic()
+        out.counter("mqtt_published_total", "MQTT messages handed to paho", self.published)
+        out.counter("mqtt_publish_errors_total", "MQTT publishes rejected or failed", self.publish_errors)
+        for dev in self.pumps:
+            frame_metrics(out, dev.metrics, now)
+            conn, d = dev.conn, dev.device_id
+            out.gauge("socket_connected", "Adapter socket is connected", int(conn.connected), device=d)
+            out.counter("socket_connects_total", "Successful adapter connects", conn.connects, device=d)
+            out.counter("socket_disconnects_total", "Adapter connections lost", conn.disconnects, device=d)
+            out.gauge("socket_backoff_seconds", "Current reconnect delay", conn.backoff, device=d)
+            out.histogram("write_apply_seconds", "Command submit to 0x01B3 read-back", dev.writes.histogram, device=d)
+            out.counter("writes_confirmed_total", "Writes confirmed by 0x01B3", dev.writes.confirmed, device=d)
+            out.counter("writes_rolled_back_total", "Writes rolled back", dev.writes.rolled_back, device=d)
+        c = self.commands
+        out.counter("cloud_commands_total", "Cloud commands by result", c.sent, result="ok")
+        out.counter("cloud_commands_total", "Cloud commands by result", c.failed, result="error")
+        out.counter("cloud_commands_dropped_total", "Commands dropped on a full queue", c.dropped)
+        out.counter("cloud_commands_coalesced_total", "Commands superseded within the debounce window", c.coalesced)
+        out.gauge("cloud_queue_depth", "Commands waiting to be POSTed", c.depth)
+        out.histogram("cloud_request_seconds", "Cloud POST latency", c.latency)
+        if self.local:
+            out.counter("local_writes_total", "Local set-frames sent", self.local.sent)
+            out.counter("local_write_acks_total", "Local set-frames acknowledged", self.local.acked)
+            out.counter("local_write_timeouts_total", "Local set-frames without ack", self.local.timeouts)
+        if self.sqlite:
+            out.counter("sqlite_rows_written_total", "Rows committed to SQLite", self.sqlite.written)
+            out.counter("sqlite_rows_dropped_total", "Rows dropped on a full SQLite queue", self.sqlite.dropped)
+            out.gauge("sqlite_queue_depth", "Rows waiting for the SQLite writer", self.sqlite.depth)
+            out.gauge("sqlite_last_commit_seconds", "Duration of the last SQLite commit", self.sqlite.last_commit_s)
+        return out.text()
 
+    #
+    # ---------------------- Discovery ----------------------
+    #
+    def _disc(self, out, dev, comp, uid, payload):
+        payload.update(regs.availability_fields(dev.availability))
+        payload["device"] = dev.device_info()
+        out.append((f"{self.discovery_prefix}/{comp}/{dev.node}{uid}/config", json.dumps(payload)))
+
+    def _discovery_controls(self, dev):
+        out = []
+        t = dev.topic_prefix
         # Power switch (par1)
-        self._pub_disc("switch", "heatpump_power", {
+        self._disc(out, dev, "switch", "heatpump_power", {
             "name": "Heatpump Power",
-            "unique_id": f"{self.device_id}_power",
-            "state_topic": "heatpump/state/par1",
-            "command_topic": "heatpump/set/par1",
+            "unique_id": f"{dev.device_id}_power",
+            "state_topic": f"{t}/state/par1",
+            "command_topic": f"{t}/set/par1",
             "payload_on": "1", "payload_off": "0",
             "state_on": "1", "state_off": "0",
-            "availability_topic": self.avail_topic
         })
 
         # Mode select (par2)
-        self._pub_disc("select", "heatpump_mode", {
+        self._disc(out, dev, "select", "heatpump_mode", {
             "name": "Heatpump Mode",
-            "unique_id": f"{self.device_id}_mode",
-            "state_topic": "heatpump/state/par2",
-            "command_topic": "heatpump/set/par2",
+            "unique_id": f"{dev.device_id}_mode",
+            "state_topic": f"{t}/state/par2",
+            "command_topic": f"{t}/set/par2",
             "options": ["Cooling", "DHW", "Heating"],
             "command_template": "{% if value == 'Heating' %}2{% elif value == 'DHW' %}1{% else %}0{% endif %}",
-            "availability_topic": self.avail_topic
         })
 
         # Numbers helper
         def num(uid, name, par, vmin, vmax, step, unit):
-            self._pub_disc("number", uid, {
+            self._disc(out, dev, "number", uid, {
                 "name": name,
-                "unique_id": f"{self.device_id}_{uid}",
-                "state_topic": f"heatpump/state/{par}",
-                "command_topic": f"heatpump/set/{par}",
+                "unique_id": f"{dev.device_id}_{uid}",
+                "state_topic": f"{t}/state/{par}",
+                "command_topic": f"{t}/set/{par}",
                 "min": vmin, "max": vmax, "step": step,
                 "unit_of_measurement": unit,
-                "availability_topic": self.avail_topic
             })
 
         # Setpoints & deltas (control)
@@ -226,305 +527,105 @@ class HeatpumpBridge(hass.Hass):
         num("cooling_delta_t", "Cooling Delta T",   "par96", 1, 10, 1, "K")
 
         # Low noise (par17)
-        self._pub_disc("switch", "low_noise_mode", {
+        self._disc(out, dev, "switch", "low_noise_mode", {
             "name": "Low Noise Mode",
-            "unique_id": f"{self.device_id}_low_noise_mode_control",
-            "state_topic": "heatpump/state/par17",
-            "command_topic": "heatpump/set/par17",
+            "unique_id": f"{dev.device_id}_low_noise_mode_control",
+            "state_topic": f"{t}/state/par17",
+            "command_topic": f"{t}/set/par17",
             "payload_on": "1", "payload_off": "0",
             "state_on": "1", "state_off": "0",
-            "availability_topic": self.avail_topic
         })
 
-        # Heating curve points (par85–94) – control
+        # Heating curve points (par85–94, ambient/water pairs) – control.
+        # Points 1–4 are in the hp_write table (local write + 01B3 read-back); point 5 has
+        # not been located in 01B3, so it is written through the cloud only and never confirmed.
         for i in range(1, 6):
+            local = f"par{83+2*i}" in PARAMS and f"par{84+2*i}" in PARAMS
+            suffix = "" if local else " (cloud only)"
             # Ambient
-            self._pub_disc("number", f"heating_curve_t{i}", {
-                "name": f"Heating Curve Ambient Temp {i}",
-                "unique_id": f"{self.device_id}_curve_t{i}",
-                "state_topic": f"heatpump/state/par{84+i}",
-                "command_topic": f"heatpump/set/par{84+i}",
+            self._disc(out, dev, "number", f"heating_curve_t{i}", {
+                "name": f"Heating Curve Ambient Temp {i}{suffix}",
+                "unique_id": f"{dev.device_id}_curve_t{i}",
+                "state_topic": f"{t}/state/par{83+2*i}",
+                "command_topic": f"{t}/set/par{83+2*i}",
                 "min": -20, "max": 20, "step": 1, "unit_of_measurement": "°C",
-                "availability_topic": self.avail_topic
             })
             # Water
-            self._pub_disc("number", f"heating_curve_wt{i}", {
-                "name": f"Heating Curve Water Temp {i}",
-                "unique_id": f"{self.device_id}_curve_wt{i}",
-                "state_topic": f"heatpump/state/par{85+i}",
-                "command_topic": f"heatpump/set/par{85+i}",
+            self._disc(out, dev, "number", f"heating_curve_wt{i}", {
+                "name": f"Heating Curve Water Temp {i}{suffix}",
+                "unique_id": f"{dev.device_id}_curve_wt{i}",
+                "state_topic": f"{t}/state/par{84+2*i}",
+                "command_topic": f"{t}/set/par{84+2*i}",
                 "min": 20, "max": 70, "step": 1, "unit_of_measurement": "°C",
-                "availability_topic": self.avail_topic
             })
-
-    def _publish_discovery_sensors(self):
-        device = self._device_info()
-
-        def sensor_cfg(sid, name, unit=None, dclass=None, sclass=None):
-            payload = {
-                "name": name,
-                "state_topic": f"{self.base_sensor_prefix}/{sid}/state",
-                "availability_topic": self.avail_topic,
-                "device": device,
-                "unique_id": f"{self.device_id}_{sid}"
-            }
-            if unit:   payload["unit_of_measurement"] = unit
-            if dclass: payload["device_class"] = dclass
-            if sclass: payload["state_class"]  = sclass
-            self._pub(f"{self.base_sensor_prefix}/{sid}/config", json.dumps(payload), retain=True)
-
-        def bin_cfg(sid, name, dclass, pon="true", poff="false"):
-            payload = {
-                "name": name,
-                "device_class": dclass,
-                "state_topic": f"{self.base_sensor_prefix}/{sid}/state",
-                "availability_topic": self.avail_topic,
-                "payload_on": pon, "payload_off": poff,
-                "device": device,
-                "unique_id": f"{self.device_id}_{sid}_binary"
-            }
-            self._pub(f"homeassistant/binary_sensor/{self.device_id}/{sid}/config", json.dumps(payload), retain=True)
-
-        # Temperatures
-        temp_sensors = {
-            'outdoor_temp': 'Outdoor Temperature',
-            'dhw_temp': 'DHW Temperature',
-            'cooling_water_temp': 'Cooling Water Temperature',
-            'outlet_temp': 'Outlet Temperature',
-            'inlet_temp': 'Inlet Temperature',
-            'room_temp': 'Room Temperature',
-            'outdoor_ambient_2': 'Outdoor Ambient 2',
-            'outdoor_coil_temp': 'Outdoor Coil Temperature',
-            'gas_discharge_temp': 'Gas Discharge Temperature',
-            'gas_suction_temp': 'Gas Suction Temperature',
-        }
-        for sid, name in temp_sensors.items():
-            sensor_cfg(sid, name, "°C", "temperature", "measurement")
-
-        # Electrical
-        sensor_cfg('voltage', "Voltage", "V", "voltage", "measurement")
-        sensor_cfg('current', "Current", "A", "current", "measurement")
-        sensor_cfg('compressor_freq_limit', "Compressor Frequency Limit", "Hz", None, "measurement")
-        sensor_cfg('compressor_freq', "Compressor Frequency", "Hz", None, "measurement")
-
-        # Pressure
-        sensor_cfg('low_pressure', "Low Pressure", "bar", None, "measurement")
-        sensor_cfg('high_pressure', "High Pressure", "bar", None, "measurement")
-
-        # Set temps (01B3 only)
-        sensor_cfg('dhw_set_temp', "DHW Set Temperature", "°C", "temperature", "measurement")
-        sensor_cfg('heating_set_temp', "Heating Set Temperature", "°C", "temperature", "measurement")
-        sensor_cfg('cooling_set_temp', "Cooling Set Temperature", "°C", "temperature", "measurement")
-
-        # Deltas (01B3 only)
-        sensor_cfg('dhw_delta_temp', "DHW Delta Temperature", "°C", "temperature", "measurement")
-        sensor_cfg('heating_delta_temp', "Heating Delta Temperature", "°C", "temperature", "measurement")
-        sensor_cfg('cooling_delta_temp', "Cooling Delta Temperature", "°C", "temperature", "measurement")
-        sensor_cfg('delta_t_compressor_speed', "Delta T Compressor Speed", "°C", "temperature", "measurement")
-
-        # Heating curve (01B3 only)
-        curve = {
-            'heating_curve_ambient_temp_1': "Heating Curve Ambient Temp 1",
-            'heating_curve_water_temp_1'  : "Heating Curve Water Temp 1",
-            'heating_curve_ambient_temp_2': "Heating Curve Ambient Temp 2",
-            'heating_curve_water_temp_2'  : "Heating Curve Water Temp 2",
-            'heating_curve_ambient_temp_3': "Heating Curve Ambient Temp 3",
-            'heating_curve_water_temp_3'  : "Heating Curve Water Temp 3",
-            'heating_curve_ambient_temp_4': "Heating Curve Ambient Temp 4",
-            'heating_curve_water_temp_4'  : "Heating Curve Water Temp 4",
-        }
-        for sid, name in curve.items():
-            sensor_cfg(sid, name, "°C", "temperature", "measurement")
-
-        # Priority (01B3 only)
-        sensor_cfg('shifting_priority_ambient_start_temp', "Priority Ambient Start Temp", "°C", "temperature", "measurement")
-        sensor_cfg('shifting_priority_heating_delta_temp', "Priority Heating Delta Temp", "°C", "temperature", "measurement")
-        sensor_cfg('shifting_priority_dhw_min_time', "DHW Minimum Working Time", "min", None, "measurement")
-        sensor_cfg('priority_heating_working_time', "Heating Working Time", "min", None, "measurement")
-
-        # Binary sensors (0143)
-        bin_cfg('dhw_state', "DHW Working State", "heat")
-        bin_cfg('heating_state', "Heating Working State", "heat")
-        bin_cfg('cooling_state', "Cooling Working State", "cold")
-        bin_cfg('defrost_state', "Defrost State", "running")
-        # Binary from 01B3
-        bin_cfg('unit_on_off', "Unit On/Off", "power", "1", "0")
-        bin_cfg('low_noise_mode', "Low Noise Mode", "battery", "1", "0")
-        bin_cfg('heating_curve_enabled', "Heating Curve Enabled", None, "1", "0")
+        return out
+
+    def _discovery_sensors(self, dev):
+        # Sensors & binary sensors come straight from the register map
+        out = [(topic, json.dumps(payload))
+               for topic, payload in regs.discovery_configs(dev.device_id, dev.device_info(),
+                                                            dev.availability, self.discovery_prefix,
+                                                            json_state=dev.publisher.json_mode,
+                                                            derived=dev.derived.sids)]
+        if dev.rollup:
+            for topic, payload in dev.rollup.discovery_configs(dev.device_id, dev.base_sensor_prefix,
+                                                               self.discovery_prefix):
+                payload.update(regs.availability_fields(dev.availability))
+                payload["device"] = dev.device_info()
+                out.append((topic, json.dumps(payload)))
+        return out
 
     #
     # ---------------------- Socket reader ----------------------
     #
-    def _socket_loop(self):
-        backoff = 2
-        while not self._stop_event.is_set():
-            s = None
-            try:
-                s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                s.settimeout(30)
-                s.connect((self.hp_ip, self.hp_port))
-                self._pub(self.avail_topic, "online", retain=True)
-                self.log("Socket connected, monitoring packets...", level="INFO")
-                backoff = 2
-
-                while not self._stop_event.is_set():
-                    data = s.recv(1024)
-                    if not data:
-                        raise ConnectionError("socket recv returned no data")
-                    if len(data) < 13:
-                        continue
-                    cmd = data[12]
-                    parameters = data[13:]
-
-                    if cmd == 0x01:
-                        self._handle_0143(parameters)
-                    elif cmd == 0x02:
-                        self._handle_01B3(parameters)
-                    else:
-                        # 0x05 appears benign; keep quiet unless debug
-                        if self.debug_enabled or cmd not in (0x05,):
-                            self.log(f"Unknown packet: 0x{cmd:02X}", level="DEBUG")
-
-            except Exception as e:
-                self._pub(self.avail_topic, "offline", retain=True)
-                self.log(f"Socket error: {e}", level="WARNING")
-                time.sleep(backoff)
-                backoff = min(backoff * 2, 60)  # exponential backoff up to 60s
-            finally:
-                if s:
-                    try:
-                        s.close()
-                    except Exception:
-                        pass
+    def _on_frame(self, dev, cmd, parameters, raw):
+        # Runs on the I/O core loop; parameters/raw are only valid during this call
+        dev.metrics.frame(cmd, time.monotonic())
+        if dev.capture:
+            dev.capture.write(cmd, raw)
+        if cmd == 0x01:
+            dev.watchdog.frame(cmd)
+            self._handle_0143(dev, parameters)
+        elif cmd == 0x02:
+            dev.watchdog.frame(cmd)
+            self._handle_01B3(dev, parameters)
+        elif cmd == ACK_CMD and self.local:
+            self.local.ack(dev.conn, raw)
+        else:
+            dev.metrics.unknown += 1
+            # 0x05 appears benign; keep quiet unless debug
+            if self.debug_enabled or cmd not in (0x05,):
+                self.log(f"Unknown packet from {dev.device_id}: 0x{cmd:02X}", level="DEBUG")
+
+    def _on_socket_state(self, dev, connected, error):
+        if not connected:
+            dev.watchdog.force("offline")
 
     #
     # ---------------------- Packet decoders ----------------------
     #
-    def _f32(self, b, off):
-        try:
-            if off + 4 <= len(b):
-                return struct.unpack("<f", b[off:off+4])[0]
-        except Exception:
-            pass
-        return None
-
-    def _u8(self, b, off):
-        try:
-            if off < len(b):
-                return b[off]
-        except Exception:
-            pass
-        return None
-
-    def _handle_0143(self, p):
-        # Temps
-        for name in ("outdoor_temp","dhw_temp","cooling_water_temp","outlet_temp","inlet_temp",
-                     "room_temp","outdoor_ambient_2","outdoor_coil_temp","gas_discharge_temp","gas_suction_temp"):
-            off = self.OFF[name]
-            v = self._f32(p, off)
-            if v is not None:
-                self._state(name, v)
-
-        # Electrical
-        for name in ("voltage","current","compressor_freq","compressor_freq_limit"):
-            v = self._f32(p, self.OFF[name])
-            if v is not None:
-                self._state(name, v)
-
-        # Pressure
-        for name in ("low_pressure","high_pressure"):
-            v = self._f32(p, self.OFF[name])
-            if v is not None:
-                self._state(name, v)
-
-        # Binary flags read as float(1.0/0.0)
-        flags = (("dhw_state","heat"),("heating_state","heat"),
-                 ("cooling_state","cold"),("defrost_state","running"))
-        for name,_dc in flags:
-            v = self._f32(p, self.OFF[name])
-            if v is not None:
-                self._state(name, "true" if v == 1.0 else "false")
-
-        # Outdoor unit mode as byte
-        unit_mode = self._u8(p, self.OFF['outdoor_unit_mode'])
-        if unit_mode is not None:
-            self._state('outdoor_unit_mode', unit_mode)
-
-    def _handle_01B3(self, p):
-        # Set temperatures
-        for name in ("dhw_set_temp","heating_set_temp","cooling_set_temp"):
-            v = self._f32(p, self.OFF[name])
-            if v is not None:
-                self._state(name, v)
-
-        # Unit status
-        u_on = self._f32(p, self.OFF['unit_on_off'])
-        if u_on is not None:
-            self._state('unit_on_off', 1 if u_on == 1.0 else 0)
-
-        mode = self._f32(p, self.OFF['working_mode'])
-        if mode is not None:
-            self._state('working_mode', int(mode))
-
-        low_noise = self._f32(p, self.OFF['low_noise_mode'])
-        if low_noise is not None:
-            self._state('low_noise_mode', 1 if low_noise == 1.0 else 0)
-
-        hc_enabled = self._f32(p, self.OFF['heating_curve_enabled'])
-        if hc_enabled is not None:
-            self._state('heating_curve_enabled', 1 if hc_enabled == 1.0 else 0)
-
-        # Deltas
-        pairs = (("delta_t_compressor_speed","delta_t_compressor_speed"),
-                 ("heating_delta_t","heating_delta_temp"),
-                 ("dhw_delta_t","dhw_delta_temp"),
-                 ("cooling_delta_t","cooling_delta_temp"))
-        for raw, alias in pairs:
-            v = self._f32(p, self.OFF[raw])
-            if v is not None:
-                self._state(raw, v)
-                if alias != raw:
-                    self._state(alias, v)
-
-        # Heating curve (first 4 points)
-        curve = ("heating_curve_ambient_temp_1","heating_curve_water_temp_1",
-                 "heating_curve_ambient_temp_2","heating_curve_water_temp_2",
-                 "heating_curve_ambient_temp_3","heating_curve_water_temp_3",
-                 "heating_curve_ambient_temp_4","heating_curve_water_temp_4")
-        for name in curve:
-            v = self._f32(p, self.OFF[name])
-            if v is not None:
-                self._state(name, v)
-
-        # Priority (floats)
-        v = self._f32(p, self.OFF['dhw_priority_min_time'])
-        if v is not None:
-            self._state('dhw_priority_min_time', v)
-            self._state('shifting_priority_dhw_min_time', v)
-
-        v = self._f32(p, self.OFF['priority_ambient_start_temp'])
-        if v is not None:
-            self._state('priority_ambient_start_temp', v)
-            self._state('shifting_priority_ambient_start_temp', v)
-
-        v = self._f32(p, self.OFF['priority_heating_delta_t'])
-        if v is not None:
-            self._state('priority_heating_delta_t', v)
-            self._state('shifting_priority_heating_delta_temp', v)
-
-        v = self._f32(p, self.OFF['priority_heating_working_time'])
-        if v is not None:
-            self._state('priority_heating_working_time', v)
-            self._state('shifting_priority_heating_working_time', v)
-
-    #
-    # ---------------------- State helper ----------------------
-    #
-    def _state(self, sid, value):
-        topic = f"{self.base_sensor_prefix}/{sid}/state"
-        self._pub(topic, str(value))
-        # keep availability fresh
-        self._pub(self.avail_topic, "online", retain=True)
+    def _handle_0143(self, dev, p):
+        t0 = time.perf_counter()
+        rec = regs.decode(regs.REALTIME, p)
+        dev.metrics.decode[regs.REALTIME].observe(time.perf_counter() - t0)
+        dev.publisher.packet(regs.REALTIME, rec)
+        dev.derived.update(rec)
+        if dev.rollup:
+            dev.rollup.add(rec)
+        if dev.history:
+            dev.history.append_record(rec)
+        if self.sqlite:
+            self.sqlite.put(dev.device_id, regs.REALTIME, rec)
+
+    def _handle_01B3(self, dev, p):
+        t0 = time.perf_counter()
+        rec = regs.decode(regs.SETTINGS, p)
+        dev.metrics.decode[regs.SETTINGS].observe(time.perf_counter() - t0)
+        dev.publisher.packet(regs.SETTINGS, rec)
+        if self.sqlite:
+            self.sqlite.put(dev.device_id, regs.SETTINGS, rec)
+        if dev.writes.observe(rec):
+            self._publish_write_stats(dev)
 
     #
     # ---------------------- Utils ----------------------
@@ -0,0 +1,200 @@
+# /config/apps/hp_capture.py
+"""Append-only binary capture of raw heat pump frames.
+
+A capture directory holds rotating segments:
+
+    hp-YYYYmmdd-HHMMSS-NNN.hpcap   records, appended (UTC start time)
+    hp-YYYYmmdd-HHMMSS-NNN.idx     sparse index (one entry every N records)
+
+.hpcap layout:
+    header  b"HPCAP1\\0\\0" + <d wall epoch at start> + <Q monotonic ns at start>
+    record  <Q monotonic ns> <B command byte> <H frame length> + raw frame
+
+.idx layout:
+    header  b"HPIDX1\\0\\0"
+    entry   <Q monotonic ns> <Q byte offset of the record in .hpcap>
+
+The index is searched through mmap, so a time range is located with a
+binary search instead of a scan. Nothing is held in memory beyond the
+write buffers, so a recorder can run for days.
+"""
+
+import mmap
+import os
+import struct
+import time
+
+SEG_MAGIC = b"HPCAP1\0\0"
+IDX_MAGIC = b"HPIDX1\0\0"
+SEG_HEADER = struct.Struct("<8sdQ")
+RECORD = struct.Struct("<QBH")
+INDEX = struct.Struct("<QQ")
+
+
+class CaptureWriter:
+    """Writes frames to rotating segment files with a sparse sidecar index."""
+
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024, segment_seconds=3600,
+                 index_every=64, flush_seconds=5.0, keep_segments=None):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.index_every = index_every
+        self.flush_seconds = flush_seconds
+        self.keep_segments = keep_segments
+        os.makedirs(directory, exist_ok=True)
+        self._seg = self._idx = None
+        self.records = 0
+        self.segments = 0
+
+    def _open(self, now_ns):
+        self.close()
+        # UTC + counter so names sort in recording order
+        name = time.strftime("hp-%Y%m%d-%H%M%S", time.gmtime())
+        n = 0
+        base = os.path.join(self.directory, f"{name}-{n:03d}")
+        while os.path.exists(base + ".hpcap"):
+            n += 1
+            base = os.path.join(self.directory, f"{name}-{n:03d}")
+        self.path = base + ".hpcap"
+        self._seg = open(self.path, "wb")
+        self._idx = open(base + ".idx", "wb")
+        self._seg.write(SEG_HEADER.pack(SEG_MAGIC, time.time(), now_ns))
+        self._idx.write(IDX_MAGIC)
+        self._pos = SEG_HEADER.size
+        self._opened = now_ns
+        self._flushed = now_ns
+        self._count = 0
+        self.segments += 1
+        self._prune()
+
+    def _prune(self):
+        if not self.keep_segments:
+            return
+        for path in list_segments(self.directory)[:-self.keep_segments]:
+            for p in (path, path[:-len(".hpcap")] + ".idx"):
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+
+    def write(self, cmd, frame, now_ns=None):
+        """Append one raw frame (bytes or memoryview)."""
+        if now_ns is None:
+            now_ns = time.monotonic_ns()
+        if (self._seg is None or self._pos >= self.segment_bytes
+                or now_ns - self._opened >= self.segment_seconds * 1e9):
+            self._open(now_ns)
+        if self._count % self.index_every == 0:
+            self._idx.write(INDEX.pack(now_ns, self._pos))
+        self._seg.write(RECORD.pack(now_ns, cmd, len(frame)))
+        self._seg.write(frame)
+        self._pos += RECORD.size + len(frame)
+        self._count += 1
+        self.records += 1
+        if now_ns - self._flushed >= self.flush_seconds * 1e9:
+            self.flush()
+            self._flushed = now_ns
+
+    def flush(self):
+        if self._seg is not None:
+            self._seg.flush()
+            self._idx.flush()
+
+    def close(self):
+        if self._seg is not None:
+            self._seg.close()
+            self._idx.close()
+            self._seg = self._idx = None
+
+
+def list_segments(directory):
+    """Segment paths in recording order."""
+    return sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(".hpcap"))
+
+
+class CaptureReader:
+    """Streams records from one segment, optionally restricted to a time range."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            magic, self.wall_start, self.mono_start = SEG_HEADER.unpack(f.read(SEG_HEADER.size))
+        if magic != SEG_MAGIC:
+            raise ValueError(f"{path}: not a capture segment")
+
+    def wall_time(self, mono_ns):
+        return self.wall_start + (mono_ns - self.mono_start) / 1e9
+
+    def mono_ns(self, wall):
+        return int(self.mono_start + (wall - self.wall_start) * 1e9)
+
+    def _seek_offset(self, mono_ns):
+        """Byte offset of an indexed record at or before mono_ns (binary search over mmap)."""
+        idx_path = self.path[:-len(".hpcap")] + ".idx"
+        try:
+            f = open(idx_path, "rb")
+        except OSError:
+            return SEG_HEADER.size
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            n = (size - len(IDX_MAGIC)) // INDEX.size
+            if n <= 0:
+                return SEG_HEADER.size
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                lo, hi = 0, n
+                while lo < hi:
+                    mid = (lo + hi) // 2
+                    if INDEX.unpack_from(m, len(IDX_MAGIC) + mid * INDEX.size)[0] <= mono_ns:
+                        lo = mid + 1
+                    else:
+                        hi = mid
+                if lo == 0:
+                    return SEG_HEADER.size
+                return INDEX.unpack_from(m, len(IDX_MAGIC) + (lo - 1) * INDEX.size)[1]
+
+    def records(self, start=None, end=None):
+        """Yield (monotonic ns, command, frame bytes); start/end are wall-clock epochs."""
+        start_ns = self.mono_ns(start) if start is not None else None
+        end_ns = self.mono_ns(end) if end is not None else None
+        with open(self.path, "rb") as f:
+            f.seek(self._seek_offset(start_ns) if start_ns is not None else SEG_HEADER.size)
+            while True:
+                head = f.read(RECORD.size)
+                if len(head) < RECORD.size:
+                    return           # end of file, or a record still being written
+                ts, cmd, length = RECORD.unpack(head)
+                frame = f.read(length)
+                if len(frame) < length:
+                    return
+                if start_ns is not None and ts < start_ns:
+                    continue
+                if end_ns is not None and ts > end_ns:
+                    return
+                yield ts, cmd, frame
+
+    def scan(self, buf, start=None, end=None):
+        """Yield (monotonic ns, command, frame offset, frame length) over the segment bytes in buf
+        (e.g. an mmap of it), without copying frames out."""
+        start_ns = self.mono_ns(start) if start is not None else None
+        end_ns = self.mono_ns(end) if end is not None else None
+        pos = self._seek_offset(start_ns) if start_ns is not None else SEG_HEADER.size
+        size, unpack = len(buf), RECORD.unpack_from
+        while pos + RECORD.size <= size:
+            ts, cmd, length = unpack(buf, pos)
+            pos += RECORD.size
+            if pos + length > size:
+                return
+            if end_ns is not None and ts > end_ns:
+                return
+            if start_ns is None or ts >= start_ns:
+                yield ts, cmd, pos, length
+            pos += length
+
+
+def read_range(directory, start=None, end=None):
+    """Yield (wall time, command, frame) across all segments of a capture directory."""
+    for path in list_segments(directory):
+        reader = CaptureReader(path)
+        for ts, cmd, frame in reader.records(start, end):
+            yield reader.wall_time(ts), cmd, frame
@@ -0,0 +1,195 @@
+# /config/apps/hp_commands.py
+"""Cloud write commands, sent off the MQTT network thread.
+
+MQTT callbacks only submit; commands are coalesced per parameter with a
+trailing debounce (each new value restarts the window, so a slider sweep
+becomes one POST with the final value once it settles; max_delay caps how
+long a continuous sweep can hold it back), optionally batched, and POSTed
+by a small pool of worker threads through one keep-alive requests.Session.
+
+Several pumps can share one dispatcher: each command carries a target
+(mn, devid), defaulting to the one given to the constructor.
+"""
+
+import queue
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from hp_metrics import Histogram
+
+
+class CloudCommands:
+    """Debounced, coalescing command dispatcher drained by a worker pool."""
+
+    def __init__(self, url, mn, devid, cookies, on_result, log,
+                 workers=2, maxsize=32, timeout=10, debounce=0.5, batch=False, max_delay=None):
+        self.url = url
+        self.mn = mn
+        self.devid = devid
+        self.target = (mn, devid)
+        self.timeout = timeout
+        self.debounce = float(debounce)
+        self.max_delay = float(max_delay) if max_delay is not None else 4 * self.debounce
+        self.batch = batch
+        self.maxsize = maxsize
+        self._on_result = on_result      # callable(par, value, ok, latency_s, detail, queued_s, target)
+        self._log = log                  # callable(msg, level)
+
+        self.session = requests.Session()
+        self.session.cookies.update(cookies)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        # ---- Coalescing state (guarded by _cond) ----
+        self._cond = threading.Condition()
+        self._pending = {}     # (target, par) -> (latest value, first submit time, last submit time)
+        self._inflight = set() # (target, par) being POSTed; a newer value waits for them
+        self._stopping = False
+
+        # ---- Stats ----
+        self._stats_lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.requests = 0
+        self.last_latency = None
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+        self.latency = Histogram()
+
+        self._queue = queue.Queue()
+        self._threads = [threading.Thread(target=self._worker, name=f"hp_cmd_{i}", daemon=True)
+                         for i in range(workers)]
+        self._threads.append(threading.Thread(target=self._dispatch, name="hp_cmd_dispatch", daemon=True))
+        for t in self._threads:
+            t.start()
+
+    @property
+    def depth(self):
+        """Commands waiting: pending in the debounce window plus queued for a worker."""
+        return len(self._pending) + self._queue.qsize()
+
+    def submit(self, par, value, target=None):
+        """Record the latest value for par on target (mn, devid); never blocks. False if dropped."""
+        key = (target or self.target, par)
+        with self._cond:
+            now = time.monotonic()
+            if key in self._pending:
+                # Trailing debounce: a newer value restarts the window
+                self._pending[key] = (value, self._pending[key][1], now)
+                self.coalesced += 1
+                self._cond.notify()
+                return True
+            if len(self._pending) >= self.maxsize:
+                self.dropped += 1
+                self._log(f"Command queue full, dropping {par}={value}", "WARNING")
+                return False
+            self._pending[key] = (value, now, now)
+            self._cond.notify()
+            return True
+
+    def stop(self, timeout=5.0):
+        """Stop the dispatcher and workers; queued POSTs get up to timeout s before the session closes."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for _ in range(len(self._threads) - 1):
+            self._queue.put(None)
+        deadline = time.monotonic() + timeout
+        for t in self._threads:
+            t.join(max(0.0, deadline - time.monotonic()))
+        self.session.close()
+
+    #
+    # ---------------------- Dispatcher ----------------------
+    #
+    def _ready(self, now):
+        """Keys quiet for `debounce` (or held `max_delay`) with no POST in flight; else next wake-up."""
+        ready, wake = [], None
+        for key, (_, first, last) in self._pending.items():
+            if key in self._inflight:
+                continue
+            due = min(last + self.debounce, first + max(self.max_delay, self.debounce))
+            if due <= now:
+                ready.append(key)
+            elif wake is None or due < wake:
+                wake = due
+        return ready, wake
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopping:
+                        return
+                    now = time.monotonic()
+                    ready, wake = self._ready(now)
+                    if ready:
+                        break
+                    self._cond.wait(None if wake is None else wake - now)
+                jobs = {}
+                for key in ready:
+                    value, first, _ = self._pending.pop(key)
+                    self._inflight.add(key)
+                    jobs.setdefault(key[0], []).append((key[1], value, first))
+            # One POST per target (batched) or per parameter
+            for target, group in jobs.items():
+                if self.batch:
+                    self._queue.put((target, group))
+                else:
+                    for job in group:
+                        self._queue.put((target, [job]))
+
+    #
+    # ---------------------- Workers ----------------------
+    #
+    def _post(self, target, fields):
+        data = {"id": "", "mn": target[0], "devid": target[1]}
+        data.update(fields)
+        r = self.session.post(self.url, data=data, timeout=self.timeout)
+        res = r.json() if r.headers.get("content-type", "").startswith("application/json") else {}
+        return str(res.get("result")).lower() == "true", f"HTTP {r.status_code} {res}"
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            target, jobs = item
+            fields = {par: value for par, value, _ in jobs}
+            fields["fieldName"] = ",".join(par for par, _, _ in jobs)
+            fields["fieldValue"] = ",".join(str(value) for _, value, _ in jobs)
+            t0 = time.monotonic()
+            try:
+                ok, detail = self._post(target, fields)
+            except Exception as e:
+                ok, detail = False, str(e)
+            latency = time.monotonic() - t0
+            self._record(ok, latency, len(jobs))
+            with self._cond:
+                for par, _, _ in jobs:
+                    self._inflight.discard((target, par))
+                self._cond.notify()
+            for par, value, first in jobs:
+                try:
+                    self._on_result(par, value, ok, latency, detail, t0 - first, target)
+                except Exception as e:
+                    self._log(f"command result handler error: {e}", "ERROR")
+
+    def _record(self, ok, latency, n):
+        with self._stats_lock:
+            self.requests += 1
+            if ok:
+                self.sent += n
+            else:
+                self.failed += n
+            self.last_latency = latency
+            self.total_latency += latency
+            self.latency.observe(latency)
+            if latency > self.max_latency:
+                self.max_latency = latency
@@ -0,0 +1,137 @@
+# /config/apps/hp_confirm.py
+"""Read-back confirmation of writes through the next 0x01B3 frame.
+
+A command (cloud or local) only says the request was accepted. The
+WriteTracker remembers what each parN should read back as (par62=45 ->
+heating_set_temp 45.0, via the hp_write table) and watches decoded 01B3
+records:
+
+  - field matches      -> confirmed; submit-to-apply latency is recorded
+  - timeout / failure  -> rolled back: the echoed heatpump/.../state/parN
+                          is re-published with the value the pump reports
+
+Latencies go into a fixed-bucket hp_metrics.Histogram, exposed as JSON on
+MQTT and on the metrics endpoint.
+"""
+
+import threading
+import time
+
+import hp_write
+from hp_metrics import Histogram
+
+_SIDS = tuple({p.sid for p in hp_write.PARAMS.values()})
+
+
+def payload_for(par, value):
+    """01B3 register value -> parN payload as published on the state topic; None if the
+    value is not known (not read back yet, or NaN)."""
+    if value is None or value != value:
+        return None
+    spec = hp_write.PARAMS[par]
+    if spec.values is not None:
+        for payload, v in spec.values.items():
+            if v == value:
+                return payload
+    if value == int(value):
+        return str(int(value))
+    return f"{value:.1f}"
+
+
+class WriteTracker:
+    """Pending writes of one pump, confirmed or rolled back from 01B3 read-back."""
+
+    def __init__(self, publish_state, timeout=120.0, tolerance=0.05, clock=time.monotonic, log=None):
+        self._publish_state = publish_state      # callable(par, payload)
+        self.timeout = timeout
+        self.tolerance = tolerance
+        self._clock = clock
+        self._log = log or (lambda msg, level="INFO": None)
+        self._lock = threading.Lock()
+        self._pending = {}       # par -> (sid, expected value, submit time)
+        self._actual = {}        # sid -> last value read back from 01B3
+        self.histogram = Histogram()
+        self.confirmed = 0
+        self.rolled_back = 0
+
+    def expect(self, par, payload, now=None):
+        """Track a command; False if par has no 01B3 read-back (left untracked)."""
+        spec = hp_write.PARAMS.get(par)
+        if spec is None:
+            return False
+        try:
+            _, expected = hp_write.encode(par, payload)
+        except ValueError:
+            return False
+        with self._lock:
+            self._pending[par] = (spec.sid, expected, self._clock() if now is None else now)
+        return True
+
+    def failed(self, par, payload):
+        """The command par=payload was rejected: restore the echoed state right away.
+
+        Ignored when a newer value for par is pending (the failed command was superseded).
+        """
+        try:
+            _, value = hp_write.encode(par, payload)
+        except ValueError:
+            return
+        with self._lock:
+            pending = self._pending.get(par)
+            if pending is None or abs(pending[1] - value) > self.tolerance:
+                return
+            del self._pending[par]
+        self._rollback(par, pending[0], "command failed")
+
+    def observe(self, rec, now=None):
+        """Match pending writes against a decoded 01B3 record."""
+        if now is None:
+            now = self._clock()
+        done = []
+        with self._lock:
+            for sid in _SIDS:
+                actual = getattr(rec, sid, None)
+                if actual is not None and actual == actual:      # NaN = no valid read-back
+                    self._actual[sid] = actual
+            for par, (sid, expected, t0) in list(self._pending.items()):
+                actual = self._actual.get(sid)
+                if actual is not None and abs(actual - expected) <= self.tolerance:
+                    del self._pending[par]
+                    self.histogram.observe(now - t0)
+                    self.confirmed += 1
+                    done.append((par, now - t0))
+        for par, latency in done:
+            self._log(f"Write {par} confirmed by 01B3 after {latency:.1f} s", "INFO")
+        self._expire(now)
+        return bool(done)
+
+    def tick(self, now=None):
+        """Roll back writes that were never read back (call periodically)."""
+        self._expire(self._clock() if now is None else now)
+
+    def _expire(self, now):
+        with self._lock:
+            expired = [(par, p) for par, p in self._pending.items() if now - p[2] >= self.timeout]
+            for par, _ in expired:
+                del self._pending[par]
+        for par, (sid, _, _) in expired:
+            self._rollback(par, sid, f"not applied within {self.timeout:.0f} s")
+
+    def _rollback(self, par, sid, reason):
+        self.rolled_back += 1
+        actual = self._actual.get(sid)
+        payload = payload_for(par, actual)
+        if payload is None:
+            self._log(f"Write {par} {reason}; pump value unknown, state left as is", "WARNING")
+            return
+        self._log(f"Write {par} {reason}; restoring state to {actual}", "WARNING")
+        self._publish_state(par, payload)
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def stats(self):
+        out = self.histogram.as_dict()
+        out.update(confirmed=self.confirmed, rolled_back=self.rolled_back, pending=self.pending)
+        return out
@@ -0,0 +1,247 @@
+# /config/apps/hp_core.py
+"""asyncio I/O core shared by the AppDaemon bridge and HeatPump.py.
+
+One event loop owns every adapter connection and every periodic timer:
+
+    core = IOCore(log)
+    core.connect(host, port, on_frame)      # reconnects with 2..60 s backoff
+    core.every(10, watchdog.tick)
+    core.start()                            # background thread (AppDaemon)
+    ...
+    core.stop()                             # returns immediately, no recv timeout to wait out
+
+or core.run() to block on the calling thread (standalone script).
+
+Sockets are read with a BufferedProtocol straight into a FrameBuffer, so
+frames are cut out of the same preallocated buffer as before and handed to
+on_frame(cmd, params, raw) as memoryviews, valid only during the call.
+Callbacks run on the loop thread and must not block: paho's publish() only
+queues the message for its own network thread, so publishing from here is fine.
+"""
+
+import asyncio
+import threading
+
+from hp_framing import FrameBuffer, LEN_OFFSET
+
+
+class FrameProtocol(asyncio.BufferedProtocol):
+    """Receives into a FrameBuffer and dispatches each complete frame."""
+
+    def __init__(self, on_frame, loop):
+        self.on_frame = on_frame
+        self.buffer = FrameBuffer()
+        self.transport = None
+        self.last_header = None      # header bytes of the latest frame (reused for writes)
+        self.last_rx = loop.time()
+        self._loop = loop
+        self.closed = loop.create_future()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def get_buffer(self, sizehint):
+        return self.buffer.writable()
+
+    def buffer_updated(self, nbytes):
+        self.buffer.advance(nbytes)
+        self.last_rx = self._loop.time()
+        for cmd, params, raw in self.buffer.frames(raw=True):
+            self.last_header = bytes(raw[:LEN_OFFSET])
+            self.on_frame(cmd, params, raw)
+
+    def eof_received(self):
+        return False     # let the transport close
+
+    def connection_lost(self, exc):
+        if not self.closed.done():
+            self.closed.set_result(exc)
+
+
+class Connection:
+    """One adapter socket, kept open (or not) by IOCore."""
+
+    def __init__(self, core, host, port, on_frame, on_state=None, reconnect=True,
+                 connect_timeout=30.0, idle_timeout=30.0):
+        self.core = core
+        self.host = host
+        self.port = port
+        self.on_frame = on_frame
+        self.on_state = on_state
+        self.reconnect = reconnect
+        self.connect_timeout = connect_timeout
+        self.idle_timeout = idle_timeout
+        self.connected = False
+        self.connects = 0
+        self.disconnects = 0
+        self.backoff = 0             # s until the next connect attempt (0 while connected)
+        self.protocol = None
+
+    def _state(self, up, detail=None):
+        self.connected = up
+        if self.on_state:
+            try:
+                self.on_state(up, detail)
+            except Exception as e:
+                self.core.log(f"{self.host}:{self.port} state callback error: {e}", "ERROR")
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        backoff = 2
+        while True:
+            try:
+                _transport, self.protocol = await asyncio.wait_for(
+                    loop.create_connection(lambda: FrameProtocol(self._dispatch, loop), self.host, self.port),
+                    self.connect_timeout)
+                self.connects += 1
+                backoff = 2
+                self.backoff = 0
+                self.core.log(f"Socket connected to {self.host}:{self.port}, monitoring packets...", "INFO")
+                self._state(True)
+                exc = await self._watch(loop, self.protocol)
+                raise exc or ConnectionError("connection closed by adapter")
+            except asyncio.CancelledError:
+                if self.protocol and self.protocol.transport:
+                    self.protocol.transport.abort()
+                raise
+            except Exception as e:
+                self.core.log(f"Socket error ({self.host}:{self.port}): {e}", "WARNING")
+                if self.connected:
+                    self.disconnects += 1
+                self._state(False, e)
+                if not self.reconnect:
+                    return
+                self.backoff = backoff
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 60)  # exponential backoff up to 60s
+
+    async def _watch(self, loop, proto):
+        """Wait for the connection to drop; abort it after idle_timeout s without data."""
+        while True:
+            wait = proto.last_rx + self.idle_timeout - loop.time()
+            if wait <= 0:
+                proto.transport.abort()
+                return TimeoutError(f"no data for {self.idle_timeout:.0f} s")
+            done, _ = await asyncio.wait((proto.closed,), timeout=wait)
+            if done:
+                return proto.closed.result()
+
+    def _dispatch(self, cmd, params, raw):
+        try:
+            self.on_frame(cmd, params, raw)
+        except Exception as e:
+            self.core.log(f"Frame handler error (0x{cmd:02X}): {e}", "ERROR")
+
+
+class IOCore:
+    """Event loop hosting adapter connections and timers."""
+
+    def __init__(self, log=None):
+        self.log = log or (lambda msg, level="INFO": None)
+        self.connections = []
+        self._timers = []
+        self._tasks = []
+        self._conn_tasks = []
+        self._stopped = None
+        self._loop = None
+        self._thread = None
+
+    def connect(self, host, port, on_frame, on_state=None, reconnect=True, **kwargs):
+        """Register an adapter; on_frame(cmd, params, raw) runs on the loop thread."""
+        conn = Connection(self, host, port, on_frame, on_state, reconnect, **kwargs)
+        self.connections.append(conn)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._spawn, conn.run(), True)
+        return conn
+
+    def every(self, interval, fn, delay=None):
+        """Call fn() every interval s on the loop thread."""
+        self._timers.append((interval, fn, interval if delay is None else delay))
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._spawn, self._timer(*self._timers[-1]))
+
+    @property
+    def loop(self):
+        """The running event loop (None when stopped)."""
+        return self._loop
+
+    def call_soon(self, fn, *args):
+        """Run fn(*args) on the loop thread (thread-safe)."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(fn, *args)
+
+    async def _timer(self, interval, fn, delay):
+        await asyncio.sleep(delay)
+        while True:
+            try:
+                fn()
+            except Exception as e:
+                self.log(f"Timer {getattr(fn, '__name__', fn)} error: {e}", "ERROR")
+            await asyncio.sleep(interval)
+
+    def _spawn(self, coro, connection=False):
+        task = self._loop.create_task(coro)
+        self._tasks.append(task)
+        if connection:
+            self._conn_tasks.append(task)
+            task.add_done_callback(self._connection_done)
+
+    def _connection_done(self, _task):
+        # run() returns once every connection has given up (reconnect=False)
+        if all(t.done() for t in self._conn_tasks):
+            self._finish()
+
+    def _finish(self):
+        if self._stopped is not None and not self._stopped.done():
+            self._stopped.set_result(None)
+
+    async def _main(self, started=None):
+        self._loop = asyncio.get_running_loop()
+        self._stopped = self._loop.create_future()
+        for conn in self.connections:
+            self._spawn(conn.run(), connection=True)
+        for timer in self._timers:
+            self._spawn(self._timer(*timer))
+        if started is not None:
+            started.set()
+        try:
+            await self._stopped
+        finally:
+            self._loop = None
+            for t in self._tasks:
+                t.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            self._tasks = []
+            self._conn_tasks = []
+
+    def run(self):
+        """Block until all connections end or stop() is called (Ctrl+C raises KeyboardInterrupt)."""
+        asyncio.run(self._main())
+
+    def start(self):
+        """Run the loop on a daemon thread."""
+        started = threading.Event()
+
+        def target():
+            try:
+                asyncio.run(self._main(started))
+            except Exception as e:
+                self.log(f"I/O core stopped: {e}", "ERROR")
+            finally:
+                started.set()
+
+        self._thread = threading.Thread(target=target, name="hp_io", daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop(self, timeout=5.0):
+        """Cancel connections and timers and wait for the loop to exit."""
+        loop = self._loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self._finish)
+            except RuntimeError:
+                pass         # loop already closed
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
@@ -0,0 +1,76 @@
+# /config/apps/hp_decode.py
+"""Precompiled packet decoding.
+
+A DecodePlan is built once from (name, offset, type) fields. Fields are
+packed into as few struct.Struct formats as possible, with pad bytes for
+the gaps, so a whole packet is decoded with one or two unpack_from()
+calls instead of one slice + unpack per field.
+"""
+
+import struct
+from collections import namedtuple
+from operator import itemgetter
+
+# type code -> (struct code, size)
+TYPES = {
+    "f32": ("f", 4),
+    "u8":  ("B", 1),
+    "i16": ("h", 2),
+    "u16": ("H", 2),
+}
+
+
+class DecodePlan:
+    """Decode a fixed set of fields from a parameter buffer in one pass."""
+
+    def __init__(self, record_name, fields):
+        fields = list(fields)
+        self.names = tuple(name for name, _, _ in fields)
+        self.record = namedtuple(record_name, self.names)
+
+        # Fields sharing an offset/type (aliases) share one slot
+        slots = sorted({(off, typ) for _, off, typ in fields})
+        slot_of = {s: i for i, s in enumerate(slots)}
+        index = [slot_of[(off, typ)] for _, off, typ in fields]
+        self._pick = itemgetter(*index) if len(index) > 1 else (lambda v: (v[index[0]],))
+        self._nslots = len(slots)
+
+        # Pack slots into non-overlapping groups, one Struct each
+        self._groups = []
+        fmt, base, pos, members = None, 0, 0, []
+        for i, (off, typ) in enumerate(slots):
+            code, size = TYPES[typ]
+            if fmt is None or off < pos:
+                if fmt is not None:
+                    self._groups.append((struct.Struct(fmt), base, tuple(members)))
+                fmt, base, pos, members = "<", off, off, []
+            if off > pos:
+                fmt += f"{off - pos}x"
+            fmt += code
+            pos = off + size
+            members.append(i)
+        if fmt is not None:
+            self._groups.append((struct.Struct(fmt), base, tuple(members)))
+
+        self._slot_fmt = tuple(struct.Struct("<" + TYPES[typ][0]) for _, typ in slots)
+        self._slot_off = tuple(off for off, _ in slots)
+        self.size = max((st.size + base for st, base, _ in self._groups), default=0)
+
+    def decode(self, buf):
+        """Return a record with one value per field (None if out of range)."""
+        if len(self._groups) == 1 and len(buf) >= self.size:
+            vals = self._groups[0][0].unpack_from(buf, self._groups[0][1])
+        else:
+            vals = [None] * self._nslots
+            n = len(buf)
+            for st, base, members in self._groups:
+                if base + st.size <= n:
+                    for i, v in zip(members, st.unpack_from(buf, base)):
+                        vals[i] = v
+                else:
+                    # Short packet: decode whatever still fits
+                    for i in members:
+                        f = self._slot_fmt[i]
+                        if self._slot_off[i] + f.size <= n:
+                            vals[i] = f.unpack_from(buf, self._slot_off[i])[0]
+        return self.record._make(self._pick(vals))
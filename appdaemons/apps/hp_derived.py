@@ -0,0 +1,110 @@
+# /config/apps/hp_derived.py
+"""Electrical power, thermal power and COP derived from 0x0143 frames.
+
+    electrical_power_w      = voltage * current * power_factor
+    thermal_power_heating_w = flow * cp * (outlet - inlet)   while heating or DHW
+    thermal_power_cooling_w = flow * cp * (inlet - outlet)   while cooling
+    cop_heating / cop_cooling = smoothed thermal / smoothed electrical
+
+Each frame pushes one sample per quantity into a fixed ring (O(1), no
+allocation); states are published at most every `interval` seconds.
+Thermal power and COP need the water flow (`flow_lpm`, litres/minute),
+the adapter does not report it. Outside its mode, during defrost, or
+below `min_power_w` electrical, thermal power and COP read 0.
+"""
+
+import time
+
+import hp_registers as regs
+
+CP_WATER = 4186.0          # J/(kg*K)
+DENSITY_WATER = 1.0        # kg/L
+
+
+class RollingMean:
+    """Mean of the last n samples, O(1) per push."""
+
+    def __init__(self, n):
+        self._buf = [0.0] * n
+        self._i = 0
+        self.count = 0
+        self._sum = 0.0
+
+    def push(self, value):
+        i = self._i
+        self._sum += value - self._buf[i]
+        self._buf[i] = value
+        self._i = (i + 1) % len(self._buf)
+        if self.count < len(self._buf):
+            self.count += 1
+        if self._i == 0:
+            self._sum = sum(self._buf)       # drop float drift once per lap
+
+    @property
+    def mean(self):
+        return self._sum / self.count if self.count else None
+
+
+class DerivedPower:
+    """Derived power/COP states for one pump, fed with decoded 0143 records."""
+
+    def __init__(self, publish, flow_lpm=None, power_factor=1.0, window=10, interval=30.0,
+                 min_power_w=50.0, clock=time.monotonic):
+        self._publish = publish          # callable(state id, value)
+        self.flow_kg_s = float(flow_lpm) * DENSITY_WATER / 60.0 if flow_lpm else None
+        self.power_factor = float(power_factor)
+        self.interval = float(interval)
+        self.min_power_w = float(min_power_w)
+        self._clock = clock
+        self._next = 0.0
+        self.electrical = RollingMean(window)
+        self.heating = RollingMean(window)
+        self.cooling = RollingMean(window)
+        self.values = {}                 # last published {state id: value}
+
+    @property
+    def sids(self):
+        """State ids this stage publishes (thermal/COP only with a flow rate)."""
+        return regs.DERIVED_SIDS if self.flow_kg_s else regs.DERIVED_SIDS[:1]
+
+    def update(self, rec, now=None):
+        """Push one 0143 record; publishes when the cadence is due."""
+        v, a = rec.voltage, rec.current
+        if v is not None and a is not None and v == v and a == a:
+            self.electrical.push(v * a * self.power_factor)
+        if self.flow_kg_s:
+            heat = cool = 0.0
+            t_out, t_in = rec.outlet_temp, rec.inlet_temp
+            if (t_out is not None and t_in is not None and t_out == t_out and t_in == t_in
+                    and rec.defrost_state != 1.0):
+                w = self.flow_kg_s * CP_WATER * (t_out - t_in)
+                if rec.heating_state == 1.0 or rec.dhw_state == 1.0:
+                    heat = max(w, 0.0)
+                elif rec.cooling_state == 1.0:
+                    cool = max(-w, 0.0)
+            self.heating.push(heat)
+            self.cooling.push(cool)
+        now = self._clock() if now is None else now
+        if now >= self._next:
+            self._next = now + self.interval
+            self.publish()
+
+    def _cop(self, thermal, electrical):
+        if thermal is None or electrical is None or electrical < self.min_power_w:
+            return 0.0
+        return thermal / electrical
+
+    def publish(self):
+        elec = self.electrical.mean
+        if elec is None:
+            return
+        out = {"electrical_power_w": round(elec)}
+        if self.flow_kg_s:
+            heat, cool = self.heating.mean, self.cooling.mean
+            out["thermal_power_heating_w"] = round(heat)
+            out["thermal_power_cooling_w"] = round(cool)
+            out["cop_heating"] = round(self._cop(heat, elec), 2)
+            out["cop_cooling"] = round(self._cop(cool, elec), 2)
+        self.values = out
+        for sid, value in out.items():
+            self._publish(sid, value)
@@ -0,0 +1,99 @@
+# /config/apps/hp_discovery.py
+"""Idempotent MQTT discovery publishing.
+
+Discovery configs are built once and hashed. sync() subscribes briefly to
+exactly those config topics, hashes the retained copies the broker sends
+back and publishes only configs that are missing or different, without
+sleeping between messages (paho pipelines them on its network thread).
+A restart with nothing changed publishes nothing.
+
+start() runs sync() on a short-lived thread so that callers (AppDaemon
+initialize, paho on_connect) are not held up by the read-back window.
+"""
+
+import hashlib
+import threading
+import time
+
+
+def _digest(payload):
+    if isinstance(payload, str):
+        payload = payload.encode()
+    return hashlib.sha1(payload).digest()
+
+
+class DiscoverySync:
+    """Publishes retained discovery configs only when the broker's copy differs."""
+
+    def __init__(self, client, configs=(), wait=1.0, log=None):
+        self.client = client
+        self.wait = wait                 # s to wait for retained copies after subscribing
+        self._log = log or (lambda msg, level="INFO": None)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.published = 0
+        self.unchanged = 0
+        self.last_sync_s = None
+        self.set(configs)
+
+    def set(self, configs):
+        """configs: iterable of (topic, JSON string); replaces the current set."""
+        self.configs = dict(configs)
+        self.digests = {topic: _digest(p) for topic, p in self.configs.items()}
+
+    def _read_retained(self):
+        """{topic: digest} of the retained configs currently on the broker."""
+        if not self.configs or not self.wait:
+            return {}
+        seen = {}
+        done = threading.Event()
+        wanted = len(self.configs)
+
+        def on_message(client, userdata, msg):
+            if msg.topic in self.digests:
+                seen[msg.topic] = _digest(msg.payload)
+                if len(seen) >= wanted:
+                    done.set()
+
+        topics = list(self.configs)
+        filters = {t.split("/", 1)[0] + "/#" for t in topics}
+        for f in filters:
+            self.client.message_callback_add(f, on_message)
+        try:
+            self.client.subscribe([(t, 0) for t in topics])
+            done.wait(self.wait)
+            self.client.unsubscribe(topics)
+        finally:
+            for f in filters:
+                self.client.message_callback_remove(f)
+        return seen
+
+    def sync(self, force=False):
+        """Publish new/changed configs (all of them with force). Returns the count published."""
+        with self._lock:
+            t0 = time.monotonic()
+            broker = {} if force else self._read_retained()
+            n = 0
+            for topic, payload in self.configs.items():
+                if broker.get(topic) == self.digests[topic]:
+                    continue
+                self.client.publish(topic, payload, retain=True)
+                n += 1
+            self.published += n
+            self.unchanged += len(self.configs) - n
+            self.last_sync_s = time.monotonic() - t0
+            self._log(f"Discovery: {n} published, {len(self.configs) - n} unchanged "
+                      f"({self.last_sync_s * 1000:.0f} ms)", "INFO")
+            return n
+
+    def start(self, force=False):
+        """sync() on a background thread."""
+        self._thread = threading.Thread(target=self._run, args=(force,), name="hp_discovery", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def _run(self, force):
+        try:
+            self.sync(force)
+        except Exception as e:
+            self._log(f"Discovery sync error: {e}", "ERROR")
@@ -0,0 +1,370 @@
+# /config/apps/hp_export.py
+"""Columnar export of recorded frames and SQLite history (Parquet / Arrow IPC).
+
+One file per packet (realtime.parquet, settings.parquet, or .arrow), one
+column per register with its wire type (float32, uint8, int16, uint16),
+plus `ts` (UTC timestamp) and `device`:
+
+    python hp_export.py captures/ --out export/                      # .hpcap segments
+    python hp_export.py dump.pcap --out export/ --format arrow       # adapter TCP port
+    python hp_export.py /config/heatpump.db --out export/ --since -2592000
+
+Sources are streamed in chunks of `--chunk` frames, so memory does not
+grow with the input. Frames are not decoded one by one: the parameters
+of a chunk are copied into one (frames x row) byte matrix and each
+register is read with a single NumPy strided view (offset = register
+offset, stride = row length). A frame too short for a register gives a
+null there, as hp_registers.decode() gives None.
+
+Needs numpy and pyarrow (pip install numpy pyarrow); nothing else in the
+bridge does.
+"""
+
+import argparse
+import mmap
+import os
+import sqlite3
+import sys
+import time
+from array import array
+
+import hp_registers as regs
+from hp_capture import CaptureReader, list_segments
+from hp_decode import TYPES
+from hp_framing import PARAM_OFFSET, FrameBuffer
+from hp_replay import pcap_source
+from hp_sqlite import COLUMNS, TABLES
+
+np = pa = None
+
+# wire type -> (NumPy dtype, Arrow type name)
+DTYPES = {
+    "f32": ("<f4", "float32"),
+    "u8":  ("u1", "uint8"),
+    "i16": ("<i2", "int16"),
+    "u16": ("<u2", "uint16"),
+}
+
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+SQLITE_SUFFIXES = (".db", ".sqlite", ".sqlite3")
+
+
+def _require(arrow=True):
+    """Import numpy (and pyarrow) on first use, with an actionable error."""
+    global np, pa
+    try:
+        if np is None:
+            import numpy
+            np = numpy
+        if arrow and pa is None:
+            import pyarrow
+            pa = pyarrow
+    except ImportError as e:
+        need = "numpy pyarrow" if arrow else "numpy"
+        raise ImportError(f"{e.name} is missing: pip install {need}") from None
+
+
+def packet_fields(packet):
+    """(sid, offset, wire type) per register of a packet, in decode order."""
+    return tuple((r.sid, r.offset, r.type) for r in regs.by_packet(packet))
+
+
+def row_size(packet):
+    """Parameter bytes covering every register of a packet."""
+    return max(off + TYPES[typ][1] for _, off, typ in packet_fields(packet))
+
+
+def schema(packet):
+    _require()
+    return pa.schema([pa.field("ts", pa.timestamp("ms", tz="UTC")),
+                      pa.field("device", pa.dictionary(pa.int32(), pa.string()))]
+                     + [pa.field(sid, getattr(pa, DTYPES[typ][1])()) for sid, _, typ in packet_fields(packet)])
+
+
+#
+# ---------------------- Vectorized decode ----------------------
+#
+def packed_layout(packet):
+    """Parameter byte positions actually read by a packet's registers, and each register's column there."""
+    positions, column = [], {}
+    for sid, off, typ in packet_fields(packet):
+        column[sid] = len(positions) if off not in positions else positions.index(off)
+        positions.extend(b for b in range(off, off + TYPES[typ][1]) if b not in positions)
+    return positions, column
+
+
+def columns(packet, matrix, lengths, column=None):
+    """{sid: (values, null mask or None)} from an (n, row) uint8 matrix, one strided view per register.
+
+    column maps registers to their first byte in a row (default: the register offset)."""
+    n, width = matrix.shape
+    out = {}
+    for sid, off, typ in packet_fields(packet):
+        at = off if column is None else column[sid]
+        view = np.ndarray((n,), dtype=DTYPES[typ][0], buffer=matrix, offset=at, strides=(width,))
+        missing = lengths < off + TYPES[typ][1]
+        out[sid] = (np.ascontiguousarray(view), missing if missing.any() else None)
+    return out
+
+
+def record_batch(packet, ts, device, matrix, lengths, column=None):
+    """Arrow batch from wall times (epoch s), parameter rows and their real lengths."""
+    ms = (ts * 1000).astype(np.int64)
+    arrays = [pa.array(ms, type=pa.timestamp("ms", tz="UTC")),
+              pa.DictionaryArray.from_arrays(pa.array(np.zeros(len(ms), np.int32)), pa.array([device]))]
+    for values, missing in columns(packet, matrix, lengths, column).values():
+        arrays.append(pa.array(values, mask=missing))
+    return pa.record_batch(arrays, schema=schema(packet))
+
+
+class FrameBlock:
+    """Parameters of a chunk of frames of one packet, copied into a fixed-width byte matrix."""
+
+    def __init__(self, packet, width=None):
+        self.packet = packet
+        self.width = width or row_size(packet)
+        self._pad = bytes(self.width)
+        self.clear()
+
+    def __len__(self):
+        return len(self.ts)
+
+    def add(self, ts, params):
+        n = len(params)
+        self.ts.append(ts)
+        self.lengths.append(n)
+        if n >= self.width:
+            self.data += params[:self.width]
+        else:
+            self.data += params
+            self.data += self._pad[n:]
+
+    def clear(self):
+        self.ts = array("d")
+        self.lengths = array("H")
+        self.data = bytearray()
+
+    def take(self):
+        """(wall times, (n, width) matrix, parameter lengths), then start a new chunk."""
+        out = (np.frombuffer(self.ts, dtype=np.float64),
+               np.frombuffer(self.data, dtype=np.uint8).reshape(len(self.ts), self.width),
+               np.frombuffer(self.lengths, dtype=np.uint16))
+        self.clear()
+        return out
+
+
+def gather(data, offsets, positions, step=16384):
+    """(n, len(positions)) uint8 matrix of data[offset + positions] per row (clipped at the end of data)."""
+    cols = np.asarray(positions, dtype=np.intp)
+    out = np.empty((len(offsets), len(cols)), dtype=np.uint8)
+    last = len(data) - 1
+    for i in range(0, len(offsets), step):
+        idx = offsets[i:i + step, None] + cols
+        np.minimum(idx, last, out=idx)
+        out[i:i + step] = data[idx]
+    return out
+
+
+#
+# ---------------------- Sources ----------------------
+#
+def capture_chunks(path, positions, start=None, end=None, chunk=65536):
+    """(packet, wall times, byte matrix, parameter lengths) per chunk of a capture directory or segment.
+
+    positions maps each packet to the parameter bytes wanted, one matrix
+    column each. Segments are mmapped and only the record headers are
+    walked in Python; NumPy gathers those bytes, not whole frames.
+    """
+    _require(arrow=False)
+    for seg in list_segments(path) if os.path.isdir(path) else [path]:
+        reader = CaptureReader(seg)
+        with open(seg, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            data = np.frombuffer(mm, dtype=np.uint8)
+            pending = {p: (array("q"), array("q"), array("l")) for p in positions}
+
+            def take(packet):
+                mono, offs, lens = (np.frombuffer(a, dtype=a.typecode) for a in pending[packet])
+                pending[packet] = (array("q"), array("q"), array("l"))
+                return (packet, reader.wall_start + (mono - reader.mono_start) / 1e9,
+                        gather(data, offs + PARAM_OFFSET, positions[packet]),
+                        np.maximum(lens - PARAM_OFFSET, 0))
+
+            try:
+                for ts, cmd, off, length in reader.scan(mm, start, end):
+                    rows = pending.get(cmd)
+                    if rows is None:
+                        continue
+                    rows[0].append(ts)
+                    rows[1].append(off)
+                    rows[2].append(length)
+                    if len(rows[0]) >= chunk:
+                        yield take(cmd)
+                for packet, rows in list(pending.items()):
+                    if rows[0]:
+                        yield take(packet)
+            finally:
+                data = None  # release the buffer (also held by take) before the mmap closes
+
+
+def pcap_chunks(path, positions, start=None, end=None, chunk=65536, port=8899):
+    """Same as capture_chunks() for the frames reassembled out of a pcap of the adapter port."""
+    _require(arrow=False)
+    buf = FrameBuffer()
+    blocks = {p: FrameBlock(p, max(pos) + 1) for p, pos in positions.items()}
+    cols = {p: np.asarray(pos, dtype=np.intp) for p, pos in positions.items()}
+
+    def take(packet):
+        ts, matrix, lengths = blocks[packet].take()
+        return packet, ts, matrix[:, cols[packet]], lengths
+
+    for ts, data in pcap_source(path, port):
+        buf.feed(data)
+        for cmd, params in buf.frames():
+            block = blocks.get(cmd)
+            if block is None or (start is not None and ts < start) or (end is not None and ts > end):
+                continue
+            block.add(ts, params)
+            if len(block) >= chunk:
+                yield take(cmd)
+    for packet, block in blocks.items():
+        if len(block):
+            yield take(packet)
+
+
+def frame_chunks(source, positions, start=None, end=None, chunk=65536, port=8899):
+    """capture_chunks() or pcap_chunks(), by file type."""
+    if source.endswith(".pcap"):
+        return pcap_chunks(source, positions, start, end, chunk, port)
+    return capture_chunks(source, positions, start, end, chunk)
+
+
+def frame_batches(source, device, start=None, end=None, chunk=65536, port=8899):
+    """(packet, RecordBatch) for the 0143/01B3 frames of a capture or pcap."""
+    _require()
+    layouts = {p: packed_layout(p) for p in TABLES}
+    positions = {p: layout[0] for p, layout in layouts.items()}
+    for packet, ts, matrix, lengths in frame_chunks(source, positions, start, end, chunk, port):
+        yield packet, record_batch(packet, ts, device, matrix, lengths, layouts[packet][1])
+
+
+def sqlite_batches(path, packet, device=None, start=None, end=None, chunk=65536):
+    """Record batches straight from an hp_sqlite table, fetched `chunk` rows at a time."""
+    _require()
+    fields = packet_fields(packet)
+    sch = schema(packet)
+    where, args = [], []
+    for clause, value in (("device = ?", device), ("ts >= ?", start), ("ts <= ?", end)):
+        if value is not None:
+            where.append(clause)
+            args.append(value)
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=30)
+    try:
+        have = {row[1] for row in conn.execute(f"PRAGMA table_info({TABLES[packet]})")}
+        cols = [sid if sid in have else "NULL" for sid in COLUMNS[packet]]
+        sql = f"SELECT ts, device, {', '.join(cols)} FROM {TABLES[packet]}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        cur = conn.execute(sql + " ORDER BY ts", args)
+        while True:
+            rows = cur.fetchmany(chunk)
+            if not rows:
+                return
+            cols = list(zip(*rows))
+            ts = (np.array(cols[0], dtype=np.float64) * 1000).astype(np.int64)
+            arrays = [pa.array(ts, type=pa.timestamp("ms", tz="UTC")),
+                      pa.array(cols[1], type=pa.string()).dictionary_encode()]
+            for (sid, _, typ), values in zip(fields, cols[2:]):
+                arrays.append(pa.array(values, type=pa.float64()).cast(getattr(pa, DTYPES[typ][1])(), safe=False))
+            yield pa.record_batch(arrays, schema=sch)
+    finally:
+        conn.close()
+
+
+#
+# ---------------------- Writers ----------------------
+#
+class Writers:
+    """One streaming writer per packet, opened on its first batch."""
+
+    def __init__(self, out_dir, fmt="parquet", compression="zstd"):
+        if fmt not in FORMATS:
+            raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+        self.out_dir = out_dir
+        self.fmt = fmt
+        self.compression = compression
+        self.rows = {}
+        self.paths = {}
+        self._writers = {}
+
+    def write(self, packet, batch):
+        w = self._writers.get(packet)
+        if w is None:
+            os.makedirs(self.out_dir, exist_ok=True)
+            path = os.path.join(self.out_dir, TABLES[packet] + FORMATS[self.fmt])
+            if self.fmt == "parquet":
+                import pyarrow.parquet as pq
+                w = pq.ParquetWriter(path, batch.schema, compression=self.compression)
+            else:
+                import pyarrow.ipc
+                w = pyarrow.ipc.new_file(path, batch.schema)
+            self._writers[packet] = w
+            self.paths[packet] = path
+            self.rows[packet] = 0
+        w.write_table(pa.Table.from_batches([batch]))
+        self.rows[packet] += batch.num_rows
+
+    def close(self):
+        for w in self._writers.values():
+            w.close()
+        self._writers = {}
+
+
+def export(source, out_dir, fmt="parquet", device=None, start=None, end=None, port=8899,
+           chunk=65536, compression="zstd"):
+    """Convert a capture, pcap or SQLite database; returns {table: (path, rows)}."""
+    _require()
+    writers = Writers(out_dir, fmt, compression)
+    try:
+        if source.endswith(SQLITE_SUFFIXES):
+            for packet in TABLES:
+                for batch in sqlite_batches(source, packet, device, start, end, chunk):
+                    writers.write(packet, batch)
+        else:
+            name = device or os.path.splitext(os.path.basename(os.path.normpath(source)))[0]
+            for packet, batch in frame_batches(source, name, start, end, chunk, port):
+                writers.write(packet, batch)
+    finally:
+        writers.close()
+    return {TABLES[p]: (writers.paths[p], writers.rows[p]) for p in writers.paths}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("source", help="capture directory, .hpcap segment, .pcap file or SQLite database")
+    ap.add_argument("--out", required=True, help="output directory")
+    ap.add_argument("--format", choices=tuple(FORMATS), default="parquet")
+    ap.add_argument("--compression", default="zstd", help="Parquet codec (zstd, snappy, gzip, none)")
+    ap.add_argument("--device", help="SQLite: only this device; frames: value of the device column")
+    ap.add_argument("--since", type=float, help="epoch seconds, or seconds before now when negative")
+    ap.add_argument("--until", type=float, help="epoch seconds, or seconds before now when negative")
+    ap.add_argument("--port", type=int, default=8899, help="adapter TCP port in the pcap")
+    ap.add_argument("--chunk", type=int, default=65536, help="frames per record batch")
+    args = ap.parse_args(argv)
+
+    now = time.time()
+    when = lambda t: None if t is None else (now + t if t < 0 else t)
+    t0 = time.perf_counter()
+    try:
+        result = export(args.source, args.out, args.format, args.device, when(args.since), when(args.until),
+                        args.port, args.chunk, None if args.compression == "none" else args.compression)
+    except ImportError as e:
+        print(e, file=sys.stderr)
+        return 2
+    for table, (path, rows) in result.items():
+        print(f"{table}: {rows} rows -> {path}")
+    print(f"elapsed_s: {time.perf_counter() - t0:.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
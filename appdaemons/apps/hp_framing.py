@@ -0,0 +1,111 @@
+# /config/apps/hp_framing.py
+"""Frame reassembly for the USR-C210 TCP stream.
+
+TCP does not preserve packet boundaries: one recv() may hold half of a
+0x01B3 frame, or a 0x0143 frame followed by the start of the next one.
+FrameBuffer keeps a preallocated buffer filled with recv_into() and cuts
+complete frames out of it using the length field in the frame header.
+
+Frame layout (as seen on socket A of the adapter):
+
+    0 .. 9    header bytes
+    10 .. 11  frame length, big-endian (bytes following the 12-byte header)
+    12        command byte (0x01 realtime, 0x02 settings, 0x05 heartbeat)
+    13 ..     parameters
+
+The "0143"/"01B3" packet names are the values of that length field.
+"""
+
+import struct
+
+HEADER_LEN = 12       # bytes before the command byte
+CMD_OFFSET = 12
+PARAM_OFFSET = 13
+LEN_OFFSET = 10
+MAX_FRAME = 2048
+
+_LEN = struct.Struct(">H")
+
+
+class FrameBuffer:
+    """Preallocated receive buffer that yields complete frames exactly once."""
+
+    def __init__(self, capacity=8192, max_frame=MAX_FRAME):
+        if capacity < max_frame:
+            raise ValueError("capacity must be at least max_frame")
+        self._buf = bytearray(capacity)
+        self._view = memoryview(self._buf)
+        self._r = 0          # start of unread data
+        self._w = 0          # end of unread data
+        self.max_frame = max_frame
+        self.dropped = 0     # bytes discarded while resyncing
+
+    def __len__(self):
+        return self._w - self._r
+
+    def _compact(self):
+        n = self._w - self._r
+        if n and self._r:
+            self._buf[0:n] = self._buf[self._r:self._w]
+        self._r, self._w = 0, n
+
+    def writable(self):
+        """Free tail of the buffer, to receive into (recv_into, BufferedProtocol)."""
+        if self._w == len(self._buf):
+            self._compact()
+        return self._view[self._w:]
+
+    def advance(self, n):
+        """Mark n bytes written into writable() as received."""
+        self._w += n
+
+    def fill(self, sock):
+        """recv_into() the free tail of the buffer; returns bytes read (0 = EOF)."""
+        n = sock.recv_into(self.writable())
+        self._w += n
+        return n
+
+    def feed(self, data):
+        """Copy already-received bytes in (replay, asyncio protocols)."""
+        data = memoryview(data)
+        while len(data):
+            if self._w == len(self._buf):
+                self._compact()
+                if self._w == len(self._buf):
+                    raise BufferError("frame buffer full")
+            n = min(len(data), len(self._buf) - self._w)
+            self._buf[self._w:self._w + n] = data[:n]
+            self._w += n
+            data = data[n:]
+
+    def frames(self, raw=False):
+        """Yield (cmd, params) for each complete frame buffered so far.
+
+        params is a memoryview into the buffer: it is only valid until the
+        next fill()/feed(), so decoders must consume it before returning.
+        With raw=True, (cmd, params, frame) is yielded, frame being the whole
+        frame including its header.
+        """
+        view = self._view
+        while self._w - self._r > CMD_OFFSET:
+            start = self._r
+            size = HEADER_LEN + _LEN.unpack_from(self._buf, start + LEN_OFFSET)[0]
+            if size <= CMD_OFFSET or size > self.max_frame:
+                # Not a frame header: slide one byte and look again
+                self._r += 1
+                self.dropped += 1
+                continue
+            if self._w - start < size:
+                break
+            self._r = start + size
+            if raw:
+                yield self._buf[start + CMD_OFFSET], view[start + PARAM_OFFSET:start + size], view[start:start + size]
+            else:
+                yield self._buf[start + CMD_OFFSET], view[start + PARAM_OFFSET:start + size]
+        if self._r == self._w:
+            self._r = self._w = 0
+
+
+def build_frame(cmd, params, header=b"\x00" * LEN_OFFSET):
+    """Assemble a raw frame around params (simulators and tests)."""
+    return bytes(header[:LEN_OFFSET]) + _LEN.pack(len(params) + 1) + bytes((cmd,)) + bytes(params)
@@ -0,0 +1,138 @@
+# /config/apps/hp_history.py
+"""In-process history of the 0x0143 sensors at frame resolution.
+
+One fixed-size ring per pump, allocated up front:
+
+    timestamps  array('d')  8 bytes per row  (epoch seconds)
+    per sensor  array('f')  4 bytes per row  (float32, NaN = missing)
+
+so memory is rows * (8 + 4 * sensors) whatever happens, with
+rows = history_hours * 3600 / history_frame_s. If frames arrive faster
+than history_frame_s the ring simply covers a shorter span (reported
+as span_s). Range lookups are a binary search on the timestamps; values
+are copied out with array slices under a short lock, so HTTP queries do
+not hold up the socket loop.
+"""
+
+import math
+import threading
+import time
+from array import array
+
+import hp_registers as regs
+
+SENSORS = tuple(r.sid for r in regs.by_packet(regs.REALTIME))
+_NAN = float("nan")
+
+
+def ring_bytes(rows, sensors=len(SENSORS)):
+    """Memory of a ring: 8-byte timestamp + one float32 per sensor, per row."""
+    return rows * (8 + 4 * sensors)
+
+
+class SeriesRing:
+    """Fixed-capacity ring of (timestamp, one float32 per sensor) rows."""
+
+    def __init__(self, capacity, sids=SENSORS):
+        if capacity < 1:
+            raise ValueError("capacity must be positive")
+        self.sids = tuple(sids)
+        self.column = {sid: i for i, sid in enumerate(self.sids)}
+        self.capacity = capacity
+        self.ts = array("d", [0.0]) * capacity
+        self.cols = [array("f", [_NAN]) * capacity for _ in self.sids]
+        self.size = 0
+        self._head = 0                   # next slot to write
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        return self.ts.itemsize * len(self.ts) + sum(c.itemsize * len(c) for c in self.cols)
+
+    def append(self, t, values):
+        """Add one row; values are aligned with sids (None -> NaN)."""
+        with self._lock:
+            h = self._head
+            if self.size:
+                last = self.ts[(h - 1) % self.capacity]
+                if t < last:
+                    t = last                 # keep timestamps sorted if the wall clock steps back
+            self.ts[h] = t
+            for col, v in zip(self.cols, values):
+                col[h] = _NAN if v is None else v
+            self._head = (h + 1) % self.capacity
+            if self.size < self.capacity:
+                self.size += 1
+
+    def append_record(self, rec, t=None):
+        """Append a decoded 0143 record (its fields are in SENSORS order)."""
+        self.append(time.time() if t is None else t, rec)
+
+    # ---- Lookups (caller holds the lock) ----
+    def _start(self):
+        return (self._head - self.size) % self.capacity
+
+    def _bisect(self, t):
+        """First logical row with timestamp >= t."""
+        lo, hi, start, cap = 0, self.size, self._start(), self.capacity
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.ts[(start + mid) % cap] < t:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _slice(self, arr, i0, i1):
+        p0, n = (self._start() + i0) % self.capacity, i1 - i0
+        if p0 + n <= self.capacity:
+            return arr[p0:p0 + n]
+        return arr[p0:] + arr[:p0 + n - self.capacity]
+
+    def window(self, sid, start=None, end=None):
+        """(timestamps, values) arrays for start <= t <= end; KeyError for an unknown sensor."""
+        col = self.cols[self.column[sid]]
+        with self._lock:
+            i0 = 0 if start is None else self._bisect(start)
+            i1 = self.size if end is None else self._bisect(math.nextafter(end, math.inf))
+            if i1 <= i0:
+                return array("d"), array("f")
+            return self._slice(self.ts, i0, i1), self._slice(col, i0, i1)
+
+    # ---- Queries ----
+    def query(self, sid, start=None, end=None, step=None, limit=5000):
+        """[[t, value], ...]; averaged into `step` s buckets, else thinned to at most `limit` points."""
+        ts, vs = self.window(sid, start, end)
+        if step:
+            out, bucket, acc, n = [], None, 0.0, 0
+            for t, v in zip(ts, vs):
+                if v != v:
+                    continue
+                b = t - t % step
+                if b != bucket:
+                    if n:
+                        out.append([bucket, acc / n])
+                    bucket, acc, n = b, 0.0, 0
+                acc += v
+                n += 1
+            if n:
+                out.append([bucket, acc / n])
+            return out
+        stride = max(1, -(-len(ts) // limit)) if limit else 1
+        return [[t, v] for t, v in zip(ts[::stride], vs[::stride]) if v == v]
+
+    def aggregate(self, sid, start=None, end=None):
+        """min / max / mean / last / count over a range."""
+        ts, vs = self.window(sid, start, end)
+        vals = [v for v in vs if v == v]
+        if not vals:
+            return {"count": 0}
+        return {"count": len(vals), "min": min(vals), "max": max(vals),
+                "mean": sum(vals) / len(vals), "last": vals[-1],
+                "first_ts": ts[0], "last_ts": ts[-1]}
+
+    def info(self):
+        with self._lock:
+            span = self.ts[(self._head - 1) % self.capacity] - self.ts[self._start()] if self.size else 0.0
+        return {"sensors": list(self.sids), "capacity": self.capacity, "rows": self.size,
+                "span_s": round(span, 1), "bytes": self.nbytes}
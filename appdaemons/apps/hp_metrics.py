@@ -0,0 +1,214 @@
+# /config/apps/hp_metrics.py
+"""Prometheus text-format metrics for the bridge.
+
+Hot-path counters are plain attributes and preallocated lists indexed by
+command byte: counting a frame is two list stores, timing a decode is one
+bisect into a fixed-bucket Histogram. Nothing is allocated per sample;
+the text exposition is only built when /metrics is scraped.
+
+    curl -s http://127.0.0.1:9105/metrics
+
+The server is the stdlib ThreadingHTTPServer on a daemon thread
+("hp_metrics"), so a slow scrape never touches the socket loop.
+"""
+
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Decode of one packet takes tens of microseconds; buckets in seconds
+DECODE_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 5e-3)
+
+
+class Histogram:
+    """Fixed-bucket histogram with O(1) memory."""
+
+    BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)   # last slot = +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """[(upper bound, observations <= bound), ...] ending with +Inf."""
+        out, total = [], 0
+        for le, n in zip(self.buckets + (float("inf"),), self.counts):
+            total += n
+            out.append((le, total))
+        return out
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (None when empty)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        for le, total in self.cumulative():
+            if total >= rank:
+                return le
+        return float("inf")
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 3),
+            "buckets": {("+Inf" if le == float("inf") else str(le)): n for le, n in self.cumulative()},
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+        }
+
+
+class PumpMetrics:
+    """Frame counters of one adapter connection."""
+
+    def __init__(self, device_id, decoded=(0x01, 0x02)):
+        self.device_id = device_id
+        self.frames = [0] * 256          # per command byte
+        self.last_frame = [0.0] * 256    # monotonic time of the last frame, 0 = never
+        self.unknown = 0                 # frames with a command byte the bridge does not handle
+        self.decode = {cmd: Histogram(DECODE_BUCKETS) for cmd in decoded}
+
+    def frame(self, cmd, now):
+        self.frames[cmd] += 1
+        self.last_frame[cmd] = now
+
+
+def _fmt(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    body = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+                    for k, v in labels.items())
+    return "{" + body + "}"
+
+
+class Exposition:
+    """Builds a Prometheus text exposition; samples are grouped by family."""
+
+    def __init__(self, prefix="heatpump_"):
+        self.prefix = prefix
+        self._families = {}      # name -> [HELP, TYPE, samples...]
+
+    def _family(self, name, kind, help_text):
+        name = self.prefix + name
+        if name not in self._families:
+            self._families[name] = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        return name, self._families[name]
+
+    def counter(self, name, help_text, value, **labels):
+        name, lines = self._family(name, "counter", help_text)
+        lines.append(f"{name}{_labels(labels)} {_fmt(value)}")
+
+    def gauge(self, name, help_text, value, **labels):
+        if value is None:
+            return
+        name, lines = self._family(name, "gauge", help_text)
+        lines.append(f"{name}{_labels(labels)} {_fmt(value)}")
+
+    def histogram(self, name, help_text, hist, **labels):
+        name, lines = self._family(name, "histogram", help_text)
+        for le, n in hist.cumulative():
+            lines.append(f"{name}_bucket{_labels(dict(labels, le=_fmt(float(le))))} {n}")
+        lines.append(f"{name}_sum{_labels(labels)} {_fmt(hist.sum)}")
+        lines.append(f"{name}_count{_labels(labels)} {hist.count}")
+
+    def text(self):
+        return "\n".join(line for lines in self._families.values() for line in lines) + "\n"
+
+
+def frame_metrics(out, pm, now=None):
+    """Add the frame counters of one PumpMetrics to an Exposition."""
+    now = time.monotonic() if now is None else now
+    dev = pm.device_id
+    for cmd in range(256):
+        if pm.frames[cmd]:
+            out.counter("frames_total", "Frames received per command byte",
+                        pm.frames[cmd], device=dev, cmd=f"0x{cmd:02X}")
+    for cmd in range(256):
+        if pm.last_frame[cmd]:
+            out.gauge("last_frame_age_seconds", "Seconds since the last frame of this command byte",
+                      now - pm.last_frame[cmd], device=dev, cmd=f"0x{cmd:02X}")
+    out.counter("unknown_frames_total", "Frames with an unhandled command byte", pm.unknown, device=dev)
+    for cmd, hist in pm.decode.items():
+        out.histogram("decode_seconds", "Time to decode one packet", hist, device=dev, cmd=f"0x{cmd:02X}")
+
+
+class MetricsServer:
+    """Serves render() as text on GET /metrics from a daemon thread.
+
+    Other read-only endpoints can be added with route(path, fn), where
+    fn(query dict) returns (status, content type, body); a ValueError
+    from fn becomes a 400 with its message.
+    """
+
+    def __init__(self, render, host="0.0.0.0", port=9105, log=None):
+        self._log = log or (lambda msg, level="INFO": None)
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+        self.routes = {"/metrics": lambda query: (200, CONTENT_TYPE, render())}
+        self.routes["/"] = self.routes["/metrics"]
+
+    def route(self, path, fn):
+        self.routes[path] = fn
+        return self
+
+    def start(self):
+        routes, log = self.routes, self._log
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlsplit(self.path)
+                fn = routes.get(url.path)
+                if fn is None:
+                    self.send_error(404)
+                    return
+                try:
+                    status, ctype, body = fn(dict(parse_qsl(url.query)))
+                    body = body.encode()
+                except ValueError as e:
+                    self.send_error(400, str(e))
+                    return
+                except Exception as e:
+                    log(f"HTTP {url.path} error: {e}", "ERROR")
+                    self.send_error(500)
+                    return
+                self.send_response(status)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, fmt, *args):
+                pass     # no access log per scrape
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]     # actual port when 0 was asked for
+        self._thread = threading.Thread(target=self._server.serve_forever, name="hp_metrics", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
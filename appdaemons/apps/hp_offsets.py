@@ -0,0 +1,300 @@
+# /config/apps/hp_offsets.py
+"""Offset discovery over many recorded 0x0143 / 0x01B3 payloads.
+
+Every position of the payload is decoded for all frames at once
+(NumPy, one column per candidate):
+
+    f32  every 4 bytes on the register grid (offset % 4 of the known floats)
+    u8   every byte
+    i16  every byte
+
+and candidates are ranked three ways:
+
+  - variance:  what moves at all, leaving out the bytes of known
+               registers and of plausible moving floats (their bytes
+               would only show up again as u8/i16 noise)
+  - known:     Pearson correlation with the decoded known registers,
+               e.g. a second copy of a temperature or a raw frequency
+  - events:    correlation with labelled time ranges ("defrost ran from
+               .. to .."), known registers included, so a `??` offset
+               can be confirmed or replaced
+
+    python hp_offsets.py captures/ --packet 0143 --event defrost=2024-01-10T06:12..2024-01-10T06:19
+    python hp_offsets.py dump.pcap --packet 01B3 --events labels.csv --json
+
+labels.csv holds `name,start,end` rows (epoch seconds or ISO 8601).
+Needs numpy (pip install numpy).
+"""
+
+import argparse
+import csv
+import json
+import sys
+import time
+import warnings
+from collections import Counter
+from datetime import datetime
+
+import hp_export
+import hp_registers as regs
+from hp_decode import TYPES
+
+np = None
+
+# Parameter bytes of each packet: the "0143" / "01B3" length field minus the command byte
+PAYLOAD_SIZES = {p: int(name, 16) - 1 for p, name in regs.PACKET_NAMES.items()}
+PACKETS = {name: p for p, name in regs.PACKET_NAMES.items()}
+
+# A float outside these magnitudes (or NaN/inf) is treated as "not a float here"
+F32_RANGE = (1e-3, 1e5)
+
+
+def _require():
+    global np
+    hp_export._require(arrow=False)
+    np = hp_export.np
+
+
+def float_phase(packet):
+    """offset % 4 shared by most known float registers of a packet (2 for both)."""
+    return Counter(r.offset % 4 for r in regs.by_packet(packet) if r.type == "f32").most_common(1)[0][0]
+
+
+def parse_time(text):
+    """Epoch seconds or ISO 8601 (local time unless an offset is given)."""
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.fromisoformat(text.strip()).timestamp()
+
+
+def parse_event(text):
+    """'name=START..END' -> (name, start, end)."""
+    name, _, span = text.partition("=")
+    start, sep, end = span.partition("..")
+    if not name or not sep:
+        raise ValueError(f"bad event {text!r}, expected name=START..END")
+    return name.strip(), parse_time(start), parse_time(end)
+
+
+def read_events(path):
+    """(name, start, end) per `name,start,end` row of a CSV file; # comments allowed."""
+    with open(path, newline="", encoding="utf-8") as f:
+        return [(row[0].strip(), parse_time(row[1]), parse_time(row[2]))
+                for row in csv.reader(f) if row and not row[0].startswith("#")]
+
+
+#
+# ---------------------- Loading ----------------------
+#
+def load(source, packet, start=None, end=None, limit=50000, every=1, port=8899):
+    """(wall times, (n, payload) uint8 matrix, short frames skipped) for up to `limit` frames.
+
+    every=N keeps one frame in N, to spread `limit` over a longer capture.
+    """
+    _require()
+    size = PAYLOAD_SIZES[packet]
+    ts_parts, rows, short, seen, n = [], [], 0, 0, 0
+    for _, ts, matrix, lengths in hp_export.frame_chunks(source, {packet: range(size)}, start, end, port=port):
+        keep = (seen + np.arange(len(ts))) % every == 0
+        seen += len(ts)
+        whole = lengths >= size
+        short += int(np.count_nonzero(keep & ~whole))
+        keep &= whole
+        ts_parts.append(ts[keep][:limit - n])
+        rows.append(matrix[keep][:limit - n])
+        n += len(ts_parts[-1])
+        if n >= limit:
+            break
+    if not n:
+        return np.zeros(0), np.zeros((0, size), np.uint8), short
+    return np.concatenate(ts_parts), np.concatenate(rows), short
+
+
+#
+# ---------------------- Candidates ----------------------
+#
+class Candidates:
+    """Every candidate decoding of a payload matrix as float32 columns (NaN = implausible)."""
+
+    def __init__(self, packet, matrix, min_plausible=0.99):
+        n, w = matrix.shape
+        phase = float_phase(packet)
+        k = (w - phase) // 4
+        f32 = np.ascontiguousarray(matrix[:, phase:phase + 4 * k]).view("<f4").astype(np.float32)
+        with np.errstate(invalid="ignore", over="ignore"):
+            mag = np.abs(f32)
+            bad = ~np.isfinite(f32) | ((f32 != 0) & ((mag < F32_RANGE[0]) | (mag > F32_RANGE[1])))
+        f32[bad] = np.nan
+        plausible = 1.0 - bad.mean(axis=0) if n else np.zeros(k)
+        u8 = matrix.astype(np.float32)
+        i16 = (matrix[:, :-1].astype(np.uint16) | (matrix[:, 1:].astype(np.uint16) << 8)).view(np.int16)
+
+        known = {(r.offset, r.type): r.sid for r in regs.by_packet(packet)}
+        covered = np.zeros(w + 1, bool)
+        for r in regs.by_packet(packet):
+            covered[r.offset:r.offset + TYPES[r.type][1]] = True
+
+        # Floats first: a moving, plausible float claims its 4 bytes
+        f_off = np.arange(phase, phase + 4 * k, 4)
+        f_known = np.array([(o, "f32") in known for o in f_off], bool)
+        f_keep = ((plausible >= min_plausible) | f_known) & self._moving(f32)
+        for o in f_off[f_keep]:
+            covered[o:o + 4] = True
+        u_off = np.arange(w)
+        u_moving = self._moving(u8)
+        u_keep = u_moving & (~covered[u_off] | np.array([(o, "u8") in known for o in u_off], bool))
+        # An int16 with a constant byte is only a u8 again
+        i_off = np.arange(w - 1)
+        i_keep = u_moving[:-1] & u_moving[1:] & ~covered[i_off] & ~covered[i_off + 1]
+
+        self.offsets = np.concatenate([f_off[f_keep], u_off[u_keep], i_off[i_keep]])
+        self.types = ["f32"] * int(f_keep.sum()) + ["u8"] * int(u_keep.sum()) + ["i16"] * int(i_keep.sum())
+        self.values = np.concatenate([f32[:, f_keep], u8[:, u_keep], i16[:, i_keep].astype(np.float32)], axis=1)
+        self.known = [known.get((int(o), t)) for o, t in zip(self.offsets, self.types)]
+        self.n = n
+
+    @staticmethod
+    def _moving(v):
+        if not len(v):
+            return np.zeros(v.shape[1], bool)
+        with np.errstate(invalid="ignore"):
+            lo, hi = np.fmin.reduce(v, axis=0), np.fmax.reduce(v, axis=0)
+        return hi > lo               # NaN (never plausible) compares False
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def label(self, i):
+        return f"{self.types[i]}@{int(self.offsets[i])}"
+
+    def zscores(self):
+        """Columns centred and scaled to unit variance (NaN -> 0), for correlations as Z.T @ z / n."""
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)      # all-NaN columns
+            mean = np.nanmean(self.values, axis=0)
+            z = self.values - mean
+            z[np.isnan(z)] = 0.0
+            std = np.sqrt((z * z).mean(axis=0))
+            z /= np.where(std > 0, std, 1.0)
+        return z, std
+
+
+#
+# ---------------------- Ranking ----------------------
+#
+def analyze(ts, matrix, packet, events=(), top=15, min_plausible=0.99):
+    """Rankings as a JSON-ready dict; events are (name, start, end) in epoch seconds."""
+    _require()
+    c = Candidates(packet, matrix, min_plausible)
+    out = {"packet": regs.PACKET_NAMES[packet], "frames": int(c.n), "candidates": len(c),
+           "span_s": round(float(ts[-1] - ts[0]), 1) if len(ts) else 0.0}
+    if not c.n or not len(c):
+        return out
+    z, std = c.zscores()
+    lo, hi = np.fmin.reduce(c.values, axis=0), np.fmax.reduce(c.values, axis=0)
+    changes = np.count_nonzero(np.diff(c.values, axis=0) != 0, axis=0)
+
+    def row(i, **extra):
+        d = {"candidate": c.label(i), "offset": int(c.offsets[i]), "type": c.types[i],
+             "std": round(float(std[i]), 4), "min": round(float(lo[i]), 4), "max": round(float(hi[i]), 4),
+             "changes": int(changes[i])}
+        if c.known[i]:
+            d["known"] = c.known[i]
+        d.update(extra)
+        return d
+
+    unknown = np.array([k is None for k in c.known])
+    idx = np.flatnonzero(unknown)
+    out["variance"] = [row(i) for i in idx[np.argsort(-std[idx], kind="stable")][:top]]
+
+    known_idx = np.flatnonzero(~unknown & (std > 0))
+    if len(idx) and len(known_idx):
+        r = z[:, idx].T @ z[:, known_idx] / c.n          # (unknown, known)
+        best = np.argmax(np.abs(r), axis=1)
+        strength = np.abs(r[np.arange(len(idx)), best])
+        order = np.argsort(-strength, kind="stable")[:top]
+        out["known"] = [row(idx[j], field=c.known[known_idx[best[j]]], r=round(float(r[j, best[j]]), 3))
+                        for j in order]
+
+    out["events"] = {}
+    for name, start, end in events:
+        on = (ts >= start) & (ts <= end)
+        hits = int(on.sum())
+        if not hits or hits == c.n:
+            out["events"][name] = {"frames": hits, "error": "label covers none or all of the frames"}
+            continue
+        e = (on - on.mean()) / on.std()
+        r = z.T @ e / c.n
+        order = np.argsort(-np.abs(r), kind="stable")[:top]
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            inside, outside = np.nanmean(c.values[on], axis=0), np.nanmean(c.values[~on], axis=0)
+        out["events"][name] = {"frames": hits, "top": [
+            row(i, r=round(float(r[i]), 3), mean_in=round(float(inside[i]), 4), mean_out=round(float(outside[i]), 4))
+            for i in order]}
+    return out
+
+
+def format_report(result):
+    """Plain-text tables for the terminal."""
+    lines = [f"{result['packet']}: {result['frames']} frames over {result['span_s']} s, "
+             f"{result['candidates']} moving candidates"
+             + (f", {result['short_frames']} short frames skipped" if result.get("short_frames") else "")]
+
+    def table(title, rows, extra):
+        if not rows:
+            return
+        lines.append("")
+        lines.append(title)
+        for d in rows:
+            tail = "  ".join(f"{k}={d[k]}" for k in extra if k in d)
+            known = f"  [{d['known']}]" if "known" in d else ""
+            lines.append(f"  {d['candidate']:<9} std={d['std']:<10} range={d['min']}..{d['max']}  "
+                         f"changes={d['changes']}  {tail}{known}")
+
+    table("Highest variance (unmapped):", result.get("variance"), ())
+    table("Correlated with known registers (unmapped):", result.get("known"), ("field", "r"))
+    for name, ev in result.get("events", {}).items():
+        if "error" in ev:
+            lines.append(f"\nEvent {name}: {ev['error']} ({ev['frames']} frames)")
+        else:
+            table(f"Event {name} ({ev['frames']} frames):", ev["top"], ("r", "mean_in", "mean_out"))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("source", help="capture directory, .hpcap segment or .pcap file")
+    ap.add_argument("--packet", choices=tuple(PACKETS), default="0143")
+    ap.add_argument("--event", action="append", default=[], help="name=START..END (epoch or ISO 8601), repeatable")
+    ap.add_argument("--events", help="CSV file of name,start,end rows")
+    ap.add_argument("--since", type=float, help="epoch seconds, or seconds before now when negative")
+    ap.add_argument("--until", type=float, help="epoch seconds, or seconds before now when negative")
+    ap.add_argument("--limit", type=int, default=50000, help="frames to analyze")
+    ap.add_argument("--every", type=int, default=1, help="keep one frame in N")
+    ap.add_argument("--top", type=int, default=15)
+    ap.add_argument("--min-plausible", type=float, default=0.99,
+                    help="share of frames a float must decode as a sane number to count")
+    ap.add_argument("--port", type=int, default=8899, help="adapter TCP port in the pcap")
+    ap.add_argument("--json", action="store_true", help="print the rankings as JSON")
+    args = ap.parse_args(argv)
+
+    now = time.time()
+    when = lambda t: None if t is None else (now + t if t < 0 else t)
+    try:
+        events = [parse_event(e) for e in args.event] + (read_events(args.events) if args.events else [])
+        packet = PACKETS[args.packet]
+        ts, matrix, short = load(args.source, packet, when(args.since), when(args.until),
+                                 args.limit, max(1, args.every), args.port)
+        result = analyze(ts, matrix, packet, events, args.top, args.min_plausible)
+    except (ImportError, ValueError, OSError) as e:
+        print(e, file=sys.stderr)
+        return 2
+    result["short_frames"] = short
+    print(json.dumps(result, indent=2) if args.json else format_report(result))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
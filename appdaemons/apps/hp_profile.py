@@ -0,0 +1,204 @@
+# /config/apps/hp_profile.py
+"""On-demand profiling of a running bridge.
+
+Nothing is instrumented until a window is started (MQTT topic
+heatpump/debug/profile), then for `seconds`:
+
+  - timers:  selected callables are swapped for timing wrappers
+             (count / total / max per stage), restored afterwards
+  - cpu:     cProfile on the I/O core loop thread, where frames are
+             received, decoded and published
+  - memory:  tracemalloc, top allocation growth over the window
+
+The summary is published as JSON on heatpump/debug/profile/result and,
+with `profile_dir`, the raw .pstats and the JSON summary are written there
+(`python -m pstats file.pstats`, snakeviz, ...).
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+PROFILE_TOPIC = "heatpump/debug/profile"
+RESULT_TOPIC = PROFILE_TOPIC + "/result"
+
+# Loop waiting in the selector is idle time, not work: left out of the summary
+_IDLE = ("poll", "select", "_run_once", "control")
+
+
+def parse_request(payload):
+    """MQTT payload -> options dict; '30', 'stop' or JSON such as {"seconds": 60, "memory": false}."""
+    payload = payload.strip()
+    if payload.lower() == "stop":
+        return {"stop": True}
+    try:
+        opts = json.loads(payload) if payload else {}
+    except ValueError:
+        raise ValueError(f"bad profile request {payload!r}")
+    if isinstance(opts, (int, float)):
+        opts = {"seconds": opts}
+    if not isinstance(opts, dict):
+        raise ValueError(f"bad profile request {payload!r}")
+    return {
+        "seconds": min(max(float(opts.get("seconds", 30)), 1.0), 3600.0),
+        "cpu": bool(opts.get("cpu", True)),
+        "memory": bool(opts.get("memory", True)),
+        "timers": bool(opts.get("timers", True)),
+        "top": int(opts.get("top", 20)),
+    }
+
+
+class StageTimers:
+    """Timing wrappers around attributes; wrap() while active, restore() after."""
+
+    def __init__(self):
+        self.stats = {}          # stage -> [count, total s, max s]
+        self._wrapped = []       # (obj, attr, original, how to restore)
+
+    def wrap(self, obj, attr, stage):
+        orig = getattr(obj, attr)
+        slot = self.stats.setdefault(stage, [0, 0.0, 0.0])
+        perf = time.perf_counter
+
+        def timed(*args, **kwargs):
+            t0 = perf()
+            try:
+                return orig(*args, **kwargs)
+            finally:
+                dt = perf() - t0
+                slot[0] += 1
+                slot[1] += dt
+                if dt > slot[2]:
+                    slot[2] = dt
+
+        # Bound methods live on the class: drop the instance override instead of pinning them
+        owned = attr in getattr(obj, "__dict__", {}) or isinstance(getattr(type(obj), attr, None), property)
+        setattr(obj, attr, timed)
+        self._wrapped.append((obj, attr, orig, owned))
+
+    def restore(self):
+        for obj, attr, orig, owned in reversed(self._wrapped):
+            if owned:
+                setattr(obj, attr, orig)
+            else:
+                delattr(obj, attr)
+        self._wrapped = []
+
+    def summary(self):
+        return {stage: {"count": n,
+                        "total_ms": round(total * 1000, 3),
+                        "mean_us": round(total / n * 1e6, 1) if n else None,
+                        "max_us": round(peak * 1e6, 1)}
+                for stage, (n, total, peak) in self.stats.items()}
+
+
+class ProfileSession:
+    """Profiling windows requested over MQTT; collection runs on the loop, the report off it."""
+
+    def __init__(self, core, targets, publish, out_dir=None, log=None):
+        self.core = core                # IOCore: cProfile must run on its loop thread
+        self._targets = targets         # callable -> [(obj, attr, stage), ...] to time
+        self._publish = publish         # callable(topic, payload)
+        self.out_dir = out_dir
+        self._log = log or (lambda msg, level="INFO": None)
+        self._lock = threading.Lock()
+        self.active = None              # options of the running window
+        self._timers = None
+        self._cpu = None
+        self._mem_start = None
+        self._t0 = None
+        self._handle = None
+
+    def request(self, payload):
+        """Handle an MQTT request payload (MQTT thread)."""
+        opts = parse_request(payload)
+        if opts.get("stop"):
+            self.core.call_soon(self._finish)
+        else:
+            self.core.call_soon(self._start, opts)
+
+    def _start(self, opts):
+        # Loop thread
+        with self._lock:
+            if self.active is not None:
+                self._log("Profile already running", "WARNING")
+                return
+            self.active = opts
+        self._t0 = time.monotonic()
+        if opts["timers"]:
+            self._timers = StageTimers()
+            for obj, attr, stage in self._targets():
+                self._timers.wrap(obj, attr, stage)
+        if opts["memory"] and not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+            self._mem_start = tracemalloc.take_snapshot()
+        if opts["cpu"]:
+            self._cpu = cProfile.Profile()
+            self._cpu.enable()
+        self._handle = self.core.loop.call_later(opts["seconds"], self._finish)
+        self._log(f"Profiling for {opts['seconds']:.0f} s "
+                  f"(cpu={opts['cpu']}, memory={opts['memory']}, timers={opts['timers']})", "INFO")
+
+    def _finish(self):
+        # Loop thread: stop collecting, then build the report on a worker thread
+        with self._lock:
+            opts, self.active = self.active, None
+        if opts is None:
+            return
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        cpu, self._cpu = self._cpu, None
+        if cpu is not None:
+            cpu.disable()
+        timers, self._timers = self._timers, None
+        if timers is not None:
+            timers.restore()
+        mem_start, self._mem_start = self._mem_start, None
+        mem_end = None
+        if mem_start is not None:
+            mem_end = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+        elapsed = time.monotonic() - self._t0
+        threading.Thread(target=self._report, args=(opts, elapsed, cpu, timers, mem_start, mem_end),
+                         name="hp_profile", daemon=True).start()
+
+    def _report(self, opts, elapsed, cpu, timers, mem_start, mem_end):
+        try:
+            top = opts["top"]
+            result = {"seconds": round(elapsed, 1)}
+            stem = None
+            if self.out_dir:
+                os.makedirs(self.out_dir, exist_ok=True)
+                stem = os.path.join(self.out_dir, datetime.now().strftime("profile-%Y%m%d-%H%M%S"))
+            if timers is not None:
+                result["stages"] = timers.summary()
+            if cpu is not None:
+                stats = pstats.Stats(cpu, stream=io.StringIO())
+                busy = [(func, row) for func, row in stats.stats.items()
+                        if not any(word in func[2] for word in _IDLE)]
+                result["cpu_top"] = [
+                    f"{tt * 1000:.1f} ms own, {ct * 1000:.1f} ms cum, {nc} calls  {pstats.func_std_string(func)}"
+                    for func, (_cc, nc, tt, ct, _callers) in
+                    sorted(busy, key=lambda kv: kv[1][2], reverse=True)[:top]
+                ]
+                if stem:
+                    stats.dump_stats(stem + ".pstats")
+            if mem_end is not None:
+                diff = mem_end.compare_to(mem_start, "lineno")
+                result["memory_top"] = [str(d) for d in diff[:top]]
+                result["memory_traced_kb"] = round(sum(s.size for s in mem_end.statistics("filename")) / 1024, 1)
+            if stem:
+                with open(stem + ".json", "w", encoding="utf-8") as f:
+                    json.dump(result, f, indent=2)
+                result["file"] = stem
+            self._publish(RESULT_TOPIC, json.dumps(result))
+            self._log(f"Profile done ({elapsed:.0f} s)" + (f", written to {stem}.*" if stem else ""), "INFO")
+        except Exception as e:
+            self._log(f"Profile report error: {e}", "ERROR")
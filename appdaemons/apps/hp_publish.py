@@ -0,0 +1,170 @@
+# /config/apps/hp_publish.py
+"""State publishing helpers shared by HeatPump.py and the AppDaemon bridge."""
+
+import json
+import math
+import threading
+import time
+
+import hp_registers as regs
+
+
+def parse_deadband(value):
+    """'2%' -> relative band, 0.5 -> absolute band. Returns (absolute, relative)."""
+    if isinstance(value, str) and value.strip().endswith("%"):
+        return 0.0, float(value.strip()[:-1]) / 100.0
+    return float(value), 0.0
+
+
+class ChangeFilter:
+    """Last-value cache with per-sensor deadbands and a max-silence heartbeat.
+
+    check() returns True when a value should be published: the first time a
+    sensor is seen, when it moved beyond its deadband since the last
+    published value, or when it has not been published for `heartbeat`
+    seconds.
+    """
+
+    def __init__(self, deadbands=None, heartbeat=300.0, clock=time.monotonic):
+        self.heartbeat = float(heartbeat)
+        self._clock = clock
+        self._bands = {sid: parse_deadband(v) for sid, v in (deadbands or {}).items()}
+        self._last = {}      # sid -> (published value, monotonic time)
+        self.passed = 0
+        self.suppressed = 0
+
+    def reset(self):
+        """Forget everything (e.g. after an MQTT reconnect) so all values go out again."""
+        self._last.clear()
+
+    def _same(self, sid, prev, value):
+        if prev == value:
+            return True
+        if isinstance(prev, (int, float)) and isinstance(value, (int, float)):
+            if math.isnan(prev) and math.isnan(value):
+                return True
+            band = self._bands.get(sid)
+            if band:
+                diff = abs(value - prev)
+                return diff <= band[0] or diff <= band[1] * abs(prev)
+        return False
+
+    def check(self, sid, value, now=None):
+        if now is None:
+            now = self._clock()
+        last = self._last.get(sid)
+        if last is not None and now - last[1] < self.heartbeat and self._same(sid, last[0], value):
+            self.suppressed += 1
+            return False
+        self._last[sid] = (value, now)
+        self.passed += 1
+        return True
+
+
+class AvailabilityWatchdog:
+    """Availability driven by frame arrival, published only on transitions.
+
+    frame() is called for every decoded 0x0143/0x01B3 frame, tick()
+    periodically. The state flips to offline once no frame has arrived for
+    `timeout` seconds, even if the socket is still open.
+    """
+
+    def __init__(self, publish, timeout=120.0, clock=time.monotonic):
+        self._publish = publish      # callable(payload) -> publishes retained
+        self.timeout = float(timeout)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._last = {}              # command byte -> monotonic time of last frame
+        self.state = None
+        self.transitions = 0
+
+    def _set(self, state):
+        # caller holds the lock
+        if state != self.state:
+            self.state = state
+            self.transitions += 1
+            self._publish(state)
+
+    def frame(self, cmd, now=None):
+        if now is None:
+            now = self._clock()
+        with self._lock:
+            self._last[cmd] = now
+            if self.state != "online":
+                self._set("online")
+
+    def tick(self, now=None):
+        if now is None:
+            now = self._clock()
+        with self._lock:
+            if self.state == "online" and now - max(self._last.values(), default=0) > self.timeout:
+                self._set("offline")
+
+    def force(self, state):
+        """Set a state immediately (socket lost, shutdown)."""
+        with self._lock:
+            self._set(state)
+
+    def republish(self):
+        """Re-send the current state, e.g. after the broker fired our LWT."""
+        with self._lock:
+            if self.state is not None:
+                self._publish(self.state)
+
+    def since(self, cmd, now=None):
+        """Seconds since the last frame with this command byte (None if never)."""
+        last = self._last.get(cmd)
+        if last is None:
+            return None
+        return (self._clock() if now is None else now) - last
+
+
+class StatePublisher:
+    """Publishes decoded packets through a ChangeFilter.
+
+    mode "fields": one message per state id on <base>/<sid>/state.
+    mode "json":   one JSON document per packet on <base>/realtime/state or
+                   <base>/settings/state, sent when any field changed.
+    """
+
+    def __init__(self, publish, base_prefix, changes=None, mode="fields"):
+        if mode not in ("fields", "json"):
+            raise ValueError(f"unknown state mode {mode!r}")
+        self._publish = publish          # callable(topic, payload)
+        self.base = base_prefix
+        self.changes = changes if changes is not None else ChangeFilter()
+        self.json_mode = mode == "json"
+        self._topics = {}
+        self.skip = frozenset()          # state ids published elsewhere (fields mode rollups)
+        self.published = 0
+
+    def value(self, sid, value):
+        """Publish a single state (fields mode topic) if it passes the filter."""
+        if not self.changes.check(sid, value):
+            return False
+        topic = self._topics.get(sid)
+        if topic is None:
+            topic = self._topics[sid] = f"{self.base}/{sid}/state"
+        self._publish(topic, str(value))
+        self.published += 1
+        return True
+
+    def packet(self, packet, rec):
+        """Publish every state of a decoded record."""
+        if not self.json_mode:
+            skip = self.skip
+            for sid, v in regs.states(packet, rec):
+                if sid not in skip:
+                    self.value(sid, v)
+            return
+        doc = {}
+        changed = False
+        for sid, v in regs.states(packet, rec):
+            if v != v:          # NaN is not valid JSON
+                v = None
+            doc[sid] = v
+            if self.changes.check(sid, v):
+                changed = True
+        if changed:
+            self._publish(regs.json_state_topic(self.base, packet), json.dumps(doc))
+            self.published += 1
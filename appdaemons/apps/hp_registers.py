@@ -0,0 +1,248 @@
+# /config/apps/hp_registers.py
+"""Declarative register map for the AmiTime 0x0143 / 0x01B3 packets.
+
+Every decoded field is declared once here: packet, offset, wire type,
+scale, aliases and Home Assistant metadata. HeatPump.py and the AppDaemon
+bridge build their decode plans, state publishing and MQTT discovery from
+this table at import time.
+"""
+
+from collections import namedtuple
+
+from hp_decode import DecodePlan
+
+REALTIME = 0x01   # "0143" packet - sensor values
+SETTINGS = 0x02   # "01B3" packet - settings
+
+PACKET_NAMES = {REALTIME: "0143", SETTINGS: "01B3"}
+PACKET_TOPICS = {REALTIME: "realtime", SETTINGS: "settings"}   # JSON state mode
+
+Register = namedtuple("Register", [
+    "sid",            # state id, used in topics and unique_id
+    "packet",         # REALTIME / SETTINGS
+    "offset",         # offset into the parameters (after the command byte)
+    "type",           # wire type, see hp_decode.TYPES
+    "fmt",            # published as: float | int | flag ("true"/"false") | onoff (1/0)
+    "name",           # HA friendly name (None = not discovered)
+    "unit",
+    "device_class",
+    "state_class",
+    "component",      # sensor | binary_sensor
+    "aliases",        # extra state ids published with the same value
+    "entity",         # id exposed in discovery (defaults to sid)
+    "scale",
+    "deadband",       # publish only when moved more than this (number, or "N%" relative)
+], defaults=("float", None, None, None, "measurement", "sensor", (), None, 1.0, 0))
+
+
+def _temp(sid, packet, offset, name, **kw):
+    # Measured temperatures jitter by a tenth; settings only change on purpose
+    kw.setdefault("deadband", 0.2 if packet == REALTIME else 0)
+    return Register(sid, packet, offset, "f32", name=name, unit="°C",
+                    device_class="temperature", **kw)
+
+
+def _flag(sid, packet, offset, name, device_class, fmt="flag"):
+    return Register(sid, packet, offset, "f32", fmt=fmt, name=name, device_class=device_class,
+                    state_class=None, component="binary_sensor")
+
+
+REGISTERS = (
+    # ---- 0143: temperatures ----
+    _temp("outdoor_temp",        REALTIME, 10,  "Outdoor Temperature"),
+    _temp("dhw_temp",            REALTIME, 14,  "DHW Temperature"),
+    _temp("cooling_water_temp",  REALTIME, 18,  "Cooling Water Temperature"),
+    _temp("outlet_temp",         REALTIME, 22,  "Outlet Temperature"),
+    _temp("inlet_temp",          REALTIME, 26,  "Inlet Temperature"),
+    _temp("room_temp",           REALTIME, 54,  "Room Temperature"),
+    _temp("outdoor_ambient_2",   REALTIME, 254, "Outdoor Ambient 2"),
+    _temp("outdoor_coil_temp",   REALTIME, 258, "Outdoor Coil Temperature"),
+    _temp("gas_discharge_temp",  REALTIME, 262, "Gas Discharge Temperature"),
+    _temp("gas_suction_temp",    REALTIME, 266, "Gas Suction Temperature"),
+    # ---- 0143: electrical ----
+    Register("voltage", REALTIME, 214, "f32", name="Voltage", unit="V", device_class="voltage", deadband=1.0),
+    Register("current", REALTIME, 218, "f32", name="Current", unit="A", device_class="current", deadband="2%"),
+    Register("compressor_freq_limit", REALTIME, 222, "f32", name="Compressor Frequency Limit", unit="Hz", deadband=1.0),
+    Register("compressor_freq", REALTIME, 226, "f32", name="Compressor Frequency", unit="Hz", deadband=1.0),
+    # ---- 0143: pressure ----
+    Register("low_pressure",  REALTIME, 278, "f32", name="Low Pressure", unit="bar", deadband=0.1),
+    Register("high_pressure", REALTIME, 282, "f32", name="High Pressure", unit="bar", deadband=0.1),
+    # ---- 0143: status (floats 1.0/0.0) ----
+    _flag("dhw_state",     REALTIME, 174, "DHW Working State", "heat"),
+    _flag("heating_state", REALTIME, 178, "Heating Working State", "heat"),
+    _flag("cooling_state", REALTIME, 182, "Cooling Working State", "cold"),
+    _flag("defrost_state", REALTIME, 286, "Defrost State", "running"),
+    Register("outdoor_unit_mode", REALTIME, 186, "u8", fmt="int", name="Outdoor Unit Mode", state_class=None),
+
+    # ---- 01B3: unit status ----
+    _flag("unit_on_off",           SETTINGS, 2,   "Unit On/Off", "power", fmt="onoff"),
+    Register("working_mode",       SETTINGS, 6,   "f32", fmt="int", name="Working Mode",
+             state_class=None),  # 1=DHW 2=Heating 3=Cooling; a code, no statistics
+    _flag("low_noise_mode",        SETTINGS, 66,  "Low Noise Mode", "sound", fmt="onoff"),
+    _flag("heating_curve_enabled", SETTINGS, 330, "Heating Curve Enabled", None, fmt="onoff"),
+    # ---- 01B3: set temperatures & deltas ----
+    _temp("dhw_set_temp",     SETTINGS, 166, "DHW Set Temperature"),
+    _temp("heating_set_temp", SETTINGS, 246, "Heating Set Temperature"),
+    _temp("cooling_set_temp", SETTINGS, 378, "Cooling Set Temperature"),
+    _temp("dhw_delta_t",      SETTINGS, 170, "DHW Delta Temperature",
+          aliases=("dhw_delta_temp",), entity="dhw_delta_temp"),
+    _temp("heating_delta_t",  SETTINGS, 250, "Heating Delta Temperature",
+          aliases=("heating_delta_temp",), entity="heating_delta_temp"),
+    _temp("cooling_delta_t",  SETTINGS, 382, "Cooling Delta Temperature",
+          aliases=("cooling_delta_temp",), entity="cooling_delta_temp"),
+    _temp("delta_t_compressor_speed", SETTINGS, 18, "Delta T Compressor Speed"),
+    # ---- 01B3: heating curve (point 5 not located yet) ----
+    _temp("heating_curve_ambient_temp_1", SETTINGS, 338, "Heating Curve Ambient Temp 1"),
+    _temp("heating_curve_water_temp_1",   SETTINGS, 342, "Heating Curve Water Temp 1"),
+    _temp("heating_curve_ambient_temp_2", SETTINGS, 346, "Heating Curve Ambient Temp 2"),
+    _temp("heating_curve_water_temp_2",   SETTINGS, 350, "Heating Curve Water Temp 2"),
+    _temp("heating_curve_ambient_temp_3", SETTINGS, 354, "Heating Curve Ambient Temp 3"),
+    _temp("heating_curve_water_temp_3",   SETTINGS, 358, "Heating Curve Water Temp 3"),
+    _temp("heating_curve_ambient_temp_4", SETTINGS, 362, "Heating Curve Ambient Temp 4"),
+    _temp("heating_curve_water_temp_4",   SETTINGS, 366, "Heating Curve Water Temp 4"),
+    # ---- 01B3: shifting priority ----
+    Register("dhw_priority_min_time", SETTINGS, 190, "f32", name="DHW Minimum Working Time", unit="min",
+             aliases=("shifting_priority_dhw_min_time",), entity="shifting_priority_dhw_min_time"),
+    _temp("priority_ambient_start_temp", SETTINGS, 306, "Priority Ambient Start Temp",
+          aliases=("shifting_priority_ambient_start_temp",), entity="shifting_priority_ambient_start_temp"),
+    _temp("priority_heating_delta_t", SETTINGS, 314, "Priority Heating Delta Temp",
+          aliases=("shifting_priority_heating_delta_temp",), entity="shifting_priority_heating_delta_temp"),
+    Register("priority_heating_working_time", SETTINGS, 318, "f32", name="Heating Working Time", unit="min",
+             aliases=("shifting_priority_heating_working_time",)),
+)
+
+# Computed states (hp_derived.py): no packet/offset, own state topic even in JSON mode
+DERIVED = (
+    Register("electrical_power_w", None, None, None, name="Electrical Power", unit="W",
+             device_class="power", deadband="2%"),
+    Register("thermal_power_heating_w", None, None, None, name="Thermal Power Heating", unit="W",
+             device_class="power", deadband="2%"),
+    Register("thermal_power_cooling_w", None, None, None, name="Thermal Power Cooling", unit="W",
+             device_class="power", deadband="2%"),
+    Register("cop_heating", None, None, None, name="COP Heating", deadband=0.05),
+    Register("cop_cooling", None, None, None, name="COP Cooling", deadband=0.05),
+)
+DERIVED_SIDS = tuple(r.sid for r in DERIVED)
+
+REGISTER = {r.sid: r for r in REGISTERS + DERIVED}
+
+
+def by_packet(packet):
+    return tuple(r for r in REGISTERS if r.packet == packet)
+
+
+def offsets():
+    """Flat {state id: offset} table, aliases included (legacy OFFSETS shape)."""
+    out = {}
+    for r in REGISTERS:
+        out[r.sid] = r.offset
+        for a in r.aliases:
+            out[a] = r.offset
+    return out
+
+
+def deadbands():
+    """{state id: deadband} for every register with a deadband, aliases included."""
+    out = {}
+    for r in REGISTERS + DERIVED:
+        if r.deadband:
+            for sid in (r.sid,) + tuple(r.aliases):
+                out[sid] = r.deadband
+    return out
+
+
+#
+# ---------------------- Compiled fast path ----------------------
+#
+def _converter(r):
+    scale = r.scale
+    if r.fmt == "flag":
+        return lambda v: "true" if v == 1.0 else "false"
+    if r.fmt == "onoff":
+        return lambda v: 1 if v == 1.0 else 0
+    if r.fmt == "int":
+        return (lambda v: int(v * scale)) if scale != 1.0 else int
+    if scale != 1.0:
+        return lambda v: v * scale
+    return None
+
+
+class _Compiled:
+    def __init__(self, packet):
+        regs = by_packet(packet)
+        self.plan = DecodePlan(f"Packet{PACKET_NAMES[packet]}", [(r.sid, r.offset, r.type) for r in regs])
+        self.emit = tuple((i, _converter(r), (r.sid,) + tuple(r.aliases)) for i, r in enumerate(regs))
+
+
+_COMPILED = {p: _Compiled(p) for p in PACKET_NAMES}
+
+
+def decode(packet, params):
+    """Decode a packet into its raw record (wire values, unconverted)."""
+    return _COMPILED[packet].plan.decode(params)
+
+
+def states(packet, rec):
+    """Yield (state id, published value) for a decoded record, aliases included."""
+    for i, conv, ids in _COMPILED[packet].emit:
+        v = rec[i]
+        if v is None:
+            continue
+        if conv is not None:
+            v = conv(v)
+        for sid in ids:
+            yield sid, v
+
+
+#
+# ---------------------- Discovery ----------------------
+#
+def json_state_topic(base, packet):
+    return f"{base}/{PACKET_TOPICS[packet]}/state"
+
+
+def availability_fields(avail_topic):
+    """Discovery availability keys for one topic, or several that must all be online."""
+    if isinstance(avail_topic, str):
+        return {"availability_topic": avail_topic}
+    return {"availability": [{"topic": t} for t in avail_topic], "availability_mode": "all"}
+
+
+def discovery_configs(device_id, device, avail_topic, discovery_prefix="homeassistant", json_state=False,
+                      derived=()):
+    """Yield (config topic, payload dict) for every discovered register.
+
+    With json_state, entities read the per-packet JSON document through a
+    value_template instead of their own state topic. avail_topic may be a
+    list of topics (see availability_fields). derived: DERIVED state ids
+    that are actually computed.
+    """
+    base = f"{discovery_prefix}/sensor/{device_id}"
+    for r in REGISTERS + tuple(d for d in DERIVED if d.sid in derived):
+        if not r.name:
+            continue
+        eid = r.entity or r.sid
+        payload = {
+            "name": r.name,
+            "state_topic": f"{base}/{eid}/state",
+            **availability_fields(avail_topic),
+            "device": device,
+        }
+        if json_state and r.packet is not None:
+            payload["state_topic"] = json_state_topic(base, r.packet)
+            payload["value_template"] = f"{{{{ value_json.{eid} }}}}"
+        if r.component == "binary_sensor":
+            payload["unique_id"] = f"{device_id}_{eid}_binary"
+            on, off = ("true", "false") if r.fmt == "flag" else ("1", "0")
+            payload["payload_on"], payload["payload_off"] = on, off
+            topic = f"{discovery_prefix}/binary_sensor/{device_id}/{eid}/config"
+        else:
+            payload["unique_id"] = f"{device_id}_{eid}"
+            if r.unit:
+                payload["unit_of_measurement"] = r.unit
+            if r.state_class:
+                payload["state_class"] = r.state_class
+            topic = f"{base}/{eid}/config"
+        if r.device_class:
+            payload["device_class"] = r.device_class
+        yield topic, payload
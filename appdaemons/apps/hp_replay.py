@@ -0,0 +1,272 @@
+# /config/apps/hp_replay.py
+"""Replay recorded heat pump traffic through the decoders.
+
+Sources (streamed from disk, never loaded whole):
+  - a capture directory or .hpcap segment written by hp_capture
+  - a pcap of the adapter's TCP port (classic libpcap format)
+
+Targets:
+  - bridge: hp_registers decode + StatePublisher, the path behind
+            HeatpumpBridge._handle_0143/_handle_01B3
+  - script: HeatPump.analyze_0143_packet/analyze_01b3_packet
+
+Sinks take the place of the paho client (anything with publish()):
+NullSink, CollectorSink or MqttSink.
+
+    python hp_replay.py captures/ --speed 10 --sink null
+    python hp_replay.py dump.pcap --port 8899 --speed 0 --sink mqtt --broker 127.0.0.1
+"""
+
+import argparse
+import os
+import struct
+import sys
+import time
+
+import hp_registers as regs
+from hp_capture import CaptureReader, list_segments
+from hp_framing import FrameBuffer
+from hp_publish import ChangeFilter, StatePublisher
+
+
+#
+# ---------------------- Sinks ----------------------
+#
+class NullSink:
+    """Counts publishes and drops them (/dev/null)."""
+
+    def __init__(self):
+        self.count = 0
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.count += 1
+
+
+class CollectorSink(NullSink):
+    """Keeps every (topic, payload, retain) in memory, for regression checks."""
+
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.count += 1
+        self.messages.append((topic, payload, retain))
+
+    def last(self):
+        """{topic: last payload}"""
+        return {t: p for t, p, _ in self.messages}
+
+
+class MqttSink(NullSink):
+    """Publishes to a real broker through paho."""
+
+    def __init__(self, broker, port=1883, user=None, password=None):
+        super().__init__()
+        import paho.mqtt.client as mqtt
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id="heatpump_replay")
+        if user:
+            self.client.username_pw_set(user, password)
+        self.client.connect(broker, port, 60)
+        self.client.loop_start()
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.count += 1
+        self.client.publish(topic, payload, qos=qos, retain=retain)
+
+    def close(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+#
+# ---------------------- Sources ----------------------
+#
+def capture_source(path):
+    """Yield (wall time, bytes) for each recorded frame."""
+    paths = list_segments(path) if os.path.isdir(path) else [path]
+    for p in paths:
+        reader = CaptureReader(p)
+        for ts, _cmd, frame in reader.records():
+            yield reader.wall_time(ts), frame
+
+
+_PCAP_MAGIC = {
+    b"\xd4\xc3\xb2\xa1": ("<", 1e-6), b"\xa1\xb2\xc3\xd4": (">", 1e-6),
+    b"\x4d\x3c\xb2\xa1": ("<", 1e-9), b"\xa1\xb2\x3c\x4d": (">", 1e-9),
+}
+
+
+def pcap_source(path, port=8899):
+    """Yield (time, TCP payload) sent from `port`, with naive in-order reassembly.
+
+    Retransmitted segments are skipped using the next expected sequence
+    number of each flow.
+    """
+    with open(path, "rb") as f:
+        head = f.read(24)
+        if head[:4] not in _PCAP_MAGIC:
+            raise ValueError(f"{path}: not a classic pcap file (pcapng is not supported)")
+        endian, tick = _PCAP_MAGIC[head[:4]]
+        linktype = struct.unpack(endian + "I", head[20:24])[0]
+        rec = struct.Struct(endian + "IIII")
+        expected = {}
+        while True:
+            h = f.read(rec.size)
+            if len(h) < rec.size:
+                return
+            sec, frac, incl, _orig = rec.unpack(h)
+            pkt = f.read(incl)
+            if len(pkt) < incl:
+                return
+            # Link layer -> IPv4
+            if linktype == 1:            # Ethernet
+                off, ethertype = 14, pkt[12:14]
+                if ethertype == b"\x81\x00":   # 802.1Q
+                    off, ethertype = 18, pkt[16:18]
+                if ethertype != b"\x08\x00":
+                    continue
+            elif linktype == 113:        # Linux cooked
+                if pkt[14:16] != b"\x08\x00":
+                    continue
+                off = 16
+            elif linktype in (101, 228):   # raw IPv4
+                off = 0
+            else:
+                raise ValueError(f"unsupported pcap link type {linktype}")
+            if len(pkt) < off + 20 or pkt[off] >> 4 != 4 or pkt[off + 9] != 6:
+                continue
+            ihl = (pkt[off] & 0x0F) * 4
+            total = struct.unpack_from(">H", pkt, off + 2)[0]
+            tcp = off + ihl
+            sport, dport, seq = struct.unpack_from(">HHI", pkt, tcp)
+            if sport != port:
+                continue
+            data = pkt[tcp + (pkt[tcp + 12] >> 4) * 4:off + total]
+            if not data:
+                continue
+            flow = (pkt[off + 12:off + 16], sport, pkt[off + 16:off + 20], dport)
+            nxt = expected.get(flow)
+            if nxt is not None and (seq - nxt) & 0xFFFFFFFF >= 0x80000000:
+                continue             # retransmission of data already delivered
+            expected[flow] = (seq + len(data)) & 0xFFFFFFFF
+            yield sec + frac * tick, data
+
+
+def open_source(path, port=8899):
+    if os.path.isdir(path) or path.endswith(".hpcap"):
+        return capture_source(path)
+    return pcap_source(path, port)
+
+
+#
+# ---------------------- Engine ----------------------
+#
+REPO_ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+
+def _load_script():
+    """HeatPump.py from the repository root, for the script target."""
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    try:
+        import HeatPump
+    except ImportError as e:
+        raise ImportError(f"target 'script' needs HeatPump.py (in {REPO_ROOT}) and paho-mqtt: {e}") from e
+    return HeatPump
+
+
+class Replay:
+    """Feeds a source through the frame reassembler and decoders into a sink."""
+
+    def __init__(self, sink, target="bridge", base_prefix="homeassistant/sensor/heatpump_001",
+                 state_mode="fields", heartbeat=300, use_filter=True):
+        self.sink = sink
+        self.target = target
+        self._now = 0.0
+        changes = ChangeFilter(regs.deadbands() if use_filter else None,
+                               heartbeat=heartbeat if use_filter else 0,
+                               clock=lambda: self._now)
+        self.publisher = StatePublisher(lambda t, p: sink.publish(t, p), base_prefix, changes, state_mode)
+        if target == "script":
+            HeatPump = _load_script()
+            HeatPump.mqtt_client = sink
+            HeatPump.STATE_PUBLISHER.changes = changes
+            self._script = HeatPump
+        self.frames = {}
+
+    def _handle(self, cmd, params):
+        self.frames[cmd] = self.frames.get(cmd, 0) + 1
+        if cmd not in (regs.REALTIME, regs.SETTINGS):
+            return
+        if self.target == "script":
+            if cmd == regs.REALTIME:
+                self._script.analyze_0143_packet(params)
+            else:
+                self._script.analyze_01b3_packet(params)
+        else:
+            self.publisher.packet(cmd, regs.decode(cmd, params))
+
+    def run(self, source, speed=1.0):
+        """Replay at `speed` x real time; speed 0/None = as fast as possible."""
+        buf = FrameBuffer()
+        t0 = time.perf_counter()
+        first = None
+        for ts, chunk in source:
+            if first is None:
+                first = ts
+            self._now = ts
+            if speed:
+                delay = (ts - first) / speed - (time.perf_counter() - t0)
+                if delay > 0:
+                    time.sleep(delay)
+            buf.feed(chunk)
+            for cmd, params in buf.frames():
+                self._handle(cmd, params)
+        elapsed = time.perf_counter() - t0
+        n = sum(self.frames.values())
+        return {
+            "frames": n,
+            "frames_by_cmd": {f"0x{c:02X}": k for c, k in sorted(self.frames.items())},
+            "publishes": self.sink.count,
+            "resync_bytes": buf.dropped,
+            "elapsed_s": round(elapsed, 3),
+            "frames_per_s": round(n / elapsed, 1) if elapsed else None,
+            "span_s": round(self._now - first, 3) if first is not None else 0,
+        }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("source", help="capture directory, .hpcap segment or .pcap file")
+    ap.add_argument("--port", type=int, default=8899, help="adapter TCP port in the pcap")
+    ap.add_argument("--speed", type=float, default=1.0, help="1 = real time, N = N x, 0 = max")
+    ap.add_argument("--sink", choices=("null", "collect", "mqtt"), default="null")
+    ap.add_argument("--target", choices=("bridge", "script"), default="bridge")
+    ap.add_argument("--state-mode", choices=("fields", "json"), default="fields")
+    ap.add_argument("--no-filter", action="store_true", help="publish every value (no deadband/heartbeat)")
+    ap.add_argument("--broker", default="127.0.0.1")
+    ap.add_argument("--mqtt-port", type=int, default=1883)
+    ap.add_argument("--user")
+    ap.add_argument("--password")
+    args = ap.parse_args(argv)
+
+    if args.sink == "mqtt":
+        sink = MqttSink(args.broker, args.mqtt_port, args.user, args.password)
+    elif args.sink == "collect":
+        sink = CollectorSink()
+    else:
+        sink = NullSink()
+    replay = Replay(sink, target=args.target, state_mode=args.state_mode, use_filter=not args.no_filter)
+    try:
+        stats = replay.run(open_source(args.source, args.port), speed=args.speed)
+    finally:
+        if isinstance(sink, MqttSink):
+            sink.close()
+    for k, v in stats.items():
+        print(f"{k}: {v}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
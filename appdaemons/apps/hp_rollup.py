@@ -0,0 +1,148 @@
+# /config/apps/hp_rollup.py
+"""Windowed rollups of 0x0143 sensors, to cut Home Assistant recorder writes.
+
+Sensors configured for rollup are not published per frame. For each
+window (e.g. 10 s, 60 s, 300 s) min / max / mean / last are accumulated in
+flat arrays (one slot per sensor, no per-sample allocation) and, when the
+window closes:
+
+  - one JSON document per window goes to <base>/rollup/<N>s
+    {"outlet_temp": {"min": .., "max": .., "mean": .., "last": .., "n": ..}, ...}
+  - the mean of the first (shortest) window is published on the sensor's
+    usual state topic, so existing entities keep working at a lower rate
+  - "<name> Min" / "<name> Max" entities read the first window's extremes
+    from its document, so alarms still see short spikes
+
+Binary states and integer registers always stay raw.
+"""
+
+import json
+import time
+from array import array
+
+import hp_registers as regs
+
+# Realtime float sensors; flags and enums are left raw
+ROLLABLE = tuple(r.sid for r in regs.by_packet(regs.REALTIME) if r.component == "sensor" and r.fmt == "float")
+_POSITION = {r.sid: i for i, r in enumerate(regs.by_packet(regs.REALTIME))}
+_INF = float("inf")
+
+
+def rolled_sids(config):
+    """Sensors to roll up from {"default": "raw"|"rollup", <sid>: "raw"|"rollup", ...}."""
+    config = dict(config or {})
+    default = str(config.pop("default", "raw")).lower()
+    for sid, mode in config.items():
+        if sid not in ROLLABLE:
+            raise ValueError(f"{sid} cannot be rolled up")
+        if str(mode).lower() not in ("raw", "rollup"):
+            raise ValueError(f"{sid}: mode must be raw or rollup, not {mode!r}")
+    return tuple(sid for sid in ROLLABLE if str(config.get(sid, default)).lower() == "rollup")
+
+
+def doc_topic(base, window):
+    return f"{base}/rollup/{window:g}s"
+
+
+class WindowAccumulator:
+    """min / max / sum / last / count per sensor for one window."""
+
+    def __init__(self, window, n):
+        self.window = float(window)
+        self.min = array("d", [_INF]) * n
+        self.max = array("d", [-_INF]) * n
+        self.sum = array("d", [0.0]) * n
+        self.last = array("d", [0.0]) * n
+        self.count = array("L", [0]) * n
+        self.closes = None
+
+    def reset(self):
+        n = len(self.count)
+        for i in range(n):
+            self.min[i] = _INF
+            self.max[i] = -_INF
+            self.sum[i] = 0.0
+            self.count[i] = 0
+
+
+class Rollup:
+    """Rollups of the configured sensors over one or more windows."""
+
+    def __init__(self, sids, windows, publish_doc, publish_value, clock=time.monotonic):
+        if not windows:
+            raise ValueError("at least one rollup window is needed")
+        self.sids = tuple(sids)
+        self._positions = tuple(_POSITION[sid] for sid in self.sids)
+        self.windows = [WindowAccumulator(w, len(self.sids)) for w in sorted(float(w) for w in windows)]
+        self._publish_doc = publish_doc      # callable(window seconds, JSON string)
+        self._publish_value = publish_value  # callable(state id, value) -> regular state topic
+        self._clock = clock
+        self._due = _INF
+
+    def add(self, rec, now=None):
+        """Accumulate one decoded 0143 record; closes windows that are due."""
+        now = self._clock() if now is None else now
+        if self._due == _INF:
+            for w in self.windows:
+                w.closes = now + w.window
+            self._due = self.windows[0].closes
+        elif now >= self._due:
+            self.roll(now)               # close due windows first, so this sample opens the next one
+        for slot, pos in enumerate(self._positions):
+            v = rec[pos]
+            if v is None or v != v:
+                continue
+            for w in self.windows:
+                if v < w.min[slot]:
+                    w.min[slot] = v
+                if v > w.max[slot]:
+                    w.max[slot] = v
+                w.sum[slot] += v
+                w.last[slot] = v
+                w.count[slot] += 1
+
+    def roll(self, now=None):
+        """Publish and reset every window that has elapsed (also call from a timer)."""
+        now = self._clock() if now is None else now
+        for w in self.windows:
+            if w.closes is None or now < w.closes:
+                continue
+            doc = self.summary(w)
+            if doc:
+                self._publish_doc(w.window, json.dumps(doc))
+                if w is self.windows[0]:
+                    for sid, stats in doc.items():
+                        self._publish_value(sid, stats["mean"])
+            w.reset()
+            # Next boundary past now on the same grid, skipping windows missed while no frames came in
+            w.closes += w.window * ((now - w.closes) // w.window + 1)
+        self._due = min(w.closes for w in self.windows)
+
+    def summary(self, w):
+        out = {}
+        for slot, sid in enumerate(self.sids):
+            n = w.count[slot]
+            if n:
+                out[sid] = {"min": w.min[slot], "max": w.max[slot], "mean": round(w.sum[slot] / n, 3),
+                            "last": w.last[slot], "n": n}
+        return out
+
+    def discovery_configs(self, device_id, base, discovery_prefix="homeassistant"):
+        """Yield (config topic, payload) for the Min/Max entities of the first window."""
+        topic = doc_topic(base, self.windows[0].window)
+        for sid in self.sids:
+            r = regs.REGISTER[sid]
+            for stat in ("min", "max"):
+                eid = f"{sid}_{stat}"
+                payload = {
+                    "name": f"{r.name} {stat.capitalize()}",
+                    "unique_id": f"{device_id}_{eid}",
+                    "state_topic": topic,
+                    "value_template": f"{{{{ value_json.{sid}.{stat} if '{sid}' in value_json else this.state }}}}",
+                    "state_class": "measurement",
+                }
+                if r.unit:
+                    payload["unit_of_measurement"] = r.unit
+                if r.device_class:
+                    payload["device_class"] = r.device_class
+                yield f"{discovery_prefix}/sensor/{device_id}/{eid}/config", payload
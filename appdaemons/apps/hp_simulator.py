@@ -0,0 +1,350 @@
+# /config/apps/hp_simulator.py
+"""Local stand-in for the USR-C210 adapter / heat pump, for load and soak tests.
+
+Each simulated pump listens on its own TCP port (base port + index) and
+streams 0x01 (0143), 0x02 (01B3) and 0x05 frames built from the register
+map, with configurable value trajectories, TCP fragmentation and
+coalescing, stalls and disconnects. All pumps run on one asyncio loop.
+
+    python hp_simulator.py --pumps 20 --base-port 8899 --realtime-hz 5 \\
+        --fragment 0.3 --coalesce 0.2 --disconnect-every 300 \\
+        --set outdoor_temp=sine:5,8,600 --set current=walk:6,0.3,0,20
+
+Point HeatPump.py (HEATPUMP_IP/PORT) or the bridge (heatpump_ip/port) at
+127.0.0.1:<port>.
+
+Set-frames from the client (hp_write, assumed protocol) are applied to the
+pump's settings, so the next 01B3 frame reflects them, and acknowledged
+unless --writes is silent or ignore.
+
+Trajectories: const:V | sine:MEAN,AMP,PERIOD | ramp:START,SLOPE |
+walk:START,STEP[,MIN,MAX] | noise:MEAN,SD
+"""
+
+import argparse
+import asyncio
+import math
+import random
+import socket
+import struct
+import threading
+import time
+
+import hp_registers as regs
+from hp_framing import LEN_OFFSET, FrameBuffer, build_frame
+from hp_write import ACK_CMD, WRITE_CMD, build_set_frame, parse_set_frame
+
+PARAM_SIZES = {regs.REALTIME: 322, regs.SETTINGS: 434, 0x05: 8}
+
+DEFAULT_TRAJECTORIES = {
+    "outdoor_temp": "sine:8,6,900",
+    "outdoor_ambient_2": "sine:8,6,900",
+    "dhw_temp": "sine:47,3,1800",
+    "cooling_water_temp": "noise:20,0.05",
+    "outlet_temp": "sine:35,3,600",
+    "inlet_temp": "sine:30,3,600",
+    "room_temp": "noise:21,0.05",
+    "outdoor_coil_temp": "sine:2,4,900",
+    "gas_discharge_temp": "sine:70,8,600",
+    "gas_suction_temp": "sine:0,3,600",
+    "voltage": "noise:230,1.5",
+    "current": "walk:6,0.2,0,20",
+    "compressor_freq_limit": "const:90",
+    "compressor_freq": "sine:50,20,1200",
+    "low_pressure": "noise:7,0.1",
+    "high_pressure": "noise:24,0.3",
+    "outdoor_unit_mode": "const:2",
+    "defrost_state": "const:0",
+}
+
+DEFAULT_SETTINGS = {
+    "unit_on_off": 1.0, "working_mode": 2.0, "low_noise_mode": 0.0, "heating_curve_enabled": 0.0,
+    "dhw_set_temp": 50.0, "heating_set_temp": 35.0, "cooling_set_temp": 12.0,
+    "dhw_delta_t": 5.0, "heating_delta_t": 5.0, "cooling_delta_t": 5.0,
+    "delta_t_compressor_speed": 3.0,
+    "heating_curve_ambient_temp_1": -10.0, "heating_curve_water_temp_1": 45.0,
+    "heating_curve_ambient_temp_2": 0.0, "heating_curve_water_temp_2": 40.0,
+    "heating_curve_ambient_temp_3": 10.0, "heating_curve_water_temp_3": 35.0,
+    "heating_curve_ambient_temp_4": 20.0, "heating_curve_water_temp_4": 30.0,
+    "dhw_priority_min_time": 30.0, "priority_ambient_start_temp": 5.0,
+    "priority_heating_delta_t": 5.0, "priority_heating_working_time": 60.0,
+}
+
+
+def trajectory(spec, rng):
+    """Compile 'kind:args' into a callable f(t) -> value."""
+    kind, _, args = spec.partition(":")
+    a = [float(x) for x in args.split(",")] if args else []
+    if kind == "const":
+        return lambda t: a[0]
+    if kind == "sine":
+        mean, amp, period = a
+        phase = rng.uniform(0, period)
+        return lambda t: mean + amp * math.sin(2 * math.pi * (t + phase) / period)
+    if kind == "ramp":
+        start, slope = a
+        return lambda t: start + slope * t
+    if kind == "noise":
+        mean, sd = a
+        return lambda t: rng.gauss(mean, sd)
+    if kind == "walk":
+        state = [a[0]]
+        lo, hi = (a[2], a[3]) if len(a) >= 4 else (-math.inf, math.inf)
+
+        def walk(t):
+            state[0] = min(hi, max(lo, state[0] + rng.uniform(-a[1], a[1])))
+            return state[0]
+        return walk
+    raise ValueError(f"unknown trajectory {spec!r}")
+
+
+class SimPump:
+    """Values and frame encoding for one simulated heat pump."""
+
+    def __init__(self, index, trajectories, rng, stamp=False):
+        self.index = index
+        self.rng = rng
+        self.stamp = stamp
+        self.t0 = time.monotonic()
+        self.settings = dict(DEFAULT_SETTINGS)
+        self.traj = {sid: trajectory(spec, rng) for sid, spec in trajectories.items()}
+        self._packers = {p: [(r.sid, r.offset, struct.Struct("<" + ("f" if r.type == "f32" else "B")))
+                             for r in regs.by_packet(p)] for p in (regs.REALTIME, regs.SETTINGS)}
+
+    def _header(self):
+        # Bytes 0..9 are opaque to the bridge; stamp send time for latency tests
+        if self.stamp:
+            return b"\x00\x00" + struct.pack("<Q", time.monotonic_ns())
+        return b"\x00" * LEN_OFFSET
+
+    def realtime_values(self, t):
+        v = {sid: f(t) for sid, f in self.traj.items()}
+        mode = int(self.settings["working_mode"]) if self.settings["unit_on_off"] == 1.0 else 0
+        v.setdefault("dhw_state", 1.0 if mode == 1 else 0.0)
+        v.setdefault("heating_state", 1.0 if mode == 2 else 0.0)
+        v.setdefault("cooling_state", 1.0 if mode == 3 else 0.0)
+        return v
+
+    def frame(self, cmd):
+        buf = bytearray(PARAM_SIZES[cmd])
+        if cmd in self._packers:
+            values = self.realtime_values(time.monotonic() - self.t0) if cmd == regs.REALTIME else self.settings
+            for sid, off, st in self._packers[cmd]:
+                v = values.get(sid)
+                if v is not None:
+                    st.pack_into(buf, off, int(v) & 0xFF if st.format == "<B" else v)
+        return build_frame(cmd, buf, self._header())
+
+
+class Simulator:
+    """Runs N simulated pumps on one asyncio loop."""
+
+    def __init__(self, pumps=1, host="127.0.0.1", base_port=8899, realtime_hz=1.0, settings_every=10.0,
+                 heartbeat_every=30.0, fragment=0.0, coalesce=0.0, stall_every=0.0, stall_for=0.0,
+                 disconnect_every=0.0, trajectories=None, seed=None, stamp=False, writes="ack"):
+        self.host = host
+        self.base_port = base_port
+        self.realtime_hz = realtime_hz
+        self.settings_every = settings_every
+        self.heartbeat_every = heartbeat_every
+        self.fragment = fragment
+        self.coalesce = coalesce
+        self.stall_every = stall_every
+        self.stall_for = stall_for
+        self.disconnect_every = disconnect_every
+        if writes not in ("ack", "silent", "ignore"):
+            raise ValueError(f"unknown writes mode {writes!r}")
+        self.writes = writes
+        self.rng = random.Random(seed)
+        traj = dict(DEFAULT_TRAJECTORIES)
+        traj.update(trajectories or {})
+        self.pumps = [SimPump(i, traj, random.Random(self.rng.random()), stamp) for i in range(pumps)]
+        self.ports = []
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.connections = 0
+        self.disconnects = 0
+        self.writes_applied = 0
+        self._servers = []
+        self._sessions = set()
+        self._loop = None
+
+    async def _send(self, writer, data, lock):
+        """Write data, optionally split into random fragments to force TCP splits."""
+        async with lock:      # an ack must not land between the fragments of a frame
+            await self._write(writer, data)
+
+    async def _write(self, writer, data):
+        if self.fragment and self.rng.random() < self.fragment and len(data) > 1:
+            pos = 0
+            while pos < len(data):
+                n = self.rng.randint(1, max(1, len(data) // 3))
+                writer.write(data[pos:pos + n])
+                await writer.drain()
+                await asyncio.sleep(0.002)
+                pos += n
+        else:
+            writer.write(data)
+            await writer.drain()
+        self.bytes_sent += len(data)
+
+    async def _session(self, pump, reader, writer):
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.connections += 1
+        self._sessions.add(asyncio.current_task())
+        lock = asyncio.Lock()
+        drain = asyncio.ensure_future(self._drain_input(pump, reader, writer, lock))
+        start = time.monotonic()
+        next_rt = next_set = next_hb = start
+        next_stall = start + self.stall_every if self.stall_every else math.inf
+        pending = []
+        try:
+            while True:
+                now = time.monotonic()
+                if self.disconnect_every and now - start >= self.disconnect_every:
+                    self.disconnects += 1
+                    return
+                if now >= next_stall:
+                    await asyncio.sleep(self.stall_for)
+                    next_stall = time.monotonic() + self.stall_every
+                    continue
+                if now >= next_set:
+                    pending.append(pump.frame(regs.SETTINGS))
+                    next_set = now + self.settings_every
+                if self.heartbeat_every and now >= next_hb:
+                    pending.append(pump.frame(0x05))
+                    next_hb = now + self.heartbeat_every
+                if now >= next_rt:
+                    pending.append(pump.frame(regs.REALTIME))
+                    next_rt += 1.0 / self.realtime_hz
+                    if next_rt < now:
+                        next_rt = now + 1.0 / self.realtime_hz
+                # Coalescing: sometimes hold frames back and send them in one write
+                if pending and not (self.coalesce and self.rng.random() < self.coalesce and len(pending) < 4):
+                    self.frames_sent += len(pending)
+                    await self._send(writer, b"".join(pending), lock)
+                    pending = []
+                await asyncio.sleep(max(0.0, min(next_rt, next_set) - time.monotonic()))
+        except (ConnectionError, OSError, asyncio.CancelledError):
+            pass
+        finally:
+            self._sessions.discard(asyncio.current_task())
+            drain.cancel()
+            writer.close()
+
+    async def _drain_input(self, pump, reader, writer, lock):
+        # Client bytes: set-frames are applied (and acked), anything else is discarded
+        frames = FrameBuffer()
+        sids = {r.offset: r.sid for r in regs.by_packet(regs.SETTINGS)}
+        while True:
+            data = await reader.read(4096)
+            if not data:
+                return
+            if self.writes == "ignore":
+                continue
+            frames.feed(data)
+            for cmd, _params, raw in frames.frames(raw=True):
+                if cmd != WRITE_CMD:
+                    continue
+                try:
+                    items = [(off, v) for off, v in parse_set_frame(raw) if off in sids]
+                except ValueError:
+                    continue
+                for off, v in items:
+                    pump.settings[sids[off]] = v
+                self.writes_applied += len(items)
+                if items and self.writes == "ack":
+                    async with lock:
+                        writer.write(build_set_frame(items, cmd=ACK_CMD, header=raw[:LEN_OFFSET]))
+                        await writer.drain()
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        for pump in self.pumps:
+            server = await asyncio.start_server(
+                lambda r, w, pump=pump: self._session(pump, r, w),
+                self.host, self.base_port + pump.index if self.base_port else 0)
+            self._servers.append(server)
+            self.ports.append(server.sockets[0].getsockname()[1])
+        return self.ports
+
+    async def stop(self):
+        for server in self._servers:
+            server.close()
+        for task in list(self._sessions):
+            task.cancel()
+        await asyncio.gather(*self._sessions, return_exceptions=True)
+        for server in self._servers:
+            await server.wait_closed()
+
+    def start_in_thread(self):
+        """Run the simulator on a background loop; returns the listening ports."""
+        ready = threading.Event()
+
+        def run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(self.start())
+            ready.set()
+            loop.run_forever()
+
+        threading.Thread(target=run, name="hp_simulator", daemon=True).start()
+        ready.wait()
+        return self.ports
+
+    def stop_thread(self):
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+async def _report(sim, every):
+    last = 0
+    while True:
+        await asyncio.sleep(every)
+        rate = (sim.frames_sent - last) / every
+        last = sim.frames_sent
+        print(f"[sim] connections={sim.connections} disconnects={sim.disconnects} "
+              f"frames={sim.frames_sent} ({rate:.0f}/s) bytes={sim.bytes_sent} writes={sim.writes_applied}")
+
+
+async def _main(args):
+    traj = dict(kv.split("=", 1) for kv in args.set)
+    sim = Simulator(args.pumps, args.host, args.base_port, args.realtime_hz, args.settings_every,
+                    args.heartbeat_every, args.fragment, args.coalesce, args.stall_every, args.stall_for,
+                    args.disconnect_every, traj, args.seed, args.stamp, args.writes)
+    ports = await sim.start()
+    print(f"[sim] {len(ports)} pump(s) listening on {args.host}:{ports[0]}..{ports[-1]}")
+    await _report(sim, args.report_every)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--pumps", type=int, default=1)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--base-port", type=int, default=8899)
+    ap.add_argument("--realtime-hz", type=float, default=1.0, help="0x0143 frames per second")
+    ap.add_argument("--settings-every", type=float, default=10.0, help="seconds between 0x01B3 frames")
+    ap.add_argument("--heartbeat-every", type=float, default=30.0, help="seconds between 0x05 frames (0 = off)")
+    ap.add_argument("--fragment", type=float, default=0.0, help="probability a write is split into pieces")
+    ap.add_argument("--coalesce", type=float, default=0.0, help="probability frames are held and sent together")
+    ap.add_argument("--stall-every", type=float, default=0.0, help="seconds between stalls (0 = never)")
+    ap.add_argument("--stall-for", type=float, default=0.0)
+    ap.add_argument("--disconnect-every", type=float, default=0.0, help="drop each connection after N s")
+    ap.add_argument("--set", action="append", default=[], metavar="SID=SPEC", help="value trajectory")
+    ap.add_argument("--stamp", action="store_true", help="write send time into header bytes 2..9")
+    ap.add_argument("--writes", choices=("ack", "silent", "ignore"), default="ack",
+                    help="set-frames: apply and ack, apply without ack, or discard")
+    ap.add_argument("--seed", type=int)
+    ap.add_argument("--report-every", type=float, default=10.0)
+    args = ap.parse_args(argv)
+    try:
+        asyncio.run(_main(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
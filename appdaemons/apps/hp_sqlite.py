@@ -0,0 +1,211 @@
+# /config/apps/hp_sqlite.py
+"""Long-term SQLite history of decoded 0x0143 / 0x01B3 records.
+
+One table per packet (`realtime`, `settings`), one row per frame with a
+REAL column per register, indexed on (device, ts):
+
+    sink = SQLiteSink("/config/heatpump.db")
+    sink.put(device_id, regs.REALTIME, rec)     # never blocks; drops when the queue is full
+    sink.query(regs.REALTIME, device_id, start, end, ["outlet_temp", "inlet_temp"])
+
+put() only appends to a bounded queue; a writer thread ("hp_sqlite")
+batches rows with executemany() and commits every commit_interval s in
+WAL mode (synchronous=NORMAL), so readers (query(), sqlite3 shell,
+Grafana) never block the writer and the socket loop never waits on disk.
+
+    python hp_sqlite.py /config/heatpump.db realtime --since -3600 --columns outlet_temp,inlet_temp
+"""
+
+import argparse
+import csv
+import queue
+import sqlite3
+import sys
+import threading
+import time
+
+import hp_registers as regs
+
+TABLES = {regs.REALTIME: "realtime", regs.SETTINGS: "settings"}
+COLUMNS = {p: tuple(r.sid for r in regs.by_packet(p)) for p in TABLES}
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def ensure_schema(conn):
+    """Create tables/indexes; registers added to the map later become new columns."""
+    for packet, table in TABLES.items():
+        cols = ", ".join(f"{sid} REAL" for sid in COLUMNS[packet])
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (ts REAL NOT NULL, device TEXT NOT NULL, {cols})")
+        have = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for sid in COLUMNS[packet]:
+            if sid not in have:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {sid} REAL")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_device_ts ON {table} (device, ts)")
+    conn.commit()
+
+
+class SQLiteSink:
+    """Bounded queue + background writer thread for decoded records."""
+
+    def __init__(self, path, commit_interval=5.0, batch=1000, maxsize=20000, keep_days=None, log=None):
+        self.path = path
+        self.commit_interval = float(commit_interval)
+        self.batch = int(batch)
+        self.keep_days = float(keep_days) if keep_days else None
+        self._log = log or (lambda msg, level="INFO": None)
+        self._queue = queue.Queue(maxsize)
+        self._sql = {p: "INSERT INTO {} (ts, device, {}) VALUES (?, ?, {})".format(
+                         TABLES[p], ", ".join(COLUMNS[p]), ", ".join("?" * len(COLUMNS[p])))
+                     for p in TABLES}
+        self.written = 0
+        self.dropped = 0
+        self.commits = 0
+        self.last_commit_s = None
+        conn = _connect(path)        # fail early (bad path, read-only) on the caller's thread
+        ensure_schema(conn)
+        conn.close()
+        self._thread = threading.Thread(target=self._run, name="hp_sqlite", daemon=True)
+        self._thread.start()
+
+    @property
+    def depth(self):
+        return self._queue.qsize()
+
+    def put(self, device, packet, rec, ts=None):
+        """Queue one decoded record; False (and counted) if the writer is behind."""
+        try:
+            self._queue.put_nowait((packet, (time.time() if ts is None else ts, device) + tuple(rec)))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                self._log(f"SQLite queue full, {self.dropped} rows dropped so far", "WARNING")
+            return False
+
+    def close(self, timeout=10.0):
+        """Flush what is queued and stop the writer."""
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    #
+    # ---------------------- Writer thread ----------------------
+    #
+    def _run(self):
+        try:
+            conn = _connect(self.path)
+        except Exception as e:
+            self._log(f"SQLite open error: {e}", "ERROR")
+            return
+        pending = {p: [] for p in TABLES}
+        n = 0
+        next_commit = time.monotonic() + self.commit_interval
+        next_prune = time.monotonic()
+        stopping = False
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=max(0.0, next_commit - time.monotonic()))
+                if item is None:
+                    stopping = True
+                else:
+                    pending[item[0]].append(item[1])
+                    n += 1
+            except queue.Empty:
+                pass
+            now = time.monotonic()
+            if n < self.batch and now < next_commit and not stopping:
+                continue
+            next_commit = now + self.commit_interval
+            if n:
+                try:
+                    with conn:            # one transaction per flush
+                        for packet, rows in pending.items():
+                            if rows:
+                                conn.executemany(self._sql[packet], rows)
+                    self.written += n
+                    self.commits += 1
+                    self.last_commit_s = time.monotonic() - now
+                except Exception as e:
+                    self._log(f"SQLite write error ({n} rows lost): {e}", "ERROR")
+                for rows in pending.values():
+                    rows.clear()
+                n = 0
+            if self.keep_days and now >= next_prune:
+                next_prune = now + 3600
+                self._prune(conn)
+        conn.close()
+
+    def _prune(self, conn):
+        cutoff = time.time() - self.keep_days * 86400
+        try:
+            with conn:
+                for table in TABLES.values():
+                    conn.execute(f"DELETE FROM {table} WHERE ts < ?", (cutoff,))
+        except Exception as e:
+            self._log(f"SQLite prune error: {e}", "ERROR")
+
+    #
+    # ---------------------- Queries ----------------------
+    #
+    def query(self, packet, device=None, start=None, end=None, columns=None, limit=None):
+        return query(self.path, packet, device, start, end, columns, limit)
+
+
+def query(path, packet, device=None, start=None, end=None, columns=None, limit=None):
+    """[(ts, device, col...), ...] ordered by time, using the (device, ts) index."""
+    table = TABLES[packet]
+    columns = list(columns or COLUMNS[packet])
+    unknown = set(columns) - set(COLUMNS[packet])
+    if unknown:
+        raise ValueError(f"unknown column(s) for {table}: {', '.join(sorted(unknown))}")
+    where, args = [], []
+    if device is not None:
+        where.append("device = ?")
+        args.append(device)
+    if start is not None:
+        where.append("ts >= ?")
+        args.append(start)
+    if end is not None:
+        where.append("ts <= ?")
+        args.append(end)
+    sql = f"SELECT ts, device, {', '.join(columns)} FROM {table}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY ts"
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=30)
+    try:
+        return conn.execute(sql, args).fetchall()
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("db")
+    ap.add_argument("table", choices=sorted(TABLES.values()))
+    ap.add_argument("--device")
+    ap.add_argument("--since", type=float, help="epoch seconds, or seconds before now when negative")
+    ap.add_argument("--until", type=float, help="epoch seconds, or seconds before now when negative")
+    ap.add_argument("--columns", help="comma-separated register ids (default: all)")
+    ap.add_argument("--limit", type=int)
+    args = ap.parse_args(argv)
+
+    now = time.time()
+    when = lambda t: None if t is None else (now + t if t < 0 else t)
+    packet = {table: p for p, table in TABLES.items()}[args.table]
+    columns = args.columns.split(",") if args.columns else list(COLUMNS[packet])
+    rows = query(args.db, packet, args.device, when(args.since), when(args.until), columns, args.limit)
+    out = csv.writer(sys.stdout)
+    out.writerow(["ts", "device"] + columns)
+    out.writerows(rows)
+
+
+if __name__ == "__main__":
+    main()
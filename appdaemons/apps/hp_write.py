@@ -0,0 +1,181 @@
+# /config/apps/hp_write.py
+"""Local write path: parN set-frames sent on the adapter socket.
+
+ASSUMED PROTOCOL. The vendor write frame has not been captured yet; the
+layout below mirrors the read frames and is what hp_simulator accepts.
+Check it against a capture of the vendor app before enabling
+`local_writes` on a real pump. Everything protocol-specific is in the
+constants and PARAMS table of this file.
+
+    0 .. 9    header (copied from the last frame received, else zeros)
+    10 .. 11  length, big-endian: bytes after the 12-byte header
+    12        WRITE_CMD
+    13        item count N
+    14 ..     N x <H 01B3 offset> <f value>  (little-endian, like the 01B3 fields)
+    last      checksum: sum of bytes 10 .. end-1, modulo 256
+
+The adapter is expected to answer with the same layout under ACK_CMD,
+echoing the items it applied. Without an ack within the timeout the
+command falls back to the cloud.
+"""
+
+import struct
+import time
+from collections import namedtuple
+
+import hp_registers as regs
+from hp_framing import HEADER_LEN, LEN_OFFSET
+
+WRITE_CMD = 0x03
+ACK_CMD = 0x83
+
+_LEN = struct.Struct(">H")
+_ITEM = struct.Struct("<Hf")
+
+ParamSpec = namedtuple("ParamSpec", "par sid offset lo hi values")
+
+
+def _spec(par, sid, lo=None, hi=None, values=None):
+    return ParamSpec(par, sid, regs.REGISTER[sid].offset, lo, hi, values)
+
+
+# parN (cloud field name) -> 01B3 register it sets
+PARAMS = {p.par: p for p in (
+    _spec("par1", "unit_on_off", 0, 1),
+    # Cloud mode values (0 cooling, 1 DHW, 2 heating) -> 01B3 working_mode (1 DHW, 2 heating, 3 cooling)
+    _spec("par2", "working_mode", values={"0": 3.0, "1": 1.0, "2": 2.0}),
+    _spec("par17", "low_noise_mode", 0, 1),
+    _spec("par42", "dhw_set_temp", 30, 70),
+    _spec("par62", "heating_set_temp", 20, 60),
+    _spec("par63", "heating_delta_t", 1, 10),
+    _spec("par95", "cooling_set_temp", 10, 30),
+    _spec("par96", "cooling_delta_t", 1, 10),
+    # Heating curve: par85/86 = point 1 ambient/water ... par91/92 = point 4 (point 5 not located)
+    *(_spec(f"par{83 + 2 * i}", f"heating_curve_ambient_temp_{i}", -20, 20) for i in range(1, 5)),
+    *(_spec(f"par{84 + 2 * i}", f"heating_curve_water_temp_{i}", 20, 70) for i in range(1, 5)),
+)}
+BY_OFFSET = {p.offset: p for p in PARAMS.values()}
+
+
+def encode(par, value):
+    """(01B3 offset, float) for a parN command value; ValueError if unknown or out of range."""
+    spec = PARAMS.get(par)
+    if spec is None:
+        raise ValueError(f"{par} has no local encoding")
+    value = str(value).strip()
+    if spec.values is not None:
+        if value not in spec.values:
+            raise ValueError(f"{par}: unsupported value {value!r}")
+        return spec.offset, spec.values[value]
+    v = float(value)
+    if (spec.lo is not None and v < spec.lo) or (spec.hi is not None and v > spec.hi):
+        raise ValueError(f"{par}: {v} outside {spec.lo}..{spec.hi}")
+    return spec.offset, v
+
+
+def checksum(data):
+    return sum(data) & 0xFF
+
+
+def build_set_frame(items, cmd=WRITE_CMD, header=b"\x00" * LEN_OFFSET):
+    """Frame carrying [(offset, value), ...]."""
+    body = bytearray((cmd, len(items)))
+    for offset, value in items:
+        body += _ITEM.pack(offset, value)
+    frame = bytearray(header[:LEN_OFFSET]) + _LEN.pack(len(body) + 1) + body
+    frame.append(checksum(memoryview(frame)[LEN_OFFSET:]))
+    return bytes(frame)
+
+
+def parse_set_frame(frame):
+    """[(offset, value), ...] from a whole WRITE/ACK frame; ValueError on a bad checksum or size."""
+    frame = memoryview(frame)
+    if len(frame) < HEADER_LEN + 3:      # command, item count, checksum
+        raise ValueError("set-frame too short")
+    if checksum(frame[LEN_OFFSET:-1]) != frame[-1]:
+        raise ValueError("set-frame checksum mismatch")
+    n = frame[HEADER_LEN + 1]
+    if len(frame) != HEADER_LEN + 2 + n * _ITEM.size + 1:
+        raise ValueError("set-frame size mismatch")
+    return [_ITEM.unpack_from(frame, HEADER_LEN + 2 + i * _ITEM.size) for i in range(n)]
+
+
+class LocalWriter:
+    """Sends set-frames through IOCore connections and tracks their acks.
+
+    submit() is thread-safe (MQTT thread); sending, acks and timeouts run
+    on the I/O core loop. on_result(par, value, ok, latency_s, detail, key)
+    is called once per command (except one superseded by a newer value for
+    the same setting before its ack); a False result means the caller
+    should fall back to the cloud.
+    """
+
+    def __init__(self, core, on_result, ack_timeout=2.0, log=None):
+        self.core = core
+        self.ack_timeout = ack_timeout
+        self._on_result = on_result
+        self._log = log or (lambda msg, level="INFO": None)
+        self._pending = {}       # (connection, offset) -> (par, value, t0, timer, key)
+        self.sent = 0
+        self.acked = 0
+        self.timeouts = 0
+
+    def submit(self, conn, par, value, key=None):
+        """Queue a local write; False if par/value cannot be encoded or the socket is down."""
+        if not conn.connected:
+            return False
+        try:
+            item = encode(par, value)
+        except ValueError as e:
+            self._log(f"Local write not possible: {e}", "DEBUG")
+            return False
+        self.core.call_soon(self._send, conn, par, value, item, key)
+        return True
+
+    def _send(self, conn, par, value, item, key):
+        proto = conn.protocol
+        if proto is None or proto.transport is None or proto.transport.is_closing():
+            self._finish(par, value, False, 0.0, "adapter not connected", key)
+            return
+        header = proto.last_header or b"\x00" * LEN_OFFSET
+        t0 = time.monotonic()
+        proto.transport.write(build_set_frame([item], header=header))
+        self.sent += 1
+        if not self.ack_timeout:
+            self._finish(par, value, True, 0.0, "sent (no ack expected)", key)
+            return
+        slot = (conn, item[0])
+        old = self._pending.pop(slot, None)
+        if old is not None:
+            old[3].cancel()      # superseded by a newer value for the same setting
+        timer = self.core.loop.call_later(self.ack_timeout, self._timeout, slot)
+        self._pending[slot] = (par, value, t0, timer, key)
+
+    def ack(self, conn, frame):
+        """Handle an ACK_CMD frame received on conn (loop thread)."""
+        try:
+            items = parse_set_frame(frame)
+        except ValueError as e:
+            self._log(f"Bad local write ack: {e}", "WARNING")
+            return
+        for offset, _value in items:
+            pending = self._pending.pop((conn, offset), None)
+            if pending is None:
+                continue
+            par, value, t0, timer, key = pending
+            timer.cancel()
+            self.acked += 1
+            self._finish(par, value, True, time.monotonic() - t0, "local ack", key)
+
+    def _timeout(self, slot):
+        pending = self._pending.pop(slot, None)
+        if pending is not None:
+            par, value, t0, _timer, key = pending
+            self.timeouts += 1
+            self._finish(par, value, False, time.monotonic() - t0, "no ack from adapter", key)
+
+    def _finish(self, par, value, ok, latency, detail, key):
+        try:
+            self._on_result(par, value, ok, latency, detail, key)
+        except Exception as e:
+            self._log(f"local write result handler error: {e}", "ERROR")
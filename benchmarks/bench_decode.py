@@ -0,0 +1,60 @@
+"""Micro-benchmark: per-field struct.unpack vs. compiled DecodePlan.
+
+    python benchmarks/bench_decode.py [--seconds 2]
+"""
+import argparse
+import os
+import random
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "appdaemons", "apps"))
+import hp_registers as regs
+
+
+def per_field(off):
+    """The original path: dict lookup + slice + unpack per field."""
+    def decode(b):
+        out = {}
+        for name in off:
+            o = off[name]
+            if o + 4 <= len(b):
+                out[name] = struct.unpack("<f", b[o:o + 4])[0]
+        return out
+    return decode
+
+
+def compiled(packet):
+    return lambda b: regs.decode(packet, b)
+
+
+def rate(fn, payload, seconds):
+    n, batch = 0, 1000
+    t0 = time.perf_counter()
+    while True:
+        for _ in range(batch):
+            fn(payload)
+        n += batch
+        dt = time.perf_counter() - t0
+        if dt >= seconds:
+            return n / dt
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--seconds", type=float, default=2.0)
+    args = ap.parse_args()
+
+    rnd = random.Random(1)
+    for packet, size in ((regs.REALTIME, 322), (regs.SETTINGS, 434)):
+        label = regs.PACKET_NAMES[packet]
+        off = {r.sid: r.offset for r in regs.by_packet(packet)}
+        payload = memoryview(bytes(rnd.randrange(256) for _ in range(size)))
+        old = rate(per_field(off), payload, args.seconds)
+        new = rate(compiled(packet), payload, args.seconds)
+        print(f"{label}: per-field {old:,.0f} pkt/s  compiled {new:,.0f} pkt/s  ({new / old:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""Benchmark suite: decode, publish, discovery build and frame-to-publish latency.
+
+    python benchmarks/suite.py --out bench.json
+    python benchmarks/suite.py --compare bench.json --tolerance 0.2
+
+Results are JSON; --compare exits non-zero when a throughput drops (or a
+latency rises) by more than the tolerance against a previous run.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import struct
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "appdaemons", "apps"))
+sys.path.insert(0, os.path.join(HERE, ".."))
+
+import hp_registers as regs
+from hp_framing import FrameBuffer
+from hp_publish import ChangeFilter, StatePublisher
+from hp_replay import NullSink
+from hp_simulator import SimPump, Simulator, DEFAULT_TRAJECTORIES
+
+
+def rate(fn, seconds):
+    """Calls per second of fn() over roughly `seconds`."""
+    n, batch = 0, 200
+    t0 = time.perf_counter()
+    while True:
+        for _ in range(batch):
+            fn()
+        n += batch
+        dt = time.perf_counter() - t0
+        if dt >= seconds:
+            return round(n / dt, 1)
+
+
+def sample_payloads():
+    pump = SimPump(0, DEFAULT_TRAJECTORIES, random.Random(1))
+    return {cmd: memoryview(pump.frame(cmd)[13:]) for cmd in (regs.REALTIME, regs.SETTINGS)}
+
+
+#
+# ---------------------- Decode ----------------------
+#
+def bench_decode(seconds):
+    out = {}
+    payloads = sample_payloads()
+    for cmd, p in payloads.items():
+        name = regs.PACKET_NAMES[cmd]
+        fields = [(r.offset, r.type) for r in regs.by_packet(cmd)]
+
+        def per_field(p=p, fields=fields):
+            # The original _f32 / decode_float path: slice + unpack per field
+            for off, typ in fields:
+                if typ == "f32" and off + 4 <= len(p):
+                    struct.unpack("<f", p[off:off + 4])
+                elif off < len(p):
+                    p[off]
+
+        out[f"per_field_{name}_pkt_s"] = rate(per_field, seconds)
+        out[f"compiled_{name}_pkt_s"] = rate(lambda p=p, cmd=cmd: regs.decode(cmd, p), seconds)
+        out[f"states_{name}_pkt_s"] = rate(
+            lambda p=p, cmd=cmd: list(regs.states(cmd, regs.decode(cmd, p))), seconds)
+
+    try:
+        import HeatPump
+    except ImportError as e:
+        out["analyze_skipped"] = f"HeatPump.py not importable: {e}"
+    else:
+        HeatPump.mqtt_client = NullSink()
+        HeatPump.log = lambda message: None
+        HeatPump.STATE_PUBLISHER.changes = ChangeFilter(heartbeat=0)
+        out["analyze_0143_pkt_s"] = rate(lambda: HeatPump.analyze_0143_packet(payloads[regs.REALTIME]), seconds)
+        out["analyze_01B3_pkt_s"] = rate(lambda: HeatPump.analyze_01b3_packet(payloads[regs.SETTINGS]), seconds)
+    return out
+
+
+#
+# ---------------------- Publish ----------------------
+#
+def _client(broker):
+    if not broker:
+        return NullSink()
+    import paho.mqtt.client as mqtt
+    c = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id="heatpump_bench")
+    c.connect(broker, 1883, 60)
+    c.loop_start()
+    return c
+
+
+def bench_publish(seconds, broker=None):
+    out = {}
+    client = _client(broker)
+    payloads = sample_payloads()
+    rec = regs.decode(regs.SETTINGS, payloads[regs.SETTINGS])
+    for label, mode, heartbeat in (("fields_unfiltered", "fields", 0), ("fields_filtered", "fields", 300),
+                                   ("json_unfiltered", "json", 0)):
+        pub = StatePublisher(lambda t, p: client.publish(t, p), "bench/sensor/hp",
+                             ChangeFilter(regs.deadbands(), heartbeat=heartbeat), mode)
+        out[f"{label}_01B3_pkt_s"] = rate(lambda: pub.packet(regs.SETTINGS, rec), seconds)
+    raw = rate(lambda: client.publish("bench/sensor/hp/x/state", "21.5"), seconds)
+    out["client_publish_msg_s"] = raw
+    out["client"] = "paho" if broker else "null"
+    return out
+
+
+#
+# ---------------------- Discovery build ----------------------
+#
+def bench_discovery_build(repeat=50):
+    # Times building and serialising the register-map sensor configs only; the broker
+    # read-back and retained publishing done by DiscoverySync are not measured here.
+    client = NullSink()
+    device = {"identifiers": ["hp"], "name": "Heat Pump", "manufacturer": "x", "model": "y", "sw_version": "1.0"}
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for topic, payload in regs.discovery_configs("hp", device, "hp/availability"):
+            client.publish(topic, json.dumps(payload), retain=True)
+    dt = (time.perf_counter() - t0) / repeat
+    return {"configs": client.count // repeat, "discovery_build_ms": round(dt * 1000, 3)}
+
+
+#
+# ---------------------- End-to-end latency ----------------------
+#
+def _percentile(sorted_vals, q):
+    if not sorted_vals:
+        return None
+    return round(sorted_vals[min(len(sorted_vals) - 1, int(q * len(sorted_vals)))], 3)
+
+
+def bench_latency(seconds, hz=50.0, fragment=0.3):
+    """Simulator (send time stamped in the header) -> socket -> decode -> publish."""
+    sim = Simulator(pumps=1, base_port=0, realtime_hz=hz, settings_every=1.0, heartbeat_every=0,
+                    fragment=fragment, stamp=True, seed=1)
+    port = sim.start_in_thread()[0]
+    lat = []
+    stamp = struct.Struct("<Q")
+    sink = NullSink()
+    pub = StatePublisher(lambda t, p: sink.publish(t, p), "bench/sensor/hp", ChangeFilter(heartbeat=0))
+    s = socket.create_connection(("127.0.0.1", port))
+    s.settimeout(5)
+    buf = FrameBuffer()
+    end = time.monotonic() + seconds
+    try:
+        while time.monotonic() < end:
+            if not buf.fill(s):
+                break
+            for cmd, params, raw in buf.frames(raw=True):
+                if cmd in (regs.REALTIME, regs.SETTINGS):
+                    pub.packet(cmd, regs.decode(cmd, params))
+                    lat.append((time.monotonic_ns() - stamp.unpack_from(raw, 2)[0]) / 1e6)
+    finally:
+        s.close()
+        sim.stop_thread()
+    lat.sort()
+    return {
+        "frames": len(lat),
+        "p50_ms": _percentile(lat, 0.50),
+        "p90_ms": _percentile(lat, 0.90),
+        "p99_ms": _percentile(lat, 0.99),
+        "max_ms": round(lat[-1], 3) if lat else None,
+        "fragment": fragment,
+    }
+
+
+#
+# ---------------------- Runner ----------------------
+#
+def _git_rev():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=HERE,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def compare(current, baseline, tolerance):
+    """Return a list of regressions between two result documents."""
+    bad = []
+    for group, values in current["results"].items():
+        base = baseline.get("results", {}).get(group, {})
+        for key, v in values.items():
+            b = base.get(key)
+            if not isinstance(v, (int, float)) or not isinstance(b, (int, float)) or not b:
+                continue
+            if key.endswith("_s") and v < b * (1 - tolerance):       # throughput
+                bad.append(f"{group}.{key}: {b} -> {v}")
+            elif key.endswith("_ms") and v > b * (1 + tolerance):    # latency / time
+                bad.append(f"{group}.{key}: {b} -> {v}")
+    return bad
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--seconds", type=float, default=1.0, help="duration of each throughput case")
+    ap.add_argument("--only", choices=("decode", "publish", "discovery_build", "latency"), action="append")
+    ap.add_argument("--fragment", type=float, default=0.3,
+                    help="share of frames the simulator splits into several TCP writes (latency case)")
+    ap.add_argument("--broker", help="publish to this MQTT broker instead of a fake client")
+    ap.add_argument("--out", help="write results JSON here (default: stdout)")
+    ap.add_argument("--compare", help="previous results JSON to check for regressions")
+    ap.add_argument("--tolerance", type=float, default=0.2)
+    args = ap.parse_args(argv)
+
+    cases = {
+        "decode": lambda: bench_decode(args.seconds),
+        "publish": lambda: bench_publish(args.seconds, args.broker),
+        "discovery_build": lambda: bench_discovery_build(),
+        "latency": lambda: bench_latency(max(2.0, args.seconds * 3), fragment=args.fragment),
+    }
+    results = {name: fn() for name, fn in cases.items() if not args.only or name in args.only}
+    doc = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git": _git_rev(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    text = json.dumps(doc, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            bad = compare(doc, json.load(f), args.tolerance)
+        for line in bad:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if bad else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
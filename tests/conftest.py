@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Shared modules live next to the AppDaemon app, as in HeatPump.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "appdaemons", "apps"))
@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+from hp_capture import CaptureReader, CaptureWriter, list_segments, read_range
+from hp_framing import build_frame
+
+NS = 1_000_000_000
+
+
+def _frame(i):
+    return build_frame(0x01, i.to_bytes(4, "little") * 8)
+
+
+def _write(directory, n, **kw):
+    w = CaptureWriter(str(directory), **kw)
+    for i in range(n):
+        w.write(0x01, _frame(i), now_ns=i * NS)
+    w.close()
+    return w
+
+
+def test_round_trip_and_rotation(tmp_path):
+    w = _write(tmp_path, 100, segment_seconds=30, index_every=8)
+    segments = list_segments(str(tmp_path))
+    assert w.records == 100 and len(segments) == w.segments == 4
+    assert all(os.path.exists(p[:-len(".hpcap")] + ".idx") for p in segments)
+    got = [frame for path in segments for _, _, frame in CaptureReader(path).records()]
+    assert got == [_frame(i) for i in range(100)]
+
+
+def test_time_range_uses_the_index(tmp_path):
+    _write(tmp_path, 200, segment_seconds=10**7, index_every=16)
+    path, = list_segments(str(tmp_path))
+    reader = CaptureReader(path)
+    # Mono 100..109 s as wall-clock times; the index jumps close to the start
+    start, end = reader.wall_time(100 * NS), reader.wall_time(109 * NS)
+    assert reader._seek_offset(100 * NS) > reader._seek_offset(0)
+    got = [ts // NS for ts, _, _ in reader.records(start, end)]
+    assert got == list(range(100, 110))
+    with open(path, "rb") as f:
+        data = f.read()
+    assert [ts // NS for ts, *_ in reader.scan(data, start, end)] == got
+
+
+def test_read_range_across_segments(tmp_path):
+    _write(tmp_path, 60, segment_seconds=20)
+    frames = [frame for _, _, frame in read_range(str(tmp_path))]
+    assert frames == [_frame(i) for i in range(60)]
+
+
+def test_truncated_tail_is_ignored(tmp_path):
+    _write(tmp_path, 5, segment_seconds=10**7)
+    path, = list_segments(str(tmp_path))
+    with open(path, "ab") as f:
+        f.write(b"\x01\x02\x03")                 # record still being written
+    assert len(list(CaptureReader(path).records())) == 5
+
+
+def test_keep_segments_prunes_the_oldest(tmp_path):
+    _write(tmp_path, 100, segment_seconds=10, keep_segments=3)
+    assert len(list_segments(str(tmp_path))) == 3
+    assert len([f for f in os.listdir(tmp_path) if f.endswith(".idx")]) == 3
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "x.hpcap"
+    path.write_bytes(b"\0" * 64)
+    with pytest.raises(ValueError):
+        CaptureReader(str(path))
@@ -0,0 +1,72 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("requests")
+from hp_commands import CloudCommands
+
+
+def _commands(debounce, max_delay=None):
+    posts = []
+    done = threading.Event()
+
+    def on_result(par, value, ok, latency, detail, queued, target):
+        done.set()
+
+    cmds = CloudCommands("http://127.0.0.1:9/", "mn", "dev", {}, on_result,
+                         log=lambda msg, level: None, debounce=debounce, max_delay=max_delay)
+    cmds._post = lambda target, fields: (posts.append(dict(fields)), (True, "ok"))[1]
+    return cmds, posts, done
+
+
+def test_sweep_longer_than_window_sends_one_post():
+    cmds, posts, done = _commands(debounce=0.2, max_delay=5.0)
+    try:
+        # 0.6 s slider drag, one value every 50 ms: three debounce windows long
+        for v in range(12):
+            cmds.submit("par1", v)
+            time.sleep(0.05)
+        assert done.wait(2.0)
+        time.sleep(0.3)
+        assert [p["par1"] for p in posts] == [11]
+        assert cmds.coalesced == 11
+    finally:
+        cmds.stop()
+
+
+def test_max_delay_caps_a_continuous_sweep():
+    cmds, posts, done = _commands(debounce=0.2, max_delay=0.3)
+    try:
+        t0 = time.monotonic()
+        for v in range(20):              # 1 s of changes, never quiet for 0.2 s
+            cmds.submit("par1", v)
+            time.sleep(0.05)
+        assert done.wait(2.0)
+        time.sleep(0.3)
+        assert 1 < len(posts) < 20
+        assert posts[-1]["par1"] == 19
+        assert time.monotonic() - t0 < 2.0
+    finally:
+        cmds.stop()
+
+
+def test_stop_waits_for_the_post_in_flight():
+    cmds, posts, done = _commands(debounce=0.0)
+    started = threading.Event()
+    events = []
+
+    def slow_post(target, fields):
+        started.set()
+        time.sleep(0.3)
+        events.append("posted")
+        return True, "ok"
+
+    close = cmds.session.close
+    cmds.session.close = lambda: (events.append("closed"), close())
+    cmds._post = slow_post
+    cmds.submit("par1", 1)
+    assert started.wait(2.0)
+    cmds.stop()
+    assert events == ["posted", "closed"]
+    assert done.is_set()
@@ -0,0 +1,43 @@
+from types import SimpleNamespace
+
+from hp_confirm import WriteTracker, payload_for
+
+NAN = float("nan")
+
+
+def test_payload_for_nan_is_unknown():
+    assert payload_for("par62", NAN) is None
+    assert payload_for("par62", 45.0) == "45"
+
+
+def test_nan_read_back_does_not_confirm_or_restore():
+    published = []
+    tracker = WriteTracker(lambda par, payload: published.append((par, payload)), timeout=10)
+    assert tracker.expect("par62", "45", now=0)
+    tracker.observe(SimpleNamespace(heating_set_temp=NAN), now=1)
+    assert tracker.pending == 1
+    tracker.tick(now=11)
+    assert tracker.rolled_back == 1
+    assert published == []
+
+    # A later valid read-back is still used for the rollback
+    tracker.observe(SimpleNamespace(heating_set_temp=40.0), now=12)
+    tracker.expect("par62", "45", now=12)
+    tracker.tick(now=22)
+    assert published == [("par62", "40")]
+
+
+def test_failed_superseded_command_keeps_the_newer_write():
+    published = []
+    tracker = WriteTracker(lambda par, payload: published.append((par, payload)), timeout=10)
+    tracker.observe(SimpleNamespace(heating_set_temp=40.0), now=0)
+    tracker.expect("par62", "45", now=0)
+    tracker.expect("par62", "50", now=1)     # newer value before the first command's result
+    tracker.failed("par62", "45")
+    assert tracker.pending == 1 and tracker.rolled_back == 0 and published == []
+    tracker.observe(SimpleNamespace(heating_set_temp=50.0), now=2)
+    assert tracker.confirmed == 1 and tracker.pending == 0
+
+    tracker.expect("par62", "55", now=3)
+    tracker.failed("par62", "55")
+    assert tracker.rolled_back == 1 and published == [("par62", "50")]
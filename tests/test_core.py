@@ -0,0 +1,73 @@
+import socket
+import threading
+import time
+
+import hp_registers as regs
+from hp_core import IOCore
+from hp_simulator import Simulator
+
+
+def _wait(cond, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not cond() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return cond()
+
+
+def test_frames_from_several_pumps():
+    sim = Simulator(pumps=2, base_port=0, realtime_hz=20, settings_every=0.2, heartbeat_every=0, seed=1)
+    ports = sim.start_in_thread()
+    seen = {port: [] for port in ports}
+    core = IOCore()
+    for port in ports:
+        core.connect("127.0.0.1", port, lambda cmd, params, raw, port=port: seen[port].append((cmd, len(params))))
+    core.start()
+    try:
+        assert _wait(lambda: all(len(v) >= 10 for v in seen.values()))
+        for frames in seen.values():
+            assert {(regs.REALTIME, 322), (regs.SETTINGS, 434)} <= set(frames)
+    finally:
+        t0 = time.monotonic()
+        core.stop()
+        assert time.monotonic() - t0 < 1.0          # no recv timeout to wait out
+        sim.stop_thread()
+
+
+def test_reconnects_after_the_adapter_drops():
+    sim = Simulator(pumps=1, base_port=0, realtime_hz=20, heartbeat_every=0, disconnect_every=0.3, seed=2)
+    port, = sim.start_in_thread()
+    states = []
+    core = IOCore()
+    conn = core.connect("127.0.0.1", port, lambda *a: None, on_state=lambda up, detail: states.append(up))
+    core.start()
+    try:
+        assert _wait(lambda: conn.connects >= 2)    # first retry after the 2 s backoff
+        assert states[:3] == [True, False, True]
+        assert conn.disconnects >= 1 and conn.connected
+    finally:
+        core.stop()
+        sim.stop_thread()
+
+
+def test_run_returns_when_a_one_shot_connection_fails():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]                   # nothing listens here once closed
+    core = IOCore()
+    conn = core.connect("127.0.0.1", port, lambda *a: None, reconnect=False)
+    done = threading.Event()
+    threading.Thread(target=lambda: (core.run(), done.set()), daemon=True).start()
+    assert done.wait(5.0)
+    assert conn.connects == 0 and not conn.connected
+
+
+def test_timers_run_on_the_loop():
+    ticks = []
+    core = IOCore()
+    core.every(0.05, lambda: ticks.append(threading.current_thread().name), delay=0)
+    core.start()
+    try:
+        assert _wait(lambda: len(ticks) >= 3)
+        assert set(ticks) == {"hp_io"}
+    finally:
+        core.stop()
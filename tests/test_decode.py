@@ -0,0 +1,64 @@
+import math
+import random
+import struct
+
+import hp_registers as regs
+from hp_decode import DecodePlan
+
+PAYLOAD_SIZES = {regs.REALTIME: 322, regs.SETTINGS: 434}
+
+
+def _f32(b, off):
+    # Per-field path the plans replaced
+    return struct.unpack("<f", b[off:off + 4])[0] if off + 4 <= len(b) else None
+
+
+def _u8(b, off):
+    return b[off] if off < len(b) else None
+
+
+def _same(a, b):
+    return a == b or (isinstance(a, float) and isinstance(b, float) and math.isnan(a) and math.isnan(b))
+
+
+def test_register_plans_match_per_field_unpack():
+    rng = random.Random(0)
+    for packet, size in PAYLOAD_SIZES.items():
+        for _ in range(50):
+            params = bytes(rng.randrange(256) for _ in range(size))
+            rec = regs.decode(packet, params)
+            for r in regs.by_packet(packet):
+                old = _f32(params, r.offset) if r.type == "f32" else _u8(params, r.offset)
+                assert _same(getattr(rec, r.sid), old), r.sid
+
+
+def test_short_packet_decodes_what_fits():
+    params = bytes(PAYLOAD_SIZES[regs.REALTIME])[:100]
+    rec = regs.decode(regs.REALTIME, params)
+    for r in regs.by_packet(regs.REALTIME):
+        expected = _f32(params, r.offset) if r.type == "f32" else _u8(params, r.offset)
+        assert getattr(rec, r.sid) == expected, r.sid
+
+
+def test_mixed_types_gaps_and_aliases():
+    plan = DecodePlan("Rec", [("a", 0, "f32"), ("b", 6, "u8"), ("c", 8, "i16"), ("d", 20, "u16"),
+                              ("a2", 0, "f32")])
+    buf = bytearray(22)
+    struct.pack_into("<f", buf, 0, 1.5)
+    buf[6] = 7
+    struct.pack_into("<h", buf, 8, -300)
+    struct.pack_into("<H", buf, 20, 65000)
+    assert tuple(plan.decode(bytes(buf))) == (1.5, 7, -300, 65000, 1.5)
+    assert plan.decode(bytes(buf[:10])) == (1.5, 7, -300, None, 1.5)
+
+
+def test_overlapping_fields_use_separate_structs():
+    plan = DecodePlan("Rec", [("word", 0, "u16"), ("lo", 0, "u8"), ("hi", 1, "u8")])
+    assert plan.decode(b"\x34\x12") == (0x1234, 0x34, 0x12)
+
+
+def test_mode_codes_have_no_state_class():
+    configs = dict(regs.discovery_configs("hp", {"name": "HP"}, "hp/availability"))
+    for sid in ("working_mode", "outdoor_unit_mode"):
+        assert "state_class" not in configs[f"homeassistant/sensor/hp/{sid}/config"]
+    assert configs["homeassistant/sensor/hp/outlet_temp/config"]["state_class"] == "measurement"
@@ -0,0 +1,25 @@
+import math
+from types import SimpleNamespace
+
+from hp_derived import DerivedPower
+
+NAN = float("nan")
+
+
+def _frame(outlet, inlet):
+    return SimpleNamespace(voltage=230.0, current=5.0, outlet_temp=outlet, inlet_temp=inlet,
+                           defrost_state=0.0, heating_state=1.0, dhw_state=0.0, cooling_state=0.0)
+
+
+def test_nan_temperature_does_not_poison_the_mean():
+    published = {}
+    derived = DerivedPower(published.__setitem__, flow_lpm=12.0, window=4, interval=0.0)
+    derived.update(_frame(35.0, 30.0), now=0)
+    derived.update(_frame(NAN, 30.0), now=1)
+    derived.update(_frame(35.0, NAN), now=2)
+    for t in range(3, 8):                    # more than a window of valid frames after the NaNs
+        derived.update(_frame(35.0, 30.0), now=t)
+    heat = 12.0 / 60.0 * 4186.0 * 5.0
+    assert not math.isnan(derived.heating.mean)
+    assert published["thermal_power_heating_w"] == round(heat)
+    assert published["cop_heating"] == round(heat / 1150.0, 2)
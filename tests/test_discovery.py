@@ -0,0 +1,81 @@
+import json
+from types import SimpleNamespace
+
+import hp_registers as regs
+from hp_discovery import DiscoverySync
+
+
+class FakeBroker:
+    """Enough of a paho client: retained store, per-filter callbacks, replay on subscribe."""
+
+    def __init__(self):
+        self.retained = {}
+        self.published = []
+        self.callbacks = {}
+
+    def message_callback_add(self, sub, callback):
+        self.callbacks[sub] = callback
+
+    def message_callback_remove(self, sub):
+        self.callbacks.pop(sub, None)
+
+    def subscribe(self, topics):
+        for topic, _qos in topics:
+            if topic in self.retained:
+                msg = SimpleNamespace(topic=topic, payload=self.retained[topic])
+                for sub, callback in list(self.callbacks.items()):
+                    if topic.startswith(sub[:-1]):
+                        callback(self, None, msg)
+
+    def unsubscribe(self, topics):
+        pass
+
+    def publish(self, topic, payload, retain=False):
+        self.published.append(topic)
+        if retain:
+            self.retained[topic] = payload.encode() if isinstance(payload, str) else payload
+
+
+def _configs(**kw):
+    device = {"identifiers": ["hp"], "name": "Heat Pump"}
+    return [(topic, json.dumps(payload)) for topic, payload in regs.discovery_configs("hp", device, "hp/a", **kw)]
+
+
+def test_restart_with_unchanged_configs_publishes_nothing():
+    broker = FakeBroker()
+    configs = _configs()
+    assert DiscoverySync(broker, configs, wait=0.2).sync() == len(configs)
+    broker.published.clear()
+    sync = DiscoverySync(broker, configs, wait=0.2)
+    assert sync.sync() == 0
+    assert broker.published == [] and sync.unchanged == len(configs)
+
+
+def test_only_changed_or_missing_configs_are_published():
+    broker = FakeBroker()
+    DiscoverySync(broker, _configs(), wait=0.2).sync()
+    broker.published.clear()
+    missing = next(iter(broker.retained))
+    del broker.retained[missing]
+    changed = _configs(json_state=True)          # every sensor payload gains a value_template
+    sync = DiscoverySync(broker, changed, wait=0.2)
+    assert sync.sync() == len(changed)
+    sync.set(changed)
+    broker.published.clear()
+    broker.retained.pop(missing, None)
+    assert sync.sync() == 1 and broker.published == [missing]
+
+
+def test_force_and_no_wait_publish_everything():
+    broker = FakeBroker()
+    configs = _configs()
+    DiscoverySync(broker, configs, wait=0.2).sync()
+    assert DiscoverySync(broker, configs, wait=0.2).sync(force=True) == len(configs)
+    assert DiscoverySync(broker, configs, wait=0).sync() == len(configs)
+
+
+def test_start_runs_in_the_background():
+    broker = FakeBroker()
+    sync = DiscoverySync(broker, _configs(), wait=0.2)
+    sync.start().join(2.0)
+    assert sync.published == len(broker.retained) > 0
@@ -0,0 +1,84 @@
+import random
+
+import pytest
+
+from hp_framing import FrameBuffer, build_frame
+
+
+def _frames(n, seed=0):
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        cmd = rng.choice((0x01, 0x02, 0x05))
+        size = {0x01: 322, 0x02: 434, 0x05: 8}[cmd]
+        out.append((cmd, bytes(rng.randrange(256) for _ in range(size))))
+    return out
+
+
+def _drain(buf):
+    return [(cmd, bytes(params)) for cmd, params in buf.frames()]
+
+
+def test_split_delivery_yields_each_frame_once():
+    frames = _frames(3)
+    stream = b"".join(build_frame(cmd, params) for cmd, params in frames)
+    buf = FrameBuffer()
+    got = []
+    for i in range(len(stream)):         # one byte per recv
+        buf.feed(stream[i:i + 1])
+        got += _drain(buf)
+    assert got == frames
+    assert len(buf) == 0 and buf.dropped == 0
+
+
+def test_coalesced_delivery():
+    frames = _frames(10, seed=1)
+    buf = FrameBuffer()
+    buf.feed(b"".join(build_frame(cmd, params) for cmd, params in frames))
+    assert _drain(buf) == frames
+
+
+def test_random_chunking_is_exactly_once():
+    rng = random.Random(2)
+    frames = _frames(200, seed=3)
+    stream = b"".join(build_frame(cmd, params) for cmd, params in frames)
+    buf = FrameBuffer()
+    got, pos = [], 0
+    while pos < len(stream):
+        n = rng.randint(1, 1500)
+        buf.feed(stream[pos:pos + n])
+        pos += n
+        got += _drain(buf)
+    assert got == frames
+
+
+def test_resync_skips_leading_garbage():
+    frames = _frames(2, seed=4)
+    buf = FrameBuffer()
+    # Lengths read from a misaligned window point past max_frame, so it slides to the frame start
+    header = b"\xaa" * 10
+    buf.feed(b"\x00" * 3 + b"\xff" * 4 + b"".join(build_frame(cmd, params, header) for cmd, params in frames))
+    assert _drain(buf) == frames
+    assert buf.dropped == 7
+
+
+def test_partial_frame_waits_for_the_rest():
+    frame = build_frame(0x01, bytes(322))
+    buf = FrameBuffer()
+    buf.feed(frame[:-1])
+    assert _drain(buf) == []
+    buf.feed(frame[-1:])
+    assert _drain(buf) == [(0x01, bytes(322))]
+
+
+def test_raw_frame_includes_header():
+    frame = build_frame(0x05, bytes(8), header=bytes(range(10)))
+    buf = FrameBuffer()
+    buf.feed(frame)
+    (cmd, params, raw), = buf.frames(raw=True)
+    assert cmd == 0x05 and bytes(raw) == frame and bytes(params) == bytes(8)
+
+
+def test_capacity_must_hold_a_frame():
+    with pytest.raises(ValueError):
+        FrameBuffer(capacity=100)
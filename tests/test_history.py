@@ -0,0 +1,69 @@
+import math
+
+import pytest
+
+from hp_history import SENSORS, SeriesRing, ring_bytes
+
+NAN = float("nan")
+
+
+def _ring(capacity, rows):
+    ring = SeriesRing(capacity, sids=("a", "b"))
+    for t in range(rows):
+        ring.append(1000.0 + t, (float(t), None if t % 2 else float(-t)))
+    return ring
+
+
+def test_memory_matches_the_readme_table():
+    assert ring_bytes(1) == 92 == 8 + 4 * len(SENSORS)
+    ring = SeriesRing(3600)
+    assert ring.nbytes == ring_bytes(3600)
+    assert round(ring_bytes(24 * 3600) / 1e6, 2) == 7.95
+
+
+def test_wraparound_keeps_the_newest_rows():
+    ring = _ring(10, 25)
+    assert ring.size == 10
+    ts, vs = ring.window("a")
+    assert list(ts) == [1000.0 + t for t in range(15, 25)]
+    assert list(vs) == [float(t) for t in range(15, 25)]
+    assert ring.info()["span_s"] == 9.0 and ring.info()["rows"] == 10
+
+
+def test_window_bounds_across_the_wrap_point():
+    ring = _ring(10, 25)             # physical slots 5..9 hold t=15..19, 0..4 hold t=20..24
+    ts, vs = ring.window("a", 1018.0, 1021.0)
+    assert list(vs) == [18.0, 19.0, 20.0, 21.0]
+    assert list(ring.window("a", 1030.0)[0]) == []
+    assert list(ring.window("a", None, 1015.0)[1]) == [15.0]
+
+
+def test_step_query_across_the_wrap_point():
+    ring = _ring(10, 25)
+    assert ring.query("a", step=4) == [[1012.0, 15.0], [1016.0, 17.5], [1020.0, 21.5], [1024.0, 24.0]]
+    # NaN (missing) samples are left out of the buckets
+    assert ring.query("b", 1016.0, 1023.0, step=4) == [[1016.0, -17.0], [1020.0, -21.0]]
+
+
+def test_thinning_and_aggregate():
+    ring = _ring(10, 25)
+    assert len(ring.query("a", limit=3)) == 3
+    agg = ring.aggregate("a", 1018.0, 1021.0)
+    assert agg == {"count": 4, "min": 18.0, "max": 21.0, "mean": 19.5, "last": 21.0,
+                   "first_ts": 1018.0, "last_ts": 1021.0}
+    assert ring.aggregate("a", 2000.0) == {"count": 0}
+
+
+def test_clock_stepping_back_keeps_timestamps_sorted():
+    ring = SeriesRing(5, sids=("a",))
+    ring.append(100.0, (1.0,))
+    ring.append(90.0, (2.0,))
+    assert list(ring.window("a")[0]) == [100.0, 100.0]
+
+
+def test_unknown_sensor_and_capacity():
+    with pytest.raises(KeyError):
+        _ring(4, 2).window("nope")
+    with pytest.raises(ValueError):
+        SeriesRing(0)
+    assert math.isnan(SeriesRing(2, sids=("a",)).cols[0][0])
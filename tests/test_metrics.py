@@ -0,0 +1,86 @@
+import json
+import re
+import urllib.error
+import urllib.request
+
+import pytest
+
+from hp_history import SeriesRing
+from hp_metrics import CONTENT_TYPE, Exposition, Histogram, MetricsServer, PumpMetrics, frame_metrics
+
+SAMPLE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{[a-zA-Z_][a-zA-Z0-9_]*="[^"]*"(,[a-zA-Z_][a-zA-Z0-9_]*="[^"]*")*\})? \S+$')
+
+
+def _render():
+    pm = PumpMetrics("hp_house")
+    pm.frame(0x01, now=10.0)
+    pm.frame(0x01, now=11.0)
+    pm.decode[0x01].observe(3e-5)
+    out = Exposition()
+    out.counter("mqtt_published_total", "MQTT messages handed to paho", 7)
+    frame_metrics(out, pm, now=12.0)
+    return out.text()
+
+
+def _history(query):
+    # Same shape as HeatpumpBridge._http_history
+    sensor = query.get("sensor")
+    if sensor not in RING.column:
+        raise ValueError(f"unknown sensor {sensor!r}")
+    step = float(query["step"]) if query.get("step") else None
+    return 200, "application/json", json.dumps({"sensor": sensor, "points": RING.query(sensor, step=step)})
+
+
+RING = SeriesRing(10, sids=("outlet_temp",))
+for t in range(4):
+    RING.append(1000.0 + t, (30.0 + t,))
+
+
+@pytest.fixture
+def server():
+    srv = MetricsServer(_render, host="127.0.0.1", port=0).route("/history", _history).start()
+    yield f"http://127.0.0.1:{srv.port}"
+    srv.stop()
+
+
+def _get(url):
+    with urllib.request.urlopen(url, timeout=5) as r:
+        return r.status, r.headers["Content-Type"], r.read().decode()
+
+
+def test_metrics_exposition(server):
+    status, ctype, body = _get(server + "/metrics")
+    assert status == 200 and ctype == CONTENT_TYPE
+    lines = body.rstrip("\n").split("\n")
+    families = [line.split()[2] for line in lines if line.startswith("# TYPE")]
+    assert len(families) == len(set(families))       # one HELP/TYPE block per family
+    for line in lines:
+        assert line.startswith("# ") or SAMPLE.match(line), line
+    assert 'heatpump_frames_total{device="hp_house",cmd="0x01"} 2' in lines
+    assert 'heatpump_last_frame_age_seconds{device="hp_house",cmd="0x01"} 1.0' in lines
+    assert 'heatpump_decode_seconds_bucket{device="hp_house",cmd="0x01",le="+Inf"} 1' in lines
+    assert _get(server + "/")[2] == body
+
+
+def test_history_route(server):
+    status, ctype, body = _get(server + "/history?sensor=outlet_temp&step=2")
+    assert (status, ctype) == (200, "application/json")
+    assert json.loads(body) == {"sensor": "outlet_temp", "points": [[1000.0, 30.5], [1002.0, 32.5]]}
+
+
+def test_unknown_path_and_bad_query(server):
+    with pytest.raises(urllib.error.HTTPError) as e:
+        _get(server + "/nope")
+    assert e.value.code == 404
+    with pytest.raises(urllib.error.HTTPError) as e:
+        _get(server + "/history?sensor=nope")
+    assert e.value.code == 400
+
+
+def test_histogram_quantiles():
+    h = Histogram((1, 2, 5))
+    for v in (0.5, 1.5, 1.5, 4, 10):
+        h.observe(v)
+    assert h.cumulative() == [(1, 1), (2, 3), (5, 4), (float("inf"), 5)]
+    assert h.quantile(0.5) == 2 and h.quantile(1.0) == float("inf")
+    assert Histogram().quantile(0.5) is None
@@ -0,0 +1,157 @@
+import json
+import struct
+
+import pytest
+
+import hp_registers as regs
+from hp_publish import AvailabilityWatchdog, ChangeFilter, StatePublisher, parse_deadband
+
+NAN = float("nan")
+
+
+def test_parse_deadband():
+    assert parse_deadband(0.5) == (0.5, 0.0)
+    assert parse_deadband("2%") == (0.0, 0.02)
+
+
+def test_absolute_deadband_and_heartbeat():
+    f = ChangeFilter({"t": 0.2}, heartbeat=60)
+    assert f.check("t", 20.0, now=0)
+    assert not f.check("t", 20.15, now=1)       # inside the band
+    assert not f.check("t", 19.85, now=2)       # measured from the last published value
+    assert f.check("t", 20.3, now=3)
+    assert not f.check("t", 20.3, now=62)
+    assert f.check("t", 20.3, now=63)           # unchanged, but silent for the heartbeat
+    assert (f.passed, f.suppressed) == (3, 3)
+
+
+def test_relative_deadband_and_exact_match():
+    f = ChangeFilter({"p": "5%"}, heartbeat=300)
+    assert f.check("p", 100.0, now=0)
+    assert not f.check("p", 104.0, now=1)
+    assert f.check("p", 106.0, now=2)
+    assert f.check("mode", 1, now=0)            # no band: any change passes
+    assert f.check("mode", 2, now=1)
+    assert not f.check("mode", 2, now=2)
+
+
+def test_nan_is_suppressed_until_it_changes():
+    f = ChangeFilter(heartbeat=300)
+    assert f.check("t", NAN, now=0)
+    assert not f.check("t", NAN, now=1)
+    assert f.check("t", 1.0, now=2)
+
+
+def test_reset_republishes_everything():
+    f = ChangeFilter(heartbeat=300)
+    f.check("t", 1.0, now=0)
+    f.reset()
+    assert f.check("t", 1.0, now=1)
+
+
+def _params(packet, **values):
+    buf = bytearray({regs.REALTIME: 322, regs.SETTINGS: 434}[packet])
+    for r in regs.by_packet(packet):
+        v = values.get(r.sid, 0.0)
+        if r.type == "f32":
+            struct.pack_into("<f", buf, r.offset, v)
+        else:
+            buf[r.offset] = int(v)
+    return bytes(buf)
+
+
+def test_fields_mode_publishes_changed_states_only():
+    sent = []
+    clock = [0.0]
+    pub = StatePublisher(lambda topic, payload: sent.append((topic, payload)), "hp",
+                         ChangeFilter(regs.deadbands(), heartbeat=300, clock=lambda: clock[0]))
+    rec = regs.decode(regs.REALTIME, _params(regs.REALTIME, outlet_temp=35.0))
+    pub.packet(regs.REALTIME, rec)
+    first = dict(sent)
+    assert first["hp/outlet_temp/state"] == "35.0"
+    assert len(first) == sum(1 + len(r.aliases) for r in regs.by_packet(regs.REALTIME))
+
+    sent.clear()
+    clock[0] = 1.0
+    pub.packet(regs.REALTIME, regs.decode(regs.REALTIME, _params(regs.REALTIME, outlet_temp=35.1)))
+    assert sent == []                           # within the temperature deadband
+    pub.packet(regs.REALTIME, regs.decode(regs.REALTIME, _params(regs.REALTIME, outlet_temp=36.0)))
+    assert sent == [("hp/outlet_temp/state", "36.0")]
+
+
+def test_skip_leaves_rolled_up_states_out():
+    sent = []
+    pub = StatePublisher(lambda topic, payload: sent.append(topic), "hp")
+    pub.skip = frozenset({"outlet_temp"})
+    pub.packet(regs.REALTIME, regs.decode(regs.REALTIME, _params(regs.REALTIME)))
+    assert "hp/outlet_temp/state" not in sent and "hp/inlet_temp/state" in sent
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        StatePublisher(print, "hp", mode="xml")
+
+
+def test_watchdog_publishes_transitions_only():
+    states = []
+    wd = AvailabilityWatchdog(states.append, timeout=120)
+    wd.tick(now=0)
+    assert states == [] and wd.state is None     # nothing known before the first frame
+    wd.frame(regs.REALTIME, now=1)
+    wd.frame(regs.REALTIME, now=2)
+    wd.frame(regs.SETTINGS, now=50)
+    wd.tick(now=160)
+    assert states == ["online"]                  # the 01B3 frame at 50 still counts
+    wd.tick(now=171)
+    assert states == ["online", "offline"]
+    wd.tick(now=500)
+    wd.frame(regs.REALTIME, now=501)
+    assert states == ["online", "offline", "online"] and wd.transitions == 3
+    assert wd.since(regs.REALTIME, now=511) == 10 and wd.since(0x05) is None
+
+
+def test_watchdog_force_and_republish():
+    states = []
+    wd = AvailabilityWatchdog(states.append, timeout=120)
+    wd.republish()
+    assert states == []
+    wd.frame(regs.REALTIME, now=0)
+    wd.force("offline")                          # socket lost
+    wd.force("offline")
+    wd.republish()                               # broker fired the LWT
+    assert states == ["online", "offline", "offline"]
+    assert wd.transitions == 2
+
+
+def test_json_mode_publishes_one_document_per_changed_packet():
+    sent = []
+    clock = [0.0]
+    pub = StatePublisher(lambda topic, payload: sent.append((topic, json.loads(payload))), "hp",
+                         ChangeFilter(regs.deadbands(), heartbeat=300, clock=lambda: clock[0]), mode="json")
+    pub.packet(regs.SETTINGS, regs.decode(regs.SETTINGS, _params(regs.SETTINGS, heating_set_temp=35.0)))
+    (topic, doc), = sent
+    assert topic == regs.json_state_topic("hp", regs.SETTINGS) == "hp/settings/state"
+    assert doc["heating_set_temp"] == 35.0
+    assert set(doc) == {sid for r in regs.by_packet(regs.SETTINGS) for sid in (r.sid,) + tuple(r.aliases)}
+
+    clock[0] = 1.0
+    pub.packet(regs.SETTINGS, regs.decode(regs.SETTINGS, _params(regs.SETTINGS, heating_set_temp=35.0)))
+    assert len(sent) == 1                        # nothing changed
+    pub.packet(regs.SETTINGS, regs.decode(regs.SETTINGS, _params(regs.SETTINGS, heating_set_temp=40.0)))
+    assert len(sent) == 2 and sent[-1][1]["heating_set_temp"] == 40.0
+    assert sent[-1][1]["dhw_set_temp"] == 0.0    # the whole packet, not just the change
+
+
+def test_json_mode_writes_nan_as_null():
+    sent = []
+    pub = StatePublisher(lambda topic, payload: sent.append(payload), "hp", mode="json")
+    pub.packet(regs.REALTIME, regs.decode(regs.REALTIME, _params(regs.REALTIME, outlet_temp=NAN)))
+    doc = json.loads(sent[0])                    # strict JSON: no NaN literal
+    assert "NaN" not in sent[0] and doc["outlet_temp"] is None
+
+
+def test_json_discovery_uses_value_templates():
+    configs = dict(regs.discovery_configs("hp", {"name": "HP"}, "hp/availability", json_state=True))
+    outlet = configs["homeassistant/sensor/hp/outlet_temp/config"]
+    assert outlet["state_topic"] == "homeassistant/sensor/hp/realtime/state"
+    assert outlet["value_template"] == "{{ value_json.outlet_temp }}"
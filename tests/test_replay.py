@@ -0,0 +1,65 @@
+import struct
+
+import pytest
+
+import hp_registers as regs
+from hp_capture import CaptureWriter
+from hp_framing import build_frame
+from hp_replay import CollectorSink, Replay, open_source
+
+BASE = "homeassistant/sensor/heatpump_001"
+NS = 1_000_000_000
+
+
+def _frame(packet, **values):
+    buf = bytearray({regs.REALTIME: 322, regs.SETTINGS: 434}[packet])
+    for sid, v in values.items():
+        struct.pack_into("<f", buf, regs.REGISTER[sid].offset, v)
+    return build_frame(packet, buf)
+
+
+@pytest.fixture
+def capture(tmp_path):
+    w = CaptureWriter(str(tmp_path), segment_seconds=10**7)
+    for i in range(5):
+        w.write(regs.REALTIME, _frame(regs.REALTIME, outlet_temp=30.0 + i, inlet_temp=25.0), now_ns=i * NS)
+    w.write(regs.SETTINGS, _frame(regs.SETTINGS, heating_set_temp=45.0), now_ns=5 * NS)
+    w.write(0x05, build_frame(0x05, bytes(8)), now_ns=6 * NS)
+    w.close()
+    return str(tmp_path)
+
+
+def test_replay_decodes_a_capture(capture):
+    sink = CollectorSink()
+    stats = Replay(sink, use_filter=False).run(open_source(capture), speed=0)
+    assert stats["frames_by_cmd"] == {"0x01": 5, "0x02": 1, "0x05": 1}
+    assert stats["resync_bytes"] == 0 and stats["span_s"] == 6.0
+    outlet = [p for t, p, _ in sink.messages if t == f"{BASE}/outlet_temp/state"]
+    assert outlet == ["30.0", "31.0", "32.0", "33.0", "34.0"]
+    last = sink.last()
+    assert last[f"{BASE}/inlet_temp/state"] == "25.0"
+    assert last[f"{BASE}/heating_set_temp/state"] == "45.0"
+
+
+def test_replay_filter_uses_capture_time(capture):
+    sink = CollectorSink()
+    Replay(sink).run(open_source(capture), speed=0)
+    # The unchanged inlet temperature goes out once; the moving outlet every frame
+    topics = [t for t, _, _ in sink.messages]
+    assert topics.count(f"{BASE}/inlet_temp/state") == 1
+    assert topics.count(f"{BASE}/outlet_temp/state") == 5
+
+
+def test_json_mode(capture):
+    sink = CollectorSink()
+    Replay(sink, state_mode="json", use_filter=False).run(open_source(capture), speed=0)
+    assert sink.count == 6
+    assert f"{BASE}/settings/state" in sink.last()
+
+
+def test_script_target_matches_bridge(capture):
+    pytest.importorskip("paho.mqtt.client")
+    bridge, script = CollectorSink(), CollectorSink()
+    Replay(bridge, use_filter=False).run(open_source(capture), speed=0)
+    Replay(script, target="script", use_filter=False).run(open_source(capture), speed=0)
+    assert script.last()[f"{BASE}/outlet_temp/state"] == bridge.last()[f"{BASE}/outlet_temp/state"]
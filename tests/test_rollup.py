@@ -0,0 +1,44 @@
+import json
+
+import hp_registers as regs
+from hp_rollup import Rollup
+
+FIELDS = regs.by_packet(regs.REALTIME)
+SID = "outlet_temp"
+
+
+def _rec(value):
+    return tuple(value if r.sid == SID else None for r in FIELDS)
+
+
+def _rollup(windows=(60,)):
+    docs, values = [], []
+    rollup = Rollup([SID], windows, lambda w, doc: docs.append((w, json.loads(doc)[SID])),
+                    lambda sid, v: values.append(v))
+    return rollup, docs, values
+
+
+def test_windows_close_on_the_grid():
+    rollup, docs, values = _rollup((10, 30))
+    for t in range(0, 31):
+        rollup.add(_rec(float(t)), now=t)
+    assert [(w, d["n"]) for w, d in docs] == [(10, 10), (10, 10), (10, 10), (30, 30)]
+    assert values == [4.5, 14.5, 24.5]
+    # The sample at t=30 opened the next windows
+    assert rollup.windows[0].count[0] == 1
+    assert rollup.windows[0].closes == 40
+
+
+def test_gap_does_not_mix_old_and_new_samples():
+    rollup, docs, values = _rollup()
+    for t, v in ((0, 1.0), (30, 3.0), (500, 50.0), (501, 52.0)):
+        rollup.add(_rec(v), now=t)
+    assert [d["n"] for _, d in docs] == [2]
+    assert docs[0][1]["mean"] == 2.0 and docs[0][1]["max"] == 3.0
+    assert values == [2.0]
+    # Realigned to the next boundary past 500, holding only post-gap samples
+    w = rollup.windows[0]
+    assert w.closes == 540
+    assert w.count[0] == 2 and w.sum[0] == 102.0
+    rollup.roll(now=540)
+    assert docs[-1][1]["n"] == 2 and values[-1] == 51.0
@@ -0,0 +1,93 @@
+import threading
+import time
+
+import pytest
+
+from hp_core import IOCore
+from hp_framing import build_frame
+from hp_simulator import Simulator
+from hp_write import ACK_CMD, WRITE_CMD, LocalWriter, build_set_frame, encode, parse_set_frame
+
+
+def test_parse_rejects_short_and_corrupt_frames():
+    frame = build_set_frame([encode("par62", "45")])
+    assert parse_set_frame(frame) == [encode("par62", "45")]
+    with pytest.raises(ValueError):
+        parse_set_frame(frame[:-1] + bytes(((frame[-1] + 1) & 0xFF,)))
+    for short in (b"", frame[:12], build_frame(WRITE_CMD, b"")):
+        with pytest.raises(ValueError):
+            parse_set_frame(short)
+
+
+class _Rig:
+    """LocalWriter on an IOCore connection to one simulated pump; failed writes go to `cloud`."""
+
+    def __init__(self, writes="ack", ack_timeout=1.0):
+        self.sim = Simulator(pumps=1, base_port=0, realtime_hz=20, settings_every=0.1,
+                             heartbeat_every=0, seed=1, writes=writes)
+        port = self.sim.start_in_thread()[0]
+        self.results, self.cloud = [], []
+        self.done = threading.Event()
+        self.core = IOCore()
+        self.writer = LocalWriter(self.core, self._on_result, ack_timeout=ack_timeout)
+        self.conn = self.core.connect("127.0.0.1", port, self._on_frame)
+        self.core.start()
+        deadline = time.monotonic() + 5
+        while not (self.conn.connected and self.conn.protocol.last_header) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert self.conn.connected
+
+    def _on_frame(self, cmd, params, raw):
+        if cmd == ACK_CMD:
+            self.writer.ack(self.conn, raw)
+
+    def _on_result(self, par, value, ok, latency, detail, key):
+        self.results.append((par, value, ok, detail))
+        if not ok:
+            self.cloud.append((par, value))      # the bridge falls back to CloudCommands here
+        self.done.set()
+
+    def close(self):
+        self.core.stop()
+        self.sim.stop_thread()
+
+
+@pytest.fixture
+def rig(request):
+    rig = _Rig(**getattr(request, "param", {}))
+    yield rig
+    rig.close()
+
+
+def test_write_is_applied_and_acked(rig):
+    assert rig.writer.submit(rig.conn, "par62", "45")
+    assert rig.done.wait(2.0)
+    assert rig.results == [("par62", "45", True, "local ack")]
+    assert rig.cloud == [] and rig.writer.acked == 1
+    assert rig.sim.pumps[0].settings["heating_set_temp"] == 45.0
+
+
+def test_bad_frames_do_not_stop_the_simulator(rig):
+    good = build_set_frame([encode("par42", "55")])
+    transport = rig.conn.protocol.transport
+    rig.core.call_soon(transport.write, good[:-1] + bytes(((good[-1] + 1) & 0xFF,)))   # checksum mismatch
+    rig.core.call_soon(transport.write, build_frame(WRITE_CMD, b""))                  # truncated
+    assert rig.writer.submit(rig.conn, "par42", "55")
+    assert rig.done.wait(2.0)
+    assert rig.results == [("par42", "55", True, "local ack")]
+    assert rig.sim.writes_applied == 1
+
+
+def test_bad_ack_checksum_is_ignored(rig):
+    ack = build_set_frame([encode("par62", "40")], cmd=ACK_CMD)
+    rig.writer.ack(rig.conn, ack[:-1] + bytes(((ack[-1] + 1) & 0xFF,)))
+    assert rig.writer.acked == 0 and rig.results == []
+
+
+@pytest.mark.parametrize("rig", [{"writes": "silent", "ack_timeout": 0.3}], indirect=True)
+def test_missing_ack_falls_back_to_cloud(rig):
+    assert rig.writer.submit(rig.conn, "par62", "42")
+    assert rig.done.wait(2.0)
+    assert rig.results == [("par62", "42", False, "no ack from adapter")]
+    assert rig.cloud == [("par62", "42")]
+    assert rig.writer.timeouts == 1